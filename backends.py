@@ -0,0 +1,154 @@
+"""Model loading backends for CPU inference.
+
+Every mentor model is loaded through :func:`build_pipeline`, and the backend
+is a config value (``--backend`` or ``CODEMENTOR_BACKEND``):
+
+* ``torch`` - full-precision PyTorch, the original behaviour.
+* ``int8``  - PyTorch with dynamic int8 quantization of the linear layers.
+* ``onnx``  - graph exported to ONNX and run with ONNX Runtime (needs
+  ``optimum[onnxruntime]``).
+
+Converted artifacts are cached under ``~/.cache/codementor/models`` so the
+quantization or export only happens on first use.
+
+The torch backends load weights memory-mapped: safetensors checkpoints, with
+``low_cpu_mem_usage`` when ``accelerate`` is installed (no full extra copy of
+the state dict), and the cached int8 state dict with ``torch.load(mmap=True,
+weights_only=True)``. Peak memory during loading stays close to the model
+size, and a reload after an idle unload (see ``model_manager.py``) reads the
+weights from the page cache.
+"""
+import importlib.util
+import os
+import shutil
+import tempfile
+
+from mentor_cache import cache_root
+
+BACKENDS = ("torch", "int8", "onnx")
+DEFAULT_BACKEND = os.environ.get("CODEMENTOR_BACKEND", "torch")
+
+
+def artifact_dir(model_id, backend):
+    return os.path.join(cache_root(), "models", f"{model_id.replace('/', '--')}-{backend}")
+
+
+def _conv1d_to_linear(module):
+    """Swap GPT-2 style ``Conv1D`` layers for ``nn.Linear`` so they can be quantized."""
+    from torch import nn
+    from transformers.pytorch_utils import Conv1D
+
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            in_features, out_features = child.weight.shape
+            linear = nn.Linear(in_features, out_features)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+        else:
+            _conv1d_to_linear(child)
+    return module
+
+
+def _mmap_kwargs():
+    # transformers needs accelerate to initialize weights lazily
+    return {"low_cpu_mem_usage": True} if importlib.util.find_spec("accelerate") else {}
+
+
+def _load_torch(model_id, **model_kwargs):
+    """Load from safetensors when the checkpoint has them, else from the pickled weights."""
+    from transformers import AutoModelForCausalLM
+
+    try:
+        return AutoModelForCausalLM.from_pretrained(model_id, use_safetensors=True, **_mmap_kwargs(), **model_kwargs)
+    except OSError as e:
+        if "safetensors" not in str(e):
+            raise
+    return AutoModelForCausalLM.from_pretrained(model_id, **_mmap_kwargs(), **model_kwargs)
+
+
+def _quantize(model):
+    import torch
+
+    model = _conv1d_to_linear(model.eval())
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _int8_skeleton(model_id):
+    """``model_id``'s architecture, quantized like :func:`_load_int8` does, with uninitialized weights."""
+    import torch
+    from transformers import AutoConfig, AutoModelForCausalLM, GenerationConfig
+    from transformers.modeling_utils import no_init_weights
+
+    with no_init_weights():
+        model = AutoModelForCausalLM.from_config(AutoConfig.from_pretrained(model_id), torch_dtype=torch.float32)
+        model = _quantize(model)
+    try:
+        model.generation_config = GenerationConfig.from_pretrained(model_id)
+    except OSError:
+        pass  # The checkpoint has none; keep the defaults from its config
+    return model
+
+
+def _load_int8(model_id, **model_kwargs):
+    """Quantize once and cache only the state dict; later loads fill a freshly quantized skeleton with it.
+
+    The cache directory may be shared, so the file is read with
+    ``weights_only=True`` and never unpickles arbitrary objects.
+    """
+    import torch
+
+    path = os.path.join(artifact_dir(model_id, "int8"), "state_dict.pt")
+    if os.path.exists(path):
+        model = _int8_skeleton(model_id)
+        model.load_state_dict(torch.load(path, weights_only=True, mmap=True))
+        return model
+
+    model_kwargs.pop("device_map", None)  # Dynamic quantization runs on CPU only
+    model = _quantize(_load_torch(model_id, torch_dtype=torch.float32, **model_kwargs))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    torch.save(model.state_dict(), tmp_path)
+    os.replace(tmp_path, path)
+    return model
+
+
+def _load_onnx(model_id, **model_kwargs):
+    from optimum.onnxruntime import ORTModelForCausalLM
+
+    path = artifact_dir(model_id, "onnx")
+    if os.path.exists(os.path.join(path, "config.json")):
+        return ORTModelForCausalLM.from_pretrained(path)
+
+    model = ORTModelForCausalLM.from_pretrained(model_id, export=True)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path))
+    model.save_pretrained(tmp_path)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)  # Another process finished the export first
+    return ORTModelForCausalLM.from_pretrained(path)
+
+
+_LOADERS = {"torch": _load_torch, "int8": _load_int8, "onnx": _load_onnx}
+
+
+def load_model(model_id, backend=None, **model_kwargs):
+    """Return ``(model, tokenizer)`` for ``model_id`` using ``backend``."""
+    from transformers import AutoTokenizer
+
+    backend = backend or DEFAULT_BACKEND
+    if backend not in _LOADERS:
+        raise ValueError(f"Unknown backend '{backend}'. Choose one of: {', '.join(BACKENDS)}")
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    return _LOADERS[backend](model_id, **model_kwargs), tokenizer
+
+
+def build_pipeline(model_id, backend=None, **model_kwargs):
+    """Build a text-generation pipeline for ``model_id`` on the chosen backend."""
+    from transformers import pipeline
+
+    model, tokenizer = load_model(model_id, backend, **model_kwargs)
+    return pipeline("text-generation", model=model, tokenizer=tokenizer)
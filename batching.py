@@ -0,0 +1,86 @@
+"""Micro-batching of generation requests.
+
+Watch mode can see dozens of files change at once (a ``git checkout`` or a
+formatter run). Instead of generating for each file serially, requests are
+collected for a short window and handed to the model as one padded batch.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class QueueFullError(RuntimeError):
+    """Raised (through the returned future) when the request queue is full."""
+
+
+class MicroBatcher:
+    """Gathers submitted items for ``window`` seconds and runs them together.
+
+    ``generate_batch`` receives a list of items and must return a list of
+    results in the same order. At most ``max_batch_size`` items are sent per
+    call and at most ``max_queue`` items may wait; further submissions fail
+    fast instead of blocking the caller.
+    """
+
+    def __init__(self, generate_batch, window=0.2, max_batch_size=8, max_queue=32):
+        self.generate_batch = generate_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Queue ``item`` and return a :class:`Future` for its result."""
+        future = Future()
+        if self._closed:
+            future.set_exception(RuntimeError("batcher is closed"))
+            return future
+        try:
+            self._queue.put_nowait((item, future))
+        except queue.Full:
+            future.set_exception(QueueFullError(f"generation queue is full ({self._queue.maxsize} pending)"))
+        return future
+
+    def _next_batch(self):
+        """Return ``(batch, stop)``; ``stop`` is set once the close sentinel is seen."""
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.generate_batch([item for item, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def close(self):
+        """Stop accepting work, finish what is queued and stop the worker thread."""
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
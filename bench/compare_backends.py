@@ -0,0 +1,105 @@
+"""Compare CPU inference backends against the fp32 baseline.
+
+Each backend runs in its own subprocess so peak RSS is measured in isolation.
+Generation is greedy so outputs are comparable; agreement is the share of
+generated tokens that match the torch (fp32) output position by position.
+
+    python bench/compare_backends.py --model distilgpt2 --backends torch int8 onnx
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROMPTS = [
+    "Analyze the following Python code and explain what it does:\n\n```python\ndef add(a, b):\n    return a + b\n```",
+    "Provide a single concise hint to fix this code:\n\n```python\nfor i in range(10)\n    print(i)\n```",
+    "Provide the corrected version of this code:\n\n```python\nimport os\ndef greet(name):\n    print('Hello, ' + name)\n```",
+]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_child(model_id, backend, max_new_tokens, repeats):
+    from backends import load_model
+
+    start = time.perf_counter()
+    model, tokenizer = load_model(model_id, backend)
+    load_seconds = time.perf_counter() - start
+
+    latencies = []
+    outputs = []
+    for prompt in PROMPTS:
+        inputs = tokenizer(prompt, return_tensors="pt")
+        for repeat in range(repeats):
+            start = time.perf_counter()
+            generated = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False,
+                                       pad_token_id=tokenizer.eos_token_id)
+            latencies.append(time.perf_counter() - start)
+        outputs.append(generated[0][inputs["input_ids"].shape[1]:].tolist())
+    return {
+        "backend": backend,
+        "load_s": round(load_seconds, 3),
+        "latency_p50_s": round(statistics.median(latencies), 4),
+        "latency_mean_s": round(statistics.mean(latencies), 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "tokens": outputs,
+    }
+
+
+def agreement(baseline, candidate):
+    matched = total = 0
+    for base_tokens, tokens in zip(baseline, candidate):
+        total += len(base_tokens)
+        matched += sum(1 for a, b in zip(base_tokens, tokens) if a == b)
+    return round(matched / total, 4) if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare latency, peak RSS and output agreement of inference backends.")
+    parser.add_argument("--model", default="distilgpt2", help="Model id to load")
+    parser.add_argument("--backends", nargs="+", default=["torch", "int8", "onnx"], help="Backends to compare; torch is the baseline")
+    parser.add_argument("--max-new-tokens", type=int, default=48)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.model, args.child, args.max_new_tokens, args.repeats)))
+        return
+
+    backends = ["torch"] + [backend for backend in args.backends if backend != "torch"]
+    results = []
+    for backend in backends:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", backend, "--model", args.model,
+                               "--max-new-tokens", str(args.max_new_tokens), "--repeats", str(args.repeats)],
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if proc.returncode != 0:
+            results.append({"backend": backend, "error": proc.stderr.strip().splitlines()[-1:] or ["failed"]})
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    baseline = next((r for r in results if r["backend"] == "torch" and "tokens" in r), None)
+    print(f"{'backend':<8} {'load s':>8} {'p50 s':>8} {'mean s':>8} {'peak MB':>9} {'agree':>7}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['backend']:<8} error: {result['error'][0]}")
+            continue
+        result["agreement"] = agreement(baseline["tokens"], result["tokens"]) if baseline else None
+        print(f"{result['backend']:<8} {result['load_s']:>8} {result['latency_p50_s']:>8} {result['latency_mean_s']:>8} "
+              f"{result['peak_rss_mb']:>9} {result['agreement'] if result['agreement'] is not None else '-':>7}")
+    print(json.dumps([{k: v for k, v in r.items() if k != "tokens"} for r in results], indent=2))
+
+
+if __name__ == "__main__":
+    main()
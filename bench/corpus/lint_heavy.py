@@ -0,0 +1,21 @@
+import os, sys
+import json
+from collections import *
+def calculateTotal( items,taxRate ):
+    Total=0
+    for Item in items :
+        Total+=Item['price']*Item['qty']
+    unused_value = 42
+    return Total*(1+taxRate)
+class shoppingCart :
+    def __init__(self):
+        self.Items=[]
+    def addItem(self,item) :
+        self.Items.append( item )
+    def total(self): return calculateTotal(self.Items,0.2)
+def main():
+  cart=shoppingCart()
+  cart.addItem({'price':10,'qty':2})
+  print( cart.total() )
+  if cart.total() == None: print('empty')
+main()
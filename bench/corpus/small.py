@@ -0,0 +1,15 @@
+import os
+
+
+def greet(name):
+    print("Hello, " + name)
+
+
+def add_numbers(a, b):
+    result = a + b
+    return result
+
+
+if __name__ == "__main__":
+    greet(os.environ.get("USER", "world"))
+    print(add_numbers(2, 3))
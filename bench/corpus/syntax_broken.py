@@ -0,0 +1,10 @@
+def add(a, b)
+    return a + b
+
+
+def average(values):
+    total = sum(values
+    return total / len(values)
+
+
+print(add(1, 2))
@@ -0,0 +1,286 @@
+"""Benchmark the mentor pipeline stage by stage.
+
+Runs every file in ``bench/corpus`` (plus a large module generated at run
+time) through ``first_check``, ``run_flake8``, ``generate_prompt``,
+``get_mentor_feedback`` and ``gemmacheck2.analyze_code`` and reports p50/p95
+latency, throughput and peak Python memory per stage as JSON.
+
+The model is replaced by a deterministic stub by default so the benchmark runs
+offline. Use ``--generator real`` for the actual model, or
+``--generator package.module:factory`` for any callable that returns a
+text-generation pipeline.
+
+    python bench/run_bench.py --baseline bench/baseline.json
+    python bench/run_bench.py --save-baseline bench/baseline.json
+"""
+import argparse
+import contextlib
+import hashlib
+import importlib
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import lint_engine  # noqa: E402
+import mentor  # noqa: E402
+
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+LARGE_FILE_DEFINITIONS = 300
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+class StubTokenizer:
+    """Counts words and punctuation as tokens; enough for prompt budgeting."""
+
+    pad_token = None
+    eos_token = "<|endoftext|>"
+    padding_side = "right"
+
+    def encode(self, text):
+        return [hash(token) for token in _TOKEN.findall(text)]
+
+
+class StubGenerator:
+    """Deterministic stand-in for a text-generation pipeline.
+
+    The response depends only on the prompt, and ``delay`` seconds are spent
+    per call to model a fixed generation cost.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.tokenizer = StubTokenizer()
+
+    def _generate(self, prompt):
+        if self.delay:
+            time.sleep(self.delay)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        return [{"generated_text": f"Feedback {digest}: check the highlighted lines and try again."}]
+
+    def __call__(self, prompts, **kwargs):
+        if isinstance(prompts, list):
+            return [self._generate(prompt) for prompt in prompts]
+        return self._generate(prompts)
+
+
+def load_generator(spec, stub_delay):
+    if spec == "stub":
+        return StubGenerator(stub_delay)
+    if spec == "real":
+        return mentor.load_generator()
+    module_name, _, attr = spec.partition(":")
+    if not attr:
+        raise SystemExit(f"--generator must be 'stub', 'real' or 'module:callable', got '{spec}'")
+    return getattr(importlib.import_module(module_name), attr)()
+
+
+def write_large_file(directory, definitions=LARGE_FILE_DEFINITIONS):
+    """Write a large, valid module built from many small functions and classes."""
+    parts = ["import math\nimport os\n"]
+    for index in range(definitions):
+        if index % 3 == 0:
+            parts.append(f"\n\nclass Shape{index}:\n"
+                         f"    def __init__(self, size):\n"
+                         f"        self.size = size\n\n"
+                         f"    def area(self):\n"
+                         f"        return math.pi * self.size ** 2\n")
+        else:
+            parts.append(f"\n\ndef compute_{index}(values, scale={index}):\n"
+                         f"    total = 0\n"
+                         f"    for value in values:\n"
+                         f"        if value % 2 == 0:\n"
+                         f"            total += value * scale\n"
+                         f"        else:\n"
+                         f"            total -= os.sep.count('/') + value\n"
+                         f"    return total\n")
+    path = os.path.join(directory, "large.py")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("".join(parts))
+    return path
+
+
+def corpus_files(directory):
+    names = sorted(name for name in os.listdir(CORPUS_DIR) if name.endswith(".py"))
+    return [os.path.join(CORPUS_DIR, name) for name in names] + [write_large_file(directory)]
+
+
+def build_stages(mode, hint_num):
+    """Return ``[(name, run)]`` where ``run(file_path, code, error_msg)`` executes one stage."""
+    def flake8(file_path, code, error_msg):
+        lint_engine.clear_cache()  # Measure a real flake8 run, not a cache hit
+        return mentor.run_flake8(file_path)
+
+    def first_check(file_path, code, error_msg):
+        try:
+            return mentor.first_check(file_path)
+        finally:
+            mentor.clear_parse_cache()  # The next run must parse again, not reuse this tree
+
+    stages = [
+        ("first_check", first_check),
+        ("run_flake8", flake8),
+        ("generate_prompt", lambda file_path, code, error_msg: mentor.generate_prompt(code, error_msg, mode, hint_num)),
+        ("get_mentor_feedback",
+         lambda file_path, code, error_msg: mentor.get_mentor_feedback(code, error_msg, mode, hint_num)),
+    ]
+    try:
+        import gemmacheck2
+    except ImportError as e:
+        print(f"[!] Skipping gemmacheck2.analyze_code: {e}", file=sys.stderr)
+    else:
+        gemma_mode = "analyze" if mode == "explain" else mode
+        stages.append(("gemmacheck2.analyze_code",
+                       lambda file_path, code, error_msg: gemmacheck2.analyze_code(file_path, gemma_mode, hint_num)))
+    return stages
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies):
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+    }
+
+
+def measure(run, inputs, repeats, warmup):
+    """Time ``run`` over ``inputs``; peak memory is measured in a separate traced pass."""
+    for _ in range(warmup):
+        for args in inputs:
+            run(*args)
+    by_file = {os.path.basename(args[0]): [] for args in inputs}
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for args in inputs:
+            start = time.perf_counter()
+            run(*args)
+            by_file[os.path.basename(args[0])].append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - started
+    latencies = [latency for values in by_file.values() for latency in values]
+
+    tracemalloc.start()
+    for args in inputs:
+        run(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dict(summarize(latencies), **{
+        "calls": len(latencies),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "throughput_per_s": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "peak_kib": round(peak / 1024, 1),
+        "files": {name: summarize(values) for name, values in by_file.items()},
+    })
+
+
+def run_benchmark(args):
+    mentor.feedback_cache.enabled = False  # Every call must reach the generator
+    mentor.set_generator(load_generator(args.generator, args.stub_delay))
+    workdir = tempfile.mkdtemp(prefix="codementor-bench-")
+    try:
+        inputs = []
+        for file_path in corpus_files(workdir):
+            _, error_msg, code = mentor.first_check(file_path)
+            inputs.append((file_path, code, error_msg))
+        results = {}
+        for name, run in build_stages(args.mode, args.hint_num):
+            if args.stages and name not in args.stages:
+                continue
+            with contextlib.redirect_stdout(io.StringIO()):  # Keep the mentor's status lines out of the report
+                results[name] = measure(run, inputs, args.repeats, args.warmup)
+            print(f"[*] {name}: p50 {results[name]['p50_ms']} ms, p95 {results[name]['p95_ms']} ms",
+                  file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "generator": args.generator,
+        "mode": args.mode,
+        "hint_num": args.hint_num,
+        "repeats": args.repeats,
+        "files": [os.path.basename(file_path) for file_path, _, _ in inputs],
+        "python": platform.python_version(),
+        "stages": results,
+    }
+
+
+def _regressed(value, base, tolerance, slack):
+    return base is not None and value > base * (1 + tolerance) + slack
+
+
+def compare(report, baseline, tolerance, min_delta_ms=2.0):
+    """Return regressions of per-file median latency and per-stage peak memory beyond ``tolerance``.
+
+    Latencies must also grow by more than ``min_delta_ms`` so sub-millisecond
+    stages do not fail on timer noise. p95 is reported but not compared; with a
+    handful of repeats it is too noisy to gate on.
+    """
+    regressions = []
+    for name, stats in report["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if not base:
+            continue
+        if _regressed(stats["peak_kib"], base.get("peak_kib"), tolerance, 0):
+            regressions.append(f"{name} peak_kib: {stats['peak_kib']} vs baseline {base['peak_kib']}")
+        for file_name, timings in stats["files"].items():
+            base_timings = base.get("files", {}).get(file_name, {})
+            if _regressed(timings["p50_ms"], base_timings.get("p50_ms"), tolerance, min_delta_ms):
+                regressions.append(f"{name} {file_name} p50_ms: {timings['p50_ms']} "
+                                   f"vs baseline {base_timings['p50_ms']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CodeMentor pipeline.")
+    parser.add_argument("--generator", default="stub",
+                        help="'stub' (default, offline), 'real' (mentor.MODEL_ID) or 'module:callable'")
+    parser.add_argument("--stub-delay", type=float, default=0.0, help="Seconds the stub spends per generation")
+    parser.add_argument("--mode", default="explain", choices=["hint", "solution", "explain"])
+    parser.add_argument("--hint-num", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--stages", nargs="+", help="Only run these stages")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="Compare against this JSON report; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Allowed slowdown before failing (0.3 = 30%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0,
+                        help="Ignore latency increases smaller than this many milliseconds")
+    parser.add_argument("--save-baseline", help="Also write the report to this path as the new baseline")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.min_delta_ms)
+        for regression in regressions:
+            print(f"[X] Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("[+] No regressions against the baseline.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Token-budgeted, AST-aware chunking of Python source.
+
+The mentor models have small context windows, and prompts used to be
+truncated silently. ``chunk_code`` splits a module at statement boundaries into
+pieces whose size (measured with the model's own tokenizer) fits a budget.
+Every chunk carries a compact header with the module's imports and top-level
+signatures so the model still sees the surrounding context.
+"""
+import ast
+from typing import NamedTuple
+
+
+class Chunk(NamedTuple):
+    start: int
+    end: int
+    text: str
+
+
+def _signature(lines, node, indent=""):
+    """First line(s) of a def/class up to its body, e.g. ``def f(a, b):``."""
+    start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+    body_start = node.body[0].lineno
+    header = "".join(lines[start - 1:max(node.lineno, body_start - 1)]).rstrip()
+    return f"{indent}{header.strip()} ..."
+
+
+def context_header(code, tree):
+    """Imports plus top-level function, class and method signatures."""
+    lines = code.splitlines(keepends=True)
+    header = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            header.append("".join(lines[node.lineno - 1:node.end_lineno]).rstrip())
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            header.append(_signature(lines, node))
+        elif isinstance(node, ast.ClassDef):
+            header.append(_signature(lines, node).rstrip(" ."))
+            header.extend(_signature(lines, child, "    ") for child in node.body
+                          if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)))
+    return "\n".join(header)
+
+
+def _segments(nodes, first_line, last_line):
+    """Line ranges covering ``first_line..last_line``, one per statement.
+
+    Comments and blank lines before a statement belong to that statement.
+    """
+    segments = []
+    start = first_line
+    for index, node in enumerate(nodes):
+        end = node.end_lineno if index < len(nodes) - 1 else last_line
+        segments.append((start, end, node))
+        start = end + 1
+    return segments
+
+
+def _split_range(lines, start, end, node, count_tokens, available):
+    """Break one statement into ranges that fit ``available`` tokens."""
+    if count_tokens("".join(lines[start - 1:end])) <= available or start == end:
+        return [(start, end)]
+    body = getattr(node, "body", None)
+    if body and isinstance(body, list) and body[0].lineno > start:
+        # Split at the statement boundaries of the body; the header goes with the first part
+        ranges = []
+        for child_start, child_end, child in _segments(body, body[0].lineno, end):
+            if child_start == body[0].lineno:
+                child_start = start
+            ranges.extend(_split_range(lines, child_start, child_end, child, count_tokens, available))
+        return ranges
+    # No statement boundary left to use: fall back to halving by lines
+    middle = (start + end) // 2
+    return (_split_range(lines, start, middle, None, count_tokens, available) +
+            _split_range(lines, middle + 1, end, None, count_tokens, available))
+
+
+def chunk_code(code, count_tokens, budget, tree=None):
+    """Split ``code`` into :class:`Chunk` objects of at most ``budget`` tokens.
+
+    ``count_tokens(text)`` must return the token count of ``text`` for the
+    model that will receive the chunks. Code that does not parse is split by
+    lines without a context header.
+    """
+    lines = code.splitlines(keepends=True)
+    if not lines:
+        return [Chunk(1, 1, code)]
+    if count_tokens(code) <= budget:
+        return [Chunk(1, len(lines), code)]
+    try:
+        tree = tree or ast.parse(code)
+        header = context_header(code, tree).splitlines()
+        ranges = _segments(tree.body, 1, len(lines)) if tree.body else [(1, len(lines), None)]
+    except SyntaxError:
+        header = []
+        ranges = [(1, len(lines), None)]
+
+    # The header must leave most of the budget for code; drop trailing signatures if it does not
+    while header and count_tokens("\n".join(header)) > budget // 2:
+        header.pop()
+    prefix = "# Context (imports and signatures):\n{}\n\n".format("\n".join(header)) if header else ""
+    available = max(budget - count_tokens(prefix) - 8, budget // 4)  # Leave room for the line marker
+
+    pieces = []
+    for start, end, node in ranges:
+        pieces.extend(_split_range(lines, start, end, node, count_tokens, available))
+
+    # Greedily pack consecutive pieces into chunks; token counts are close to additive across lines
+    chunks = []
+    current_start, current_end = pieces[0]
+    current_cost = count_tokens("".join(lines[current_start - 1:current_end]))
+    for start, end in pieces[1:]:
+        cost = count_tokens("".join(lines[start - 1:end]))
+        if current_cost + cost <= available:
+            current_end = end
+            current_cost += cost
+        else:
+            chunks.append((current_start, current_end))
+            current_start, current_end, current_cost = start, end, cost
+    chunks.append((current_start, current_end))
+    return [Chunk(start, end, f"{prefix}# Lines {start}-{end}:\n{''.join(lines[start - 1:end])}")
+            for start, end in chunks]
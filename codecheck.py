@@ -1,147 +1,315 @@
-import subprocess
-import ast
-import time
-import os
-import argparse
-import sys
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
-from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
-from huggingface_hub import login
-
-# Authenticate with Hugging Face (assumes HF_TOKEN is set in environment or user provides it)
-try:
-    login()  # Will use HF_TOKEN from environment or prompt user
-except Exception as e:
-    print(f"❌ Failed to authenticate with Hugging Face: {e}")
-    sys.exit(1)
-
-# Load Gemma model
-model_id = "google/gemma-1.1-2b-it"
-try:
-    tokenizer = AutoTokenizer.from_pretrained(model_id)
-    model = AutoModelForCausalLM.from_pretrained(model_id, device_map="auto")
-    generator = pipeline("text-generation", model=model, tokenizer=tokenizer)
-except Exception as e:
-    print(f"❌ Failed to load Gemma model: {e}")
-    sys.exit(1)
-
-def get_mentor_response(code, mode='explain', hint_num=1):
-    try:
-        if mode == 'explain':
-            prompt = f"""You are a Python code assistant. Explain this code like a mentor, providing hints for improvement without giving full solutions:
-
-```python
-{code}
-```"""
-        elif mode == 'hint':
-            prompt = f"""You are a Python code assistant. Review this code and provide hint {hint_num} to fix any errors or improve it, without giving the full solution:
-
-```python
-{code}
-```"""
-        elif mode == 'solution':
-            prompt = f"""You are a Python code assistant. Review this code and provide the full solution to fix any errors:
-
-```python
-{code}
-```"""
-        response = generator(prompt, max_new_tokens=100, do_sample=True, temperature=0.7)
-        return response[0]['generated_text'].split("```")[0].strip()
-    except Exception as e:
-        return f"⚠️ Couldn’t get mentor response: {str(e)}. Hint: Check your code for syntax errors or try breaking it into smaller parts."
-
-def check_flake8_availability():
-    try:
-        subprocess.run(['flake8', '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
-
-def run_flake8(file_path):
-    if not check_flake8_availability():
-        return "⚠️ Flake8 not found. Please install it with 'pip install flake8'."
-    
-    try:
-        result = subprocess.run(
-            ['flake8', file_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        if result.returncode == 0:
-            return "✅ No style issues found."
-        else:
-            issues = result.stdout.strip().split('\n')
-            formatted_issues = "\n".join(f"  {issue}" for issue in issues if issue)
-            return f"⚠️ Style issues:\n{formatted_issues}"
-    except Exception as e:
-        return f"⚠️ Error running flake8: {str(e)}"
-
-def first_check(file_path):
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            code = f.read()
-        ast.parse(code)
-        return True, "✅ Syntax Correct", code
-    except SyntaxError as e:
-        return False, f"❌ Syntax Error: {e}", None
-    except UnicodeDecodeError:
-        return False, f"❌ Error: Could not decode {file_path}. Ensure it is a valid text file.", None
-    except IOError as e:
-        return False, f"❌ Error reading {file_path}: {str(e)}", None
-
-class CodeMonitor(FileSystemEventHandler):
-    def __init__(self, mode='explain', hint_num=1):
-        self.last_processed = {}  # Track last processed time for debouncing
-        self.debounce_interval = 1.0  # Seconds to wait before re-processing
-        self.mode = mode
-        self.hint_num = hint_num
-
-    def on_modified(self, event):
-        if event.is_directory or not event.src_path.endswith(".py"):
-            return
-
-        current_time = time.time()
-        if event.src_path in self.last_processed:
-            if current_time - self.last_processed[event.src_path] < self.debounce_interval:
-                return  # Skip if modified too recently
-
-        print(f"\n🔍 Detected change in: {event.src_path}")
-        ok, syntax_msg, code = first_check(event.src_path)
-        print(syntax_msg)
-        
-        if ok and code:
-            # Run flake8
-            flake_output = run_flake8(event.src_path)
-            print(flake_output)
-            
-            # Get mentor response from Gemma
-            mentor_response = get_mentor_response(code, self.mode, self.hint_num)
-            print(f"🧑‍🏫 Mentor Response ({self.mode} mode):\n{mentor_response}")
-
-        self.last_processed[event.src_path] = current_time
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Monitor Python files with syntax, style, and mentor feedback.")
-    parser.add_argument("path", nargs="?", default=".", help="Directory to monitor (default: current directory)")
-    parser.add_argument("--mode", choices=['explain', 'hint', 'solution'], default='explain', help="Mentor response mode")
-    parser.add_argument("--hint-num", type=int, default=1, help="Hint number for 'hint' mode")
-    parser.add_argument("--no-recursive", action="store_false", dest="recursive", help="Disable recursive monitoring")
-    args = parser.parse_args()
-
-    if not os.path.isdir(args.path):
-        print(f"❌ Error: '{args.path}' is not a valid directory.")
-        sys.exit(1)
-
-    observer = Observer()
-    observer.schedule(CodeMonitor(mode=args.mode, hint_num=args.hint_num), path=args.path, recursive=args.recursive)
-    observer.start()
-    print(f"👀 Monitoring Python files in '{args.path}' (recursive: {args.recursive}, mode: {args.mode})... (Ctrl+C to stop)")
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        observer.stop()
-        print("\n🛑 Code mentor watchdog stopped.")
-    observer.join()
\ No newline at end of file
+import time
+import os
+import argparse
+import sys
+import threading
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+from lint_engine import flake8_available, lint_file
+from batching import MicroBatcher
+from backends import BACKENDS, DEFAULT_BACKEND, build_pipeline
+from model_manager import IDLE_UNLOAD_SECONDS, MAX_RSS_MB, ModelManager
+import telemetry
+import prefix_cache
+from generation import BUDGETS, stopping_criteria, trim_response
+import parse_cache
+from workqueue import CoalescingQueue
+from mentor_client import MentorClient
+from watch_index import WatchedTree
+
+model_id = "google/gemma-1.1-2b-it"
+backend = DEFAULT_BACKEND
+
+def build_generator(model_id, backend):
+    model_kwargs = {"device_map": "auto"} if backend == "torch" else {}
+    with telemetry.span("build_pipeline", backend=backend):
+        generator = build_pipeline(model_id, backend, **model_kwargs)
+    generator.tokenizer.padding_side = "left"  # Batched prompts are padded on the left for generation
+    return generator
+
+# Gemma is unloaded after --idle-unload seconds without changes and loaded again on the next one
+models = ModelManager(build_generator)
+
+def load_model():
+    from huggingface_hub import login
+
+    # Authenticate with Hugging Face (assumes HF_TOKEN is set in environment or user provides it)
+    try:
+        with telemetry.span("login"):
+            login()  # Will use HF_TOKEN from environment or prompt user
+    except Exception as e:
+        print(f"❌ Failed to authenticate with Hugging Face: {e}")
+        sys.exit(1)
+
+    # Load Gemma model
+    try:
+        models.get(model_id, backend)
+    except Exception as e:
+        print(f"❌ Failed to load Gemma model: {e}")
+        sys.exit(1)
+
+# Fixed start of each mode's prompt; the code and hint number follow it so
+# the model's cached state for the prefix can be reused (see prefix_cache.py).
+PROMPT_PREFIXES = {
+    'explain': "You are a Python code assistant. Explain this code like a mentor, providing hints for improvement without giving full solutions:\n\n```python\n",
+    'hint': "You are a Python code assistant. Review this code and provide a hint to fix any errors or improve it, without giving the full solution:\n\n```python\n",
+    'solution': "You are a Python code assistant. Review this code and provide the full solution to fix any errors:\n\n```python\n",
+}
+
+def build_prompt(code, mode='explain', hint_num=1):
+    if mode == 'explain':
+        return f"""{PROMPT_PREFIXES['explain']}{code}
+```"""
+    elif mode == 'hint':
+        return f"""{PROMPT_PREFIXES['hint']}{code}
+```
+This is hint {hint_num}."""
+    elif mode == 'solution':
+        return f"""{PROMPT_PREFIXES['solution']}{code}
+```"""
+
+def prompt_mode(prompt):
+    return next((mode for mode, prefix in PROMPT_PREFIXES.items() if prompt.startswith(prefix)), 'explain')
+
+def response_budget(mode):
+    """The mentor's budget for ``mode``, capped for the watcher: 100 new tokens, and prose up to the first code fence."""
+    budget = BUDGETS[mode]
+    return budget._replace(max_new_tokens=min(budget.max_new_tokens, 100), max_fences=1)
+
+def generate_responses(prompts):
+    """Generate for several prompts in one padded batch."""
+    generator = models.get(model_id, backend)
+
+    def count_tokens(text):
+        return len(generator.tokenizer.encode(text))
+
+    modes = [prompt_mode(prompt) for prompt in prompts]
+    texts = [None] * len(prompts)
+    with telemetry.span("generate", batch_size=len(prompts),
+                        prompt_tokens=sum(count_tokens(prompt) for prompt in prompts)) as stats:
+        for mode in dict.fromkeys(modes):
+            indices = [index for index, each in enumerate(modes) if each == mode]
+            group = [prompts[index] for index in indices]
+            budget = response_budget(mode)
+            kwargs = dict(budget.kwargs(), do_sample=True, temperature=0.7)
+            if getattr(generator, "model", None) is not None:
+                kwargs["stopping_criteria"] = stopping_criteria(generator.tokenizer, budget)
+            outputs = prefix_cache.generate(generator, group, PROMPT_PREFIXES.values(),
+                                            batch_size=len(group), **kwargs)
+            for index, prompt, text in zip(indices, group, outputs):
+                texts[index] = trim_response(prompt, text, budget)
+        stats["generated_tokens"] = sum(count_tokens(text) for text in texts)
+    return [text.strip() for text in texts]
+
+def get_mentor_response(code, mode='explain', hint_num=1):
+    try:
+        return generate_responses([build_prompt(code, mode, hint_num)])[0]
+    except Exception as e:
+        return mentor_error(e)
+
+def mentor_error(e):
+    return f"⚠️ Couldn’t get mentor response: {str(e)}. Hint: Check your code for syntax errors or try breaking it into smaller parts."
+
+def run_flake8(file_path, changed=None):
+    """flake8 report for ``file_path``; with ``changed`` line ranges, only issues on those lines are listed."""
+    if not flake8_available():
+        return "⚠️ Flake8 not found. Please install it with 'pip install flake8'."
+    
+    try:
+        diagnostics = lint_file(file_path)
+    except Exception as e:
+        return f"⚠️ Error running flake8: {str(e)}"
+    elsewhere = 0
+    if changed is not None:
+        shown = [d for d in diagnostics if any(start <= d.line <= end for start, end in changed)]
+        elsewhere, diagnostics = len(diagnostics) - len(shown), shown
+    note = f" ({elsewhere} more in unchanged lines)" if elsewhere else ""
+    if not diagnostics:
+        return f"✅ No style issues found{' in the changed lines' if changed is not None else ''}.{note}"
+    formatted_issues = "\n".join(f"  {diagnostic}" for diagnostic in diagnostics)
+    return f"⚠️ Style issues{note}:\n{formatted_issues}"
+
+def first_check(file_path):
+    """Syntax check through the parse cache; returns ``(ok, message, parsed)``."""
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            code = f.read()
+        parsed = parse_cache.parse_file(file_path, code)
+        if parsed.error is not None:
+            return False, f"❌ Syntax Error: {parsed.error}", None
+        return True, "✅ Syntax Correct", parsed
+    except UnicodeDecodeError:
+        return False, f"❌ Error: Could not decode {file_path}. Ensure it is a valid text file.", None
+    except IOError as e:
+        return False, f"❌ Error reading {file_path}: {str(e)}", None
+
+class CodeMonitor(FileSystemEventHandler):
+    """Checks changed files off the observer thread.
+
+    Syntax and flake8 checks (the fast lane) run on a small worker pool fed by
+    a latest-wins queue per path. Mentor prompts (the slow lane) go to the
+    micro-batcher; a prompt for an older version of a file is cancelled if it
+    has not started yet, and its response is dropped if it has. With a
+    ``client``, the code is sent to a shared mentor server instead.
+
+    Once a file's results have been shown, later versions only list the
+    style issues on changed lines, and the local model is only asked about
+    the functions (or top-level lines) that changed; see parse_cache.py.
+    With a ``tree`` (a :class:`watch_index.WatchedTree`), ignored paths are
+    skipped, and a file whose content matches its last recorded results is
+    not checked again.
+    """
+
+    def __init__(self, mode='explain', hint_num=1, batcher=None, debounce_interval=1.0, workers=2, client=None,
+                 tree=None):
+        self.debounce_interval = debounce_interval  # Seconds after the last change before checking a file
+        self.tree = tree
+        self.mode = mode
+        self.hint_num = hint_num
+        self.client = client
+        self.batcher = batcher or (None if client else MicroBatcher(generate_responses))
+        self.queue = CoalescingQueue(self.process, debounce=debounce_interval, workers=workers, name="lint")
+        self.generating = {}  # path -> future of the newest queued mentor prompt
+        self.generating_lock = threading.Lock()
+        self.settled = set()  # Paths whose last parsed version had all its results shown
+
+    def on_any_event(self, event):
+        if self.tree is not None:
+            path = self.tree.python_file(event)
+        elif event.event_type == "modified" and not event.is_directory and event.src_path.endswith(".py"):
+            path = event.src_path
+        else:
+            path = None
+        if path:
+            self.queue.submit(path)  # Never blocks the observer thread
+
+    def process(self, job):
+        path = job.key
+        state, fresh = self.tree.needs_check(path) if self.tree else (None, True)
+        if not fresh:
+            return  # Same content as the last recorded results
+        with telemetry.span("process_file", file_path=path):
+            with telemetry.span("first_check"):
+                ok, syntax_msg, parsed = first_check(path)
+            # Ranges are relative to the version parsed before; only usable if its results were all shown
+            with self.generating_lock:
+                changed = parsed.changed if parsed and path in self.settled else None
+                self.settled.discard(path)
+            report = [f"\n🔍 Detected change in: {path}", syntax_msg]
+            if ok and parsed and not job.stale:
+                with telemetry.span("flake8"):
+                    report.append(run_flake8(path, changed))
+        if job.stale:
+            return  # A newer save is queued; only its results are shown
+        code = parsed.code if ok and parsed else None
+        if code and changed == []:
+            code = ""
+        elif code and changed and not self.client:  # The server does its own incremental analysis
+            code = "\n\n".join(region.source for region in parse_cache.changed_regions(parsed))
+        if ok and parsed and changed is not None and not code:
+            report.append("💤 No code changed since the last check; no new mentor feedback.")
+            with self.generating_lock:
+                self.settled.add(path)
+        print("\n".join(report))
+
+        if code:
+            if self.client:
+                # The server cancels this client's older request for the same file
+                future = self.client.submit(path, code, self.mode, self.hint_num)
+            else:
+                # Queue the prompt; changes that arrive together are generated as one batch
+                future = self.batcher.submit(build_prompt(code, self.mode, self.hint_num))
+            with self.generating_lock:
+                previous = self.generating.get(path)
+                self.generating[path] = future
+            if previous is not None:
+                previous.cancel()  # Skipped by the batcher unless generation already started
+            future.add_done_callback(lambda f: self.report(job, f, state, report[1:]))
+        elif self.tree:
+            self.tree.record(path, state, {"report": report[1:]})
+        telemetry.write_metrics()
+
+    def report(self, job, future, state=None, checks=()):
+        with self.generating_lock:
+            if self.generating.get(job.key) is future:
+                del self.generating[job.key]
+        if future.cancelled() or job.stale:
+            return
+        try:
+            mentor_response = future.result()
+        except Exception as e:
+            mentor_response = mentor_error(e)
+        print(f"🧑‍🏫 Mentor Response for {job.key} ({self.mode} mode):\n{mentor_response}")
+        with self.generating_lock:
+            if not job.stale:
+                self.settled.add(job.key)
+        if self.tree:
+            self.tree.record(job.key, state, {"report": list(checks), "mentor": mentor_response})
+        telemetry.write_metrics()
+
+    def close(self):
+        self.queue.close()
+        if self.tree:
+            self.tree.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monitor Python files with syntax, style, and mentor feedback.")
+    parser.add_argument("path", nargs="?", default=".", help="Directory to monitor (default: current directory)")
+    parser.add_argument("--mode", choices=['explain', 'hint', 'solution'], default='explain', help="Mentor response mode")
+    parser.add_argument("--hint-num", type=int, default=1, help="Hint number for 'hint' mode")
+    parser.add_argument("--no-recursive", action="store_false", dest="recursive", help="Disable recursive monitoring")
+    parser.add_argument("--debounce", type=float, default=1.0, help="Seconds to wait after the last change to a file before checking it")
+    parser.add_argument("--workers", type=int, default=2, help="Files checked for syntax and style in parallel")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND, help="Inference backend: full-precision torch, int8-quantized torch, or ONNX Runtime")
+    parser.add_argument("--server", metavar="URL", help="Get mentor feedback from a shared mentor_server.py (http://host:port or unix:PATH) instead of loading the model")
+    parser.add_argument("--idle-unload", type=float, default=IDLE_UNLOAD_SECONDS, help="Seconds without changes before the model is unloaded from memory; 0 keeps it loaded")
+    parser.add_argument("--max-rss-mb", type=float, default=MAX_RSS_MB, help="Unload least recently used models while the process RSS is above this many MB (0: no limit)")
+    parser.add_argument("--batch-window", type=float, default=0.2, help="Seconds to gather changed files into one generation batch")
+    parser.add_argument("--max-batch-size", type=int, default=8, help="Maximum prompts per generation batch")
+    parser.add_argument("--max-queue", type=int, default=32, help="Maximum prompts waiting for generation")
+    parser.add_argument("--ignore", action="append", default=[], metavar="PATTERN", help="gitignore-style pattern to skip, in addition to .gitignore, .codementorignore and the defaults (repeatable)")
+    parser.add_argument("--index", metavar="PATH", help="File-state index to use (default: one per directory under the cache directory)")
+    parser.add_argument("--no-index", action="store_true", help="Keep no file-state index; changes made while the watcher is stopped are not picked up")
+    parser.add_argument("--trace", metavar="PATH", help="Write timing spans as NDJSON to PATH, or 'stderr'")
+    parser.add_argument("--metrics", metavar="PATH", help="Keep aggregated stage metrics in Prometheus text format in PATH")
+    args = parser.parse_args()
+    telemetry.configure(args.trace, args.metrics)
+
+    if not os.path.isdir(args.path):
+        print(f"❌ Error: '{args.path}' is not a valid directory.")
+        sys.exit(1)
+
+    backend = args.backend
+    models.idle_unload = args.idle_unload
+    models.max_rss_mb = args.max_rss_mb
+    client = batcher = None
+    if args.server:
+        client = MentorClient(args.server, client_id=f"codecheck-{os.getpid()}")
+        try:
+            client.health()
+        except OSError as e:
+            print(f"❌ Mentor server at {args.server} is not reachable: {e}")
+            sys.exit(1)
+    else:
+        load_model()
+        batcher = MicroBatcher(generate_responses, window=args.batch_window,
+                               max_batch_size=args.max_batch_size, max_queue=args.max_queue)
+    tree = WatchedTree(args.path, recursive=args.recursive, ignores=args.ignore, index_path="" if args.no_index else args.index)
+    monitor = CodeMonitor(mode=args.mode, hint_num=args.hint_num, batcher=batcher,
+                          debounce_interval=args.debounce, workers=args.workers, client=client, tree=tree)
+    observer = Observer()
+    changed, stats = tree.start(observer, monitor)
+    for path in changed:
+        monitor.queue.submit(path)  # Edited while the watcher was not running
+    print(f"📇 {tree.describe(stats)}")
+    print(f"👀 Monitoring Python files in '{args.path}' (recursive: {args.recursive}, mode: {args.mode})... (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        observer.stop()
+        print("\n🛑 Code mentor watchdog stopped.")
+    observer.join()
+    monitor.close()
+    if batcher:
+        batcher.close()
\ No newline at end of file
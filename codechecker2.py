@@ -1,93 +1,134 @@
-import subprocess
-import ast
-import time
-import os
-import argparse
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
-
-def check_flake8_availability():
-    try:
-        subprocess.run(['flake8', '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
-
-def run_flake8(file_path):
-    if not check_flake8_availability():
-        return "⚠️ Flake8 not found. Please install it with 'pip install flake8'."
-    
-    try:
-        result = subprocess.run(
-            ['flake8', file_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        if result.returncode == 0:
-            return "✅ No syntax or style issues found."
-        else:
-            # Clean up flake8 output for readability
-            issues = result.stdout.strip().split('\n')
-            formatted_issues = "\n".join(f"  {issue}" for issue in issues if issue)
-            return f"⚠️ Style issues:\n{formatted_issues}"
-    except Exception as e:
-        return f"⚠️ Error running flake8: {str(e)}"
-
-def first_check(file_path):
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            code = f.read()
-        ast.parse(code)
-        return True, "✅ Syntax Correct"
-    except SyntaxError as e:
-        return False, f"❌ Syntax Error: {e}"
-    except UnicodeDecodeError:
-        return False, f"❌ Error: Could not decode {file_path}. Ensure it is a valid text file."
-    except IOError as e:
-        return False, f"❌ Error reading {file_path}: {str(e)}"
-
-class CodeMonitor(FileSystemEventHandler):
-    def __init__(self):
-        self.last_processed = {}  # Track last processed time for debouncing
-        self.debounce_interval = 1.0  # Seconds to wait before re-processing
-
-    def on_modified(self, event):
-        if event.is_directory or not event.src_path.endswith(".py"):
-            return
-
-        current_time = time.time()
-        if event.src_path in self.last_processed:
-            if current_time - self.last_processed[event.src_path] < self.debounce_interval:
-                return  # Skip if modified too recently
-
-        print(f"\n🔍 Detected change in: {event.src_path}")
-        ok, syntax_msg = first_check(event.src_path)
-        print(syntax_msg)
-        if ok:
-            flake_output = run_flake8(event.src_path)
-            print(flake_output)
-
-        self.last_processed[event.src_path] = current_time
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Monitor Python files for syntax and style issues.")
-    parser.add_argument("path", nargs="?", default=".", help="Directory to monitor (default: current directory)")
-    parser.add_argument("--no-recursive", action="store_false", dest="recursive", help="Disable recursive monitoring")
-    args = parser.parse_args()
-
-    if not os.path.isdir(args.path):
-        print(f"❌ Error: '{args.path}' is not a valid directory.")
-        exit(1)
-
-    observer = Observer()
-    observer.schedule(CodeMonitor(), path=args.path, recursive=args.recursive)
-    observer.start()
-    print(f"👀 Monitoring Python files in '{args.path}' (recursive: {args.recursive})... (Ctrl+C to stop)")
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        observer.stop()
-        print("\n🛑 Syntax watchdog stopped.")
-    observer.join()
\ No newline at end of file
+import time
+import os
+import argparse
+import threading
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+from lint_engine import flake8_available, lint_file
+import telemetry
+import parse_cache
+from workqueue import CoalescingQueue
+from watch_index import WatchedTree
+
+def run_flake8(file_path, changed=None):
+    """flake8 report for ``file_path``; with ``changed`` line ranges, only issues on those lines are listed."""
+    if not flake8_available():
+        return "⚠️ Flake8 not found. Please install it with 'pip install flake8'."
+    
+    try:
+        diagnostics = lint_file(file_path)
+    except Exception as e:
+        return f"⚠️ Error running flake8: {str(e)}"
+    elsewhere = 0
+    if changed is not None:
+        shown = [d for d in diagnostics if any(start <= d.line <= end for start, end in changed)]
+        elsewhere, diagnostics = len(diagnostics) - len(shown), shown
+    note = f" ({elsewhere} more in unchanged lines)" if elsewhere else ""
+    if not diagnostics:
+        return f"✅ No syntax or style issues found{' in the changed lines' if changed is not None else ''}.{note}"
+    formatted_issues = "\n".join(f"  {diagnostic}" for diagnostic in diagnostics)
+    return f"⚠️ Style issues{note}:\n{formatted_issues}"
+
+def first_check(file_path):
+    """Syntax check through the parse cache; returns ``(ok, message, parsed)``."""
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            code = f.read()
+        parsed = parse_cache.parse_file(file_path, code)
+        if parsed.error is not None:
+            return False, f"❌ Syntax Error: {parsed.error}", None
+        return True, "✅ Syntax Correct", parsed
+    except UnicodeDecodeError:
+        return False, f"❌ Error: Could not decode {file_path}. Ensure it is a valid text file.", None
+    except IOError as e:
+        return False, f"❌ Error reading {file_path}: {str(e)}", None
+
+class CodeMonitor(FileSystemEventHandler):
+    """Once a file's report has been shown, later versions only list the style issues on changed lines.
+
+    With a ``tree`` (a :class:`watch_index.WatchedTree`), ignored paths are
+    skipped, and a file whose content matches its last recorded check is not
+    checked again.
+    """
+
+    def __init__(self, debounce_interval=1.0, workers=2, tree=None):
+        self.debounce_interval = debounce_interval  # Seconds after the last change before checking a file
+        self.tree = tree
+        self.queue = CoalescingQueue(self.process, debounce=debounce_interval, workers=workers, name="lint")
+        self.settled = set()  # Paths whose last parsed version had its report shown
+        self.settled_lock = threading.Lock()
+
+    def on_any_event(self, event):
+        if self.tree is not None:
+            path = self.tree.python_file(event)
+        elif event.event_type == "modified" and not event.is_directory and event.src_path.endswith(".py"):
+            path = event.src_path
+        else:
+            path = None
+        if path:
+            self.queue.submit(path)  # Never blocks the observer thread
+
+    def process(self, job):
+        path = job.key
+        state, fresh = self.tree.needs_check(path) if self.tree else (None, True)
+        if not fresh:
+            return  # Same content as the last recorded check
+        with telemetry.span("process_file", file_path=path):
+            with telemetry.span("first_check"):
+                ok, syntax_msg, parsed = first_check(path)
+            # Ranges are relative to the version parsed before; only usable if its report was shown
+            with self.settled_lock:
+                changed = parsed.changed if parsed and path in self.settled else None
+                self.settled.discard(path)
+            report = [f"\n🔍 Detected change in: {path}", syntax_msg]
+            if ok and not job.stale:
+                with telemetry.span("flake8"):
+                    report.append(run_flake8(path, changed))
+        if not job.stale:  # A newer save is queued; only its results are shown
+            print("\n".join(report))
+            with self.settled_lock:
+                if ok and not job.stale:
+                    self.settled.add(path)
+            if self.tree:
+                self.tree.record(path, state, {"syntax": syntax_msg, "lint": report[2:]})
+        telemetry.write_metrics()
+
+    def close(self):
+        self.queue.close()
+        if self.tree:
+            self.tree.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monitor Python files for syntax and style issues.")
+    parser.add_argument("path", nargs="?", default=".", help="Directory to monitor (default: current directory)")
+    parser.add_argument("--no-recursive", action="store_false", dest="recursive", help="Disable recursive monitoring")
+    parser.add_argument("--debounce", type=float, default=1.0, help="Seconds to wait after the last change to a file before checking it")
+    parser.add_argument("--workers", type=int, default=2, help="Files checked in parallel")
+    parser.add_argument("--ignore", action="append", default=[], metavar="PATTERN", help="gitignore-style pattern to skip, in addition to .gitignore, .codementorignore and the defaults (repeatable)")
+    parser.add_argument("--index", metavar="PATH", help="File-state index to use (default: one per directory under the cache directory)")
+    parser.add_argument("--no-index", action="store_true", help="Keep no file-state index; changes made while the watcher is stopped are not picked up")
+    parser.add_argument("--trace", metavar="PATH", help="Write timing spans as NDJSON to PATH, or 'stderr'")
+    parser.add_argument("--metrics", metavar="PATH", help="Keep aggregated stage metrics in Prometheus text format in PATH")
+    args = parser.parse_args()
+    telemetry.configure(args.trace, args.metrics)
+
+    if not os.path.isdir(args.path):
+        print(f"❌ Error: '{args.path}' is not a valid directory.")
+        exit(1)
+
+    tree = WatchedTree(args.path, recursive=args.recursive, ignores=args.ignore, index_path="" if args.no_index else args.index)
+    monitor = CodeMonitor(debounce_interval=args.debounce, workers=args.workers, tree=tree)
+    observer = Observer()
+    changed, stats = tree.start(observer, monitor)
+    for path in changed:
+        monitor.queue.submit(path)  # Edited while the watcher was not running
+    print(f"📇 {tree.describe(stats)}")
+    print(f"👀 Monitoring Python files in '{args.path}' (recursive: {args.recursive})... (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        observer.stop()
+        print("\n🛑 Syntax watchdog stopped.")
+    observer.join()
+    monitor.close()
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""Which lines of which files a git diff touched, and the code around them.
+
+``mentor.py --diff <rev-range>`` uses this to analyze only what a change
+touched: :func:`changed_files` reads the ``git diff`` hunks for the range
+(``staged`` for the index, as in a pre-commit hook), and :func:`regions`
+widens each changed line to the innermost function that contains it. Lines
+outside any function are widened to the whole module- or class-level
+statement that contains them, and adjacent statements are grouped into
+runs, so every region parses on its own. Findings outside those regions are dropped, and only the
+regions' source is sent to the model, so the cost of a run follows the size
+of the diff rather than the size of the repository.
+
+Files are analyzed as they are in the working tree, so the end of the range
+should be what is checked out (``origin/main...HEAD`` in CI).
+"""
+import ast
+import codecs
+import os
+import re
+import subprocess
+import textwrap
+from typing import NamedTuple
+
+_HUNK = re.compile(r"^@@ -\d+(?:,\d+)? \+(?P<start>\d+)(?:,(?P<count>\d+))? @@")
+
+
+class Region(NamedTuple):
+    name: str
+    kind: str  # "function" or "lines"
+    start: int
+    end: int
+    source: str
+
+
+def git_root(cwd=None):
+    return subprocess.run(["git", "rev-parse", "--show-toplevel"], cwd=cwd, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, text=True, check=True).stdout.strip()
+
+
+def git_diff(rev_range, cwd=None):
+    """Zero-context ``git diff`` of the Python files in ``rev_range``, without deleted files."""
+    args = ["--cached"] if rev_range == "staged" else [rev_range]
+    return subprocess.run(["git", "diff", "--unified=0", "--no-color", "--no-ext-diff", "--diff-filter=d", *args,
+                           "--", "*.py"], cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          text=True, encoding="utf-8", errors="replace", check=True).stdout
+
+
+def parse_diff(text):
+    """``{path: [(start, end)]}`` of the new-side lines each file's hunks touched.
+
+    A hunk that only deletes lines is recorded as the single line it follows,
+    so the function it was deleted from is still analyzed.
+    """
+    files = {}
+    ranges = None
+    for line in text.splitlines():
+        if line.startswith("+++ "):
+            path = _unquote(line[4:])
+            ranges = None if path == "/dev/null" else files.setdefault(path[2:] if path.startswith("b/") else path, [])
+        elif line.startswith("@@") and ranges is not None:
+            match = _HUNK.match(line)
+            if match:
+                start = int(match["start"])
+                count = int(match["count"]) if match["count"] is not None else 1
+                ranges.append((max(start, 1), max(start + count - 1, start, 1)))
+    return files
+
+
+def _unquote(path):
+    """A path from a diff header, decoding git's C-style quoting of unusual (e.g. non-ASCII) names."""
+    if len(path) >= 2 and path[0] == path[-1] == '"':
+        return codecs.escape_decode(path[1:-1].encode("utf-8"))[0].decode("utf-8", "replace")
+    return path
+
+
+def changed_files(rev_range, cwd=None):
+    """``{absolute path: [(start, end)]}`` for the Python files ``rev_range`` touched that still exist."""
+    root = git_root(cwd)
+    changed = parse_diff(git_diff(rev_range, root))
+    return {os.path.join(root, path): ranges for path, ranges in changed.items()
+            if ranges and os.path.isfile(os.path.join(root, path))}
+
+
+def regions(code, ranges, tree=None, enclosing=None, statement=None):
+    """The functions containing the changed ``ranges``, plus runs of changed statements outside any function.
+
+    ``enclosing(line)`` returns ``(start, end, name)`` of the innermost
+    function containing a line, or ``None``. ``statement(line)`` returns
+    ``(start, end, parent)`` of the module- or class-level statement
+    containing it (``parent`` tells the module and each class body apart),
+    or ``None`` for a comment between statements. Both come from ``tree`` by
+    default.
+    """
+    if enclosing is None or statement is None:
+        tree = ast.parse(code) if tree is None else tree
+        enclosing = enclosing or _ast_enclosing(tree)
+        statement = statement or _ast_statement(tree)
+    lines = code.splitlines(keepends=True)
+    found = {}
+    loose = {}  # parent -> [(start, end)]; only statements of the same body are grouped
+    for first, last in ranges:
+        for line in range(first, min(last, len(lines)) + 1):
+            function = enclosing(line)
+            if function:
+                found[function[:2]] = Region(function[2], "function", function[0], function[1],
+                                             textwrap.dedent("".join(lines[function[0] - 1:function[1]])))
+            elif lines[line - 1].strip():
+                span = statement(line)
+                parent = span[2] if span else None
+                loose.setdefault(parent, []).append(span[:2] if span else (line, line))
+    for spans in loose.values():
+        for start, end in _runs(spans):
+            found[(start, end)] = Region(f"lines {start}-{end}", "lines", start, end,
+                                         textwrap.dedent("".join(lines[start - 1:end])))
+    return sorted(found.values(), key=lambda region: region.start)
+
+
+def _ast_enclosing(tree):
+    functions = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+            functions.append((start, node.end_lineno, node.name))
+
+    def enclosing(line):
+        containing = [function for function in functions if function[0] <= line <= function[1]]
+        return max(containing, key=lambda function: function[0]) if containing else None  # The innermost one
+    return enclosing
+
+
+def _ast_statement(tree):
+    def start(node):
+        return min([node.lineno] + [decorator.lineno for decorator in getattr(node, "decorator_list", [])])
+
+    def statement(line):
+        body, parent = tree.body, "module"
+        while True:
+            node = next((node for node in body if start(node) <= line <= node.end_lineno), None)
+            if node is None:
+                return None
+            if not (isinstance(node, ast.ClassDef) and line >= start(node.body[0])):
+                return start(node), node.end_lineno, parent
+            body, parent = node.body, start(node)  # In the class body: its own statements
+    return statement
+
+
+def _runs(spans):
+    """Merge overlapping or adjacent ``(start, end)`` spans."""
+    runs = []
+    for first, last in sorted(spans):
+        if runs and first <= runs[-1][1] + 1:
+            runs[-1][1] = max(runs[-1][1], last)
+        else:
+            runs.append([first, last])
+    return [tuple(run) for run in runs]
+
+
+def in_regions(line, scoped):
+    return any(region.start <= line <= region.end for region in scoped)
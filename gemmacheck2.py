@@ -1,127 +1,170 @@
+import os
 import sys
 import json
+from typing import NamedTuple
+from pylint.checkers import BaseChecker
 from pylint.lint import Run
-from pylint.reporters.text import TextReporter
-from io import StringIO
+from pylint.reporters import BaseReporter
 import parso
 
+from rules import feedback_for
+
+PYLINT_CHECKS = 'undefined-variable,invalid-name,too-few-public-methods,too-many-arguments,missing-function-docstring,too-many-locals,too-many-branches,too-many-statements'
+PLUGIN_MODULE = os.path.splitext(os.path.basename(__file__))[0]
+
+
+class Feedback(NamedTuple):
+    """One finding or hint; ``type`` and ``line`` are only set for findings tied to a line."""
+    path: str
+    message: str
+    explanation: str
+    type: str = None
+    line: int = None
+
+    def to_dict(self):
+        result = {'type': self.type, 'line': self.line} if self.type else {}
+        result.update(message=self.message, explanation=self.explanation)
+        return result
+
+
+class StructureChecker(BaseChecker):
+    """Reports module-level imports and ``add_numbers`` definitions from pylint's own tree.
+
+    These checks used to re-read and re-parse every file with parso after
+    pylint had already parsed it.
+    """
+    name = 'mentor-structure'
+    msgs = {
+        'C9901': ('Module-level import', 'mentor-import', 'Used by gemmacheck2 to point at imports.'),
+        'E9902': ('Missing argument for `add_numbers`', 'mentor-missing-argument',
+                  'Used by gemmacheck2 to flag `add_numbers` definitions.'),
+    }
+
+    def __init__(self, linter):
+        super().__init__(linter)
+        self.parsed = set()  # Files pylint managed to parse
+
+    def visit_module(self, node):
+        self.parsed.add(os.path.abspath(node.file))
+
+    def visit_import(self, node):
+        if node.scope() is node.root():
+            self.add_message('mentor-import', node=node)
+
+    visit_importfrom = visit_import
+
+    def visit_functiondef(self, node):
+        if node.name == 'add_numbers' and node.parent.scope() is node.root():
+            self.add_message('mentor-missing-argument', node=node)
+
+
+class CollectingReporter(BaseReporter):
+    """Keeps pylint messages as objects, grouped by absolute file path."""
+    name = 'collecting'
+
+    def __init__(self):
+        super().__init__()
+        self.by_path = {}
+
+    def handle_message(self, msg):
+        self.by_path.setdefault(os.path.abspath(msg.abspath), []).append(msg)
+
+    def display_messages(self, layout):
+        pass
+
+    def display_reports(self, layout):
+        pass
+
+    def _display(self, layout):
+        pass
+
+
+def register(linter):
+    """pylint plugin entry point (``--load-plugins``)."""
+    linter.register_checker(StructureChecker(linter))
+
+
+def _parso_structure(path):
+    """Imports and ``add_numbers`` lines for a file pylint could not parse."""
+    with open(path, 'r') as f:
+        tree = parso.parse(f.read())
+    imports = [node.start_pos[0] for node in tree.iter_imports()]
+    missing = [func.start_pos[0] for func in tree.iter_funcdefs()
+               if func.name.value == 'add_numbers'
+               and len([arg for arg in func.children if arg.type == 'argument']) < 2]
+    return imports, missing
+
+
+def analyze_files(file_paths, mode='analyze', hint_num=1):
+    """Analyze many files with a single pylint run; returns ``{path: [Feedback]}``.
+
+    pylint's startup and inference are paid once for the whole set, and each
+    file is parsed once: the structure checks run on pylint's tree, and parso
+    is only used for files that do not parse.
+    """
+    reporter = CollectingReporter()
+    checks = f'{PYLINT_CHECKS},mentor-import,mentor-missing-argument'
+    run = Run(list(file_paths) + [f'--load-plugins={PLUGIN_MODULE}', '--disable=all', f'--enable={checks}'],
+              reporter=reporter, exit=False)
+    parsed = set()
+    for checker in run.linter.get_checkers():
+        if isinstance(checker, BaseChecker) and checker.name == StructureChecker.name:
+            parsed |= checker.parsed
+    results = {}
+    for file_path in file_paths:
+        messages = reporter.by_path.get(os.path.abspath(file_path), [])
+        results[file_path] = [Feedback(path=file_path, **item)
+                              for item in _feedback(file_path, messages, os.path.abspath(file_path) in parsed,
+                                                    mode, hint_num)]
+    return results
+
+
 def analyze_code(file_path, mode='analyze', hint_num=1):
+    """Analyze one file; returns a list of plain dicts (see :func:`analyze_files`)."""
+    return [feedback.to_dict() for feedback in analyze_files([file_path], mode, hint_num)[file_path]]
+
+
+def _feedback(file_path, messages, parsed, mode, hint_num):
     errors = []
     hints = []
 
-    # Run Pylint
-    output = StringIO()
-    reporter = TextReporter(output)
-    Run([file_path, '--disable=all', '--enable=undefined-variable,invalid-name,too-few-public-methods,too-many-arguments,missing-function-docstring,too-many-locals,too-many-branches,too-many-statements'], reporter=reporter, exit=False)
-    pylint_output = output.getvalue()
-
-    for line in pylint_output.splitlines():
-        if 'undefined-variable' in line:
-            line_num = int(line.split(':')[1])
-            errors.append({
-                'type': 'error',
-                'line': line_num,
-                'message': 'Error: Variable used before definition.',
-                'explanation': 'Hint: Check if you initialized it.'
-            })
-            if mode == 'hint':
-                hints.append({
-                    'message': f"Hint {hint_num}: Define the variable before using it.",
-                    'explanation': 'Try setting it to a default value, like `x = 0`.'
-                } if hint_num == 1 else {
-                    'message': f"Hint {hint_num}: Check the line above this error.",
-                    'explanation': 'Ensure the variable is assigned before use.'
-                } if hint_num == 2 else {
-                    'message': f"Hint {hint_num}: Use an assignment statement.",
-                    'explanation': 'Add `x = 0` before the line.'
-                })
-            elif mode == 'step':
-                hints.append({
-                    'message': f"Step {hint_num}: Define the variable above this line.",
-                    'explanation': 'Add `x = 0` before using `x`. Want the next step?' if hint_num < 3 else 'Try the solution now.'
-                })
-            elif mode == 'solution':
-                hints.append({
-                    'message': 'Solution: Add `x = 0` before using the variable.',
-                    'explanation': 'This defines the variable to avoid NameError.'
-                })
-        elif 'invalid-name' in line:
-            line_num = int(line.split(':')[1])
-            hints.append({
-                'type': 'suggestion',
-                'line': line_num,
-                'message': 'Hint: Variable name doesn’t follow PEP 8.',
-                'explanation': 'Use snake_case, like `my_variable`.'
-            })
-            if mode == 'hint':
-                hints.append({
-                    'message': f"Hint {hint_num}: Rename to follow PEP 8.",
-                    'explanation': 'Use underscores, e.g., `my_variable`.'
-                } if hint_num == 1 else {
-                    'message': f"Hint {hint_num}: Avoid camelCase.",
-                    'explanation': 'Python prefers snake_case for variables.'
-                } if hint_num == 2 else {
-                    'message': f"Hint {hint_num}: Check PEP 8 guidelines.",
-                    'explanation': 'See https://peps.python.org/pep-0008/.'
-                })
-            elif mode == 'step':
-                hints.append({
-                    'message': f"Step {hint_num}: Rename to snake_case.",
-                    'explanation': 'Change `myVariable` to `my_variable`. Want the next step?' if hint_num < 3 else 'Try the solution now.'
-                })
-            elif mode == 'solution':
-                hints.append({
-                    'message': 'Solution: Rename to `my_variable`.',
-                    'explanation': 'This follows PEP 8 for Python variable names.'
-                })
-
-    # Parse with Parso for missing arguments
-    with open(file_path, 'r') as f:
-        code = f.read()
-    tree = parso.parse(code)
-    for node in tree.iter_imports():
+    for msg in messages:
+        if msg.symbol in ('undefined-variable', 'invalid-name'):
+            msg_errors, msg_hints = feedback_for(msg.symbol, msg.line, mode, hint_num)
+            errors.extend(msg_errors)
+            hints.extend(msg_hints)
+
+    # Imports and `add_numbers` definitions, from pylint's tree or (for unparsable files) parso
+    if parsed:
+        imports = [msg.line for msg in messages if msg.symbol == 'mentor-import']
+        missing = [msg.line for msg in messages if msg.symbol == 'mentor-missing-argument']
+    else:
+        imports, missing = _parso_structure(file_path)
+    for line_num in imports:
         errors.append({
             'type': 'error',
-            'line': node.start_pos[0],
-            'message': f"Error: Syntax error at line {node.start_pos[0]}.",
+            'line': line_num,
+            'message': f"Error: Syntax error at line {line_num}.",
             'explanation': 'Hint: Check for missing arguments or syntax.'
         })
-    for func_call in tree.iter_funcdefs():
-        if func_call.name.value == 'add_numbers':
-            args = len([arg for arg in func_call.children if arg.type == 'argument'])
-            if args < 2:
-                errors.append({
-                    'type': 'error',
-                    'line': func_call.start_pos[0],
-                    'message': 'Error: Missing argument for `add_numbers`.',
-                    'explanation': 'Hint: The function expects two parameters.'
-                })
-                if mode == 'hint':
-                    hints.append({
-                        'message': f"Hint {hint_num}: Check the number of arguments in `add_numbers`.",
-                        'explanation': 'The function needs two inputs, like `add_numbers(5, 10)`.' if hint_num == 1 else
-                                     'Count the parameters in the function definition.' if hint_num == 2 else
-                                     'Look at the function’s signature for clues.'
-                    })
-                elif mode == 'step':
-                    hints.append({
-                        'message': f"Step {hint_num}: Check the function definition.",
-                        'explanation': 'See how many parameters `add_numbers` expects.' if hint_num == 1 else
-                                     'Add a second argument to the function call.' if hint_num == 2 else
-                                     'Try calling `add_numbers` with two numbers.'
-                    })
-                elif mode == 'solution':
-                    hints.append({
-                        'message': 'Solution: Call `add_numbers(5, 10)`.',
-                        'explanation': 'This provides the required second argument.'
-                    })
+    for line_num in missing:
+        missing_errors, missing_hints = feedback_for('missing-argument', line_num, mode, hint_num)
+        errors.extend(missing_errors)
+        hints.extend(missing_hints)
 
     if mode == 'analyze':
         return errors + hints
     return hints
 
 if __name__ == '__main__':
-    file_path = "test.py"
+    file_path = sys.argv[1] if len(sys.argv) > 1 else "test.py"
     mode = sys.argv[2] if len(sys.argv) > 2 else 'analyze'
     hint_num = int(sys.argv[3]) if len(sys.argv) > 3 else 1
-    print(json.dumps(analyze_code(file_path, mode, hint_num)))
\ No newline at end of file
+    if os.path.isdir(file_path):
+        # Project-wide: every Python file under the directory in one pylint run
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(file_path)
+                       for name in names if name.endswith('.py'))
+        results = analyze_files(paths, mode, hint_num)
+        print(json.dumps({path: [feedback.to_dict() for feedback in results[path]] for path in paths}))
+    else:
+        print(json.dumps(analyze_code(file_path, mode, hint_num)))
\ No newline at end of file
@@ -0,0 +1,217 @@
+"""Cancellation, budgets and early stopping of in-flight generation.
+
+A :class:`CancellationToken` is created per request. Passing it to
+``generate_text`` installs a stopping criterion that ends ``model.generate``
+at the next decoding step once the token is cancelled, so a superseded
+request stops using CPU almost immediately instead of running to
+``max_length``.
+
+Each mode also has a :class:`Budget`: a number of new tokens, a wall-clock
+deadline, and the points at which its response is complete. These are a
+closing code fence, the end of a single hint, and a stretch of text the
+model has started to repeat. :func:`stop_index` finds those points in the
+text generated so far. The stopping criterion from :func:`stopping_criteria`
+checks them after every decoding step, so generation ends as soon as the
+response is complete and :func:`trim` only drops the last few tokens.
+"""
+import os
+import re
+import threading
+import time
+from typing import NamedTuple
+
+LOOP_WINDOW = 48  # Characters that must repeat before a loop is cut
+_FENCE = "```"
+_HINT_END = re.compile(r"\n[ \t]*\n|\n[ \t#*]*(?:Hint[ \t]*\d+|\d+[.)][ \t])")
+
+
+class GenerationCancelled(Exception):
+    """Raised when a request is cancelled before or during generation."""
+
+
+class CancellationToken:
+    """Thread-safe flag shared by the request reader and the generating thread."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise GenerationCancelled("generation was cancelled")
+
+
+def cancel_criteria(token):
+    """A ``StoppingCriteriaList`` that stops generation once ``token`` is cancelled."""
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class CancelCriteria(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), token.cancelled, dtype=torch.bool, device=input_ids.device)
+
+    return StoppingCriteriaList([CancelCriteria()])
+
+
+class Budget(NamedTuple):
+    max_new_tokens: int
+    seconds: float  # Wall-clock deadline for one generate call
+    max_fences: int  # Stop at this code fence: before it if it opens a block, after it if it closes one
+    single_hint: bool = False  # Stop at the end of the first hint
+
+    def kwargs(self):
+        return {"max_new_tokens": self.max_new_tokens}
+
+
+_SCALE = float(os.environ.get("CODEMENTOR_BUDGET_SCALE", "1"))  # Multiplies every token budget and deadline
+BUDGETS = {
+    # One explanation, ending with the first code block it shows
+    "explain": Budget(int(256 * _SCALE), 30 * _SCALE, max_fences=2),
+    # One or two sentences; a hint must not contain code
+    "hint": Budget(int(64 * _SCALE), 10 * _SCALE, max_fences=1, single_hint=True),
+    # The corrected code and its explanation, before or after it
+    "solution": Budget(int(384 * _SCALE), 45 * _SCALE, max_fences=3),
+    "ladder": Budget(int(448 * _SCALE), 60 * _SCALE, max_fences=3),
+}
+
+
+def _loop_start(text):
+    """Where the repetition begins if ``text`` ends in a loop, else ``None``.
+
+    The last ``LOOP_WINDOW`` characters must occur earlier, and the repeated
+    stretch must be twice that long or make up three copies, so a line of
+    code that legitimately appears twice is not cut.
+    """
+    if len(text) < 2 * LOOP_WINDOW:
+        return None
+    window = text[-LOOP_WINDOW:]
+    if not window.strip():
+        return None
+    previous = text.rfind(window, 0, len(text) - 1)
+    if previous < 0:
+        return None
+    period = len(text) - LOOP_WINDOW - previous
+    start = len(text) - LOOP_WINDOW
+    while start > period and text[start - 1] == text[start - 1 - period]:
+        start -= 1  # Keep exactly one copy of the repeated part
+    repeated = len(text) - start
+    return start if repeated >= 2 * LOOP_WINDOW or repeated >= 2 * period else None
+
+
+def stop_index(text, budget):
+    """Index at which the generated ``text`` should end under ``budget``, or ``None`` if it is not complete."""
+    cuts = []
+    fences = [match.start() for match in re.finditer(_FENCE, text)]
+    if len(fences) >= budget.max_fences:
+        fence = fences[budget.max_fences - 1]
+        cuts.append(fence + len(_FENCE) if budget.max_fences % 2 == 0 else fence)
+    if budget.single_hint:
+        body = len(text) - len(text.lstrip())
+        match = _HINT_END.search(text, body + 1)
+        if match and text[body:match.start()].strip():
+            cuts.append(match.start())
+    loop = _loop_start(text)
+    if loop is not None:
+        cuts.append(loop)
+    return min(cuts) if cuts else None
+
+
+def trim(text, budget):
+    """``text`` up to its :func:`stop_index`, without trailing whitespace."""
+    cut = stop_index(text, budget)
+    return text[:cut].rstrip() if cut is not None else text
+
+
+def trim_response(prompt, text, budget):
+    """:func:`trim` the continuation of ``prompt`` in a pipeline output, without the echoed prompt."""
+    return trim(text[len(prompt):] if text.startswith(prompt) else text, budget)
+
+
+def _could_end_hint(line):
+    """True if ``line``, the text after a newline so far, could still grow into a :data:`_HINT_END` marker."""
+    rest = line.lstrip(" \t#*")
+    return not rest or "Hint".startswith(rest) or bool(re.fullmatch(r"Hint[ \t]*\d*|\d+[.)]?", rest))
+
+
+class StreamTrimmer:
+    """Passes streamed text on to ``on_token`` up to the point where ``budget`` ends the response.
+
+    Text that could still turn into a stop marker (trailing backticks, or in
+    hint mode the start of a line that could become a blank line or the next
+    hint) is held back until it cannot. A loop found
+    after its first copy was sent is cut where the sent text ends, so the
+    returned response always matches what was streamed.
+    """
+
+    def __init__(self, budget, on_token):
+        self.budget = budget
+        self.on_token = on_token
+        self.text = ""
+        self.sent = 0
+        self.done = False
+
+    def _send(self, end):
+        if end > self.sent:
+            self.on_token(self.text[self.sent:end])
+            self.sent = end
+
+    def feed(self, piece):
+        if self.done:
+            return
+        self.text += piece
+        cut = stop_index(self.text, self.budget)
+        if cut is not None:
+            self._send(len(self.text[:cut].rstrip()))
+            self.done = True
+            return
+        end = len(self.text.rstrip("`"))
+        newline = self.text.rfind("\n")
+        if self.budget.single_hint and newline >= 0 and _could_end_hint(self.text[newline + 1:]):
+            end = min(end, newline)
+        self._send(end)
+
+    def finish(self):
+        """Send the rest of the response and return all of it."""
+        if not self.done:
+            self._send(len(trim(self.text, self.budget)))
+        return self.text[:self.sent]
+
+
+def stopping_criteria(tokenizer, budget, token=None):
+    """A ``StoppingCriteriaList`` that ends each sequence when ``budget`` says its response is complete,
+    stops everything at the budget's deadline, and, with ``token``, on cancellation."""
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class BudgetCriteria(StoppingCriteria):
+        def __init__(self):
+            self.deadline = None
+            self.previous = None  # input_ids of the last step, to tell a new generate call from the next step
+            self.start = 0
+            self.finished = []
+
+        def __call__(self, input_ids, scores, **kwargs):
+            previous = self.previous
+            if (previous is None or input_ids.shape[0] != previous.shape[0]
+                    or input_ids.shape[1] != previous.shape[1] + 1
+                    or not torch.equal(input_ids[:, :previous.shape[1]], previous)):
+                # The pipeline runs one generate call per batch with the same criteria
+                self.start = input_ids.shape[1] - 1
+                self.finished = [False] * input_ids.shape[0]
+                self.deadline = time.monotonic() + budget.seconds
+            self.previous = input_ids
+            for row in range(input_ids.shape[0]):
+                if not self.finished[row]:
+                    text = tokenizer.decode(input_ids[row, self.start:], skip_special_tokens=True)
+                    self.finished[row] = stop_index(text, budget) is not None
+            expired = time.monotonic() > self.deadline or (token is not None and token.cancelled)
+            return torch.tensor([done or expired for done in self.finished], dtype=torch.bool,
+                                device=input_ids.device)
+
+    return StoppingCriteriaList([BudgetCriteria()])
@@ -0,0 +1,156 @@
+"""Definition-level incremental analysis.
+
+A module is split into its top-level functions and classes (plus one unit for
+the remaining module-level statements). Each unit gets a fingerprint of its
+AST, and the fingerprints and feedback from the previous run are stored per
+file. The first run sends the whole file as one request. On later runs only
+units that were added or changed are sent to the model, in one batch;
+feedback for unchanged units is reused, so the cost follows the size of the
+edit rather than the size of the file.
+"""
+import ast
+import hashlib
+import json
+import os
+from typing import NamedTuple
+
+from mentor_cache import atomic_write_json, cache_root
+
+MODULE_UNIT = "<module>"
+FILE_UNIT = "<file>"  # Feedback for a whole-file request, and the units it covers
+
+
+class Unit(NamedTuple):
+    key: str
+    kind: str
+    name: str
+    start: int
+    end: int
+    source: str
+    fingerprint: str
+
+
+def _fingerprint(nodes):
+    dump = "\n".join(ast.dump(node) for node in nodes)
+    return hashlib.sha256(dump.encode("utf-8")).hexdigest()
+
+
+def split_definitions(code, tree=None):
+    """Split ``code`` into top-level :class:`Unit` objects in source order."""
+    if tree is None:
+        tree = ast.parse(code)
+    lines = code.splitlines(keepends=True)
+    units = []
+    seen = {}
+    module_nodes = []
+    module_lines = []
+    for node in tree.body:
+        start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+        end = node.end_lineno
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            kind = "class" if isinstance(node, ast.ClassDef) else "function"
+            key = f"{kind}:{node.name}"
+            seen[key] = seen.get(key, 0) + 1
+            if seen[key] > 1:
+                key = f"{key}#{seen[key]}"  # Redefinition of the same name
+            units.append(Unit(key, kind, node.name, start, end, "".join(lines[start - 1:end]), _fingerprint([node])))
+        else:
+            module_nodes.append(node)
+            module_lines.extend(lines[start - 1:end])
+    if module_nodes:
+        units.append(Unit(MODULE_UNIT, "module", MODULE_UNIT, module_nodes[0].lineno, module_nodes[-1].end_lineno,
+                          "".join(module_lines), _fingerprint(module_nodes)))
+    return sorted(units, key=lambda unit: unit.start)
+
+
+class FingerprintStore:
+    """Per-file record of each unit's fingerprint and the feedback it received."""
+
+    def __init__(self, store_dir=None):
+        self.store_dir = store_dir or os.path.join(cache_root(), "definitions")
+
+    def _path(self, file_path):
+        digest = hashlib.sha256(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+        return os.path.join(self.store_dir, f"{digest}.json")
+
+    def load(self, file_path):
+        try:
+            with open(self._path(file_path), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, file_path, entries):
+        try:
+            atomic_write_json(self._path(file_path), entries)
+        except OSError:
+            pass
+
+
+def incremental_feedback(file_path, code, feedback_key, get_feedback, tree=None, store=None, get_feedbacks=None,
+                         single=False):
+    """Return ``(report, stats)`` for ``code``, re-analyzing only changed units.
+
+    ``get_feedback(source)`` produces feedback for one source. When no unit
+    has feedback to reuse (the first run, or every unit changed) the whole
+    file is sent as one request, and that feedback stands for each unit until
+    the unit changes. Otherwise the changed units go to
+    ``get_feedbacks(sources)`` in one batched call. With ``single`` (hint
+    mode) the changed units are sent together and the one response is the
+    report. ``feedback_key`` identifies the mode (and hint number) so
+    feedback from a different mode is never reused.
+    """
+    store = store or FingerprintStore()
+    previous = store.load(file_path)
+    units = split_definitions(code, tree)
+    if not units:
+        return get_feedback(code), {"units": 0, "changed": 1, "reused": 0, "removed": len(previous)}
+    get_feedbacks = get_feedbacks or (lambda sources: [get_feedback(source) for source in sources])
+    entries = {}
+    for unit in units:
+        old = previous.get(unit.key, {})
+        unchanged = old.get("fingerprint") == unit.fingerprint
+        entries[unit.key] = {"fingerprint": unit.fingerprint, "feedback": old.get("feedback", {}) if unchanged else {}}
+    # Whole-file feedback per mode, and the units it still describes
+    whole_files = {key: {"feedback": record["feedback"],
+                         "units": [name for name in record["units"]
+                                   if name in entries and previous.get(name, {}).get("fingerprint")
+                                   == entries[name]["fingerprint"]]}
+                   for key, record in previous.get(FILE_UNIT, {}).items()}
+    covered = set(whole_files[feedback_key]["units"]) if feedback_key in whole_files else set()
+    pending = [unit for unit in units if unit.key not in covered
+               and (single or feedback_key not in entries[unit.key]["feedback"])]
+    stats = {"units": len(units), "changed": len(pending), "reused": len(units) - len(pending),
+             "removed": len(set(previous) - set(entries) - {FILE_UNIT})}
+
+    new = {}
+    if pending and (single or len(pending) == len(units)):
+        feedback = get_feedback(code if len(pending) == len(units) else "".join(unit.source for unit in pending))
+        whole_files[feedback_key] = {"feedback": feedback, "units": [unit.key for unit in units]}
+        if feedback.startswith("[!]"):
+            del whole_files[feedback_key]
+            store.save(file_path, dict(entries, **{FILE_UNIT: whole_files}))
+            return feedback, stats
+        covered = set(entries)
+    elif pending:
+        for unit, feedback in zip(pending, get_feedbacks([unit.source for unit in pending])):
+            new[unit.key] = feedback
+            if not feedback.startswith("[!]"):
+                entries[unit.key]["feedback"] = dict(entries[unit.key]["feedback"], **{feedback_key: feedback})
+    store.save(file_path, dict(entries, **{FILE_UNIT: whole_files}))
+
+    sections = []
+    rest = []
+    for unit in units:
+        feedback = new.get(unit.key, None if single else entries[unit.key]["feedback"].get(feedback_key))
+        if feedback is None:
+            rest.append(unit.name)
+        else:
+            status = "updated" if unit.key in new else "unchanged"
+            sections.append(f"## {unit.kind} {unit.name} (lines {unit.start}-{unit.end}) [{status}]\n{feedback}")
+    whole = whole_files.get(feedback_key, {}).get("feedback")
+    if not sections:
+        return whole, stats
+    if rest and whole is not None:
+        sections.append(f"## Rest of the file ({', '.join(rest)}) [unchanged]\n{whole}")
+    return "\n\n".join(sections), stats
@@ -0,0 +1,64 @@
+"""The hint ladder: every hint and the solution from a single generation.
+
+In ladder mode the model is asked for ``LADDER_HINTS`` hints, from the most
+general to the most specific, followed by the solution. :func:`parse_ladder`
+splits that response into sections. The mentor then stores each section
+under the cache key of the matching ``hint``/``solution`` request, so asking
+for the next hint or the solution later costs no model call.
+"""
+import re
+from typing import NamedTuple
+
+LADDER_HINTS = 3
+# A header starts its line, optionally after a markdown heading or bold marker
+_SECTION = re.compile(r"^(?:#{1,6}[ \t]*)?(?:\*\*)?(?:Hint[ \t]*(?P<hint>\d+)|(?P<solution>Solution))"
+                      r"(?:\*\*)?[ \t]*[:.)\-](?:\*\*)?[ \t]*", re.MULTILINE)
+_FENCE = re.compile(r"^[ \t]*```", re.MULTILINE)
+
+
+class Ladder(NamedTuple):
+    hints: list
+    solution: str
+
+    def step(self, mode, hint_num=1):
+        """The text a ``mode``/``hint_num`` request would show, or ``None`` if the ladder has no such step."""
+        if mode == "solution":
+            return f"Solution: {self.solution}"
+        if mode == "hint" and 1 <= hint_num <= len(self.hints):
+            return f"Hint {hint_num}: {self.hints[hint_num - 1]}"
+        return None
+
+    def format(self):
+        return "\n".join([f"Hint {number}: {hint}" for number, hint in enumerate(self.hints, 1)]
+                         + [f"Solution: {self.solution}"])
+
+
+def parse_ladder(text, hints=LADDER_HINTS):
+    """Split a ladder response into a :class:`Ladder`.
+
+    Returns ``None`` unless hints 1 to ``hints`` and the solution are all
+    present. Text before the first section is ignored, a repeated section
+    keeps its first occurrence, and lines inside code blocks are never headers.
+    """
+    sections = {}
+    fences = [match.start() for match in _FENCE.finditer(text)]
+    matches = [match for match in _SECTION.finditer(text)
+               if sum(fence < match.start() for fence in fences) % 2 == 0]
+    for match, following in zip(matches, matches[1:] + [None]):
+        body = text[match.end():following.start() if following else len(text)].strip()
+        name = "solution" if match.group("solution") else int(match.group("hint"))
+        if body and name not in sections:
+            sections[name] = body
+    if "solution" not in sections or any(number not in sections for number in range(1, hints + 1)):
+        return None
+    return Ladder([sections[number] for number in range(1, hints + 1)], sections["solution"])
+
+
+def merge_ladders(labels, ladders):
+    """Combine per-chunk ladders into one whose sections are labelled by chunk."""
+    if len(ladders) == 1:
+        return ladders[0]
+    hints = ["\n".join(f"({label}) {ladder.hints[index]}" for label, ladder in zip(labels, ladders))
+             for index in range(len(ladders[0].hints))]
+    solution = "\n\n".join(f"### {label}\n{ladder.solution}" for label, ladder in zip(labels, ladders))
+    return Ladder(hints, solution)
@@ -0,0 +1,187 @@
+"""Shared in-process flake8 runner.
+
+Replaces the ``flake8 --version`` probe plus ``flake8 <file>`` subprocess that
+every watcher used to spawn per saved file. flake8 is driven through its legacy
+Python API inside the current process; the style guide is built once and
+reused, availability is probed once, and results are cached per file by
+mtime, size and content hash. :func:`lint_source` lints unsaved code the
+same way through a temporary copy of the file.
+"""
+import hashlib
+import os
+import re
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import NamedTuple
+
+MAX_CACHED_FILES = 1024
+_FLAKE8_LINE = re.compile(r"^(?P<path>.*?):(?P<line>\d+):(?P<column>\d+): (?P<code>\w+) (?P<message>.*)$")
+
+
+class Diagnostic(NamedTuple):
+    path: str
+    line: int
+    column: int
+    code: str
+    message: str
+
+    def __str__(self):
+        return f"{self.path}:{self.line}:{self.column}: {self.code} {self.message}"
+
+
+class LintUnavailable(RuntimeError):
+    """Raised when flake8 is neither importable nor on PATH."""
+
+
+@lru_cache(maxsize=None)
+def flake8_backend():
+    """Return ``"api"``, ``"cli"`` or ``None``; probed once per process."""
+    try:
+        import flake8.api.legacy  # noqa: F401
+        return "api"
+    except ImportError:
+        pass
+    try:
+        subprocess.run(['flake8', '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+        return "cli"
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+
+def flake8_available():
+    return flake8_backend() is not None
+
+
+class LintEngine:
+    """Runs flake8 on files and memoizes the diagnostics of unchanged files."""
+
+    def __init__(self, max_cached_files=MAX_CACHED_FILES):
+        self.max_cached_files = max_cached_files
+        self._cache = OrderedDict()  # path -> (mtime_ns, size, sha256, diagnostics)
+        self._lock = threading.Lock()
+        self._style_guide = None
+        self._results = []
+
+    def _get_style_guide(self):
+        if self._style_guide is None:
+            from flake8.api import legacy
+            from flake8.formatting.base import BaseFormatter
+
+            results = self._results
+
+            class CollectingFormatter(BaseFormatter):
+                def start(self):
+                    pass
+
+                def handle(self, error):
+                    results.append(error)
+
+                def stop(self):
+                    pass
+
+            style_guide = legacy.get_style_guide()
+            style_guide.init_report(CollectingFormatter)
+            self._style_guide = style_guide
+        return self._style_guide
+
+    def _run_api(self, file_path):
+        style_guide = self._get_style_guide()
+        del self._results[:]
+        style_guide.check_files([file_path])
+        return [Diagnostic(file_path, error.line_number, error.column_number, error.code, error.text)
+                for error in self._results]
+
+    def _run_cli(self, file_path):
+        result = subprocess.run(['flake8', file_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        diagnostics = []
+        for line in result.stdout.splitlines():
+            match = _FLAKE8_LINE.match(line)
+            if match:
+                diagnostics.append(Diagnostic(match["path"], int(match["line"]), int(match["column"]),
+                                              match["code"], match["message"]))
+        return diagnostics
+
+    def lint_file(self, file_path):
+        """Return the flake8 diagnostics for ``file_path`` as a list of :class:`Diagnostic`."""
+        backend = flake8_backend()
+        if backend is None:
+            raise LintUnavailable("flake8 is not installed")
+
+        stat = os.stat(file_path)
+        with self._lock:
+            cached = self._cache.get(file_path)
+            if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                self._cache.move_to_end(file_path)
+                return list(cached[3])
+
+            with open(file_path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            if cached and cached[2] == digest:
+                diagnostics = cached[3]  # Touched but not changed
+            elif backend == "api":
+                diagnostics = self._run_api(file_path)
+            else:
+                diagnostics = self._run_cli(file_path)
+
+            self._cache[file_path] = (stat.st_mtime_ns, stat.st_size, digest, diagnostics)
+            self._cache.move_to_end(file_path)
+            while len(self._cache) > self.max_cached_files:
+                self._cache.popitem(last=False)
+            return list(diagnostics)
+
+    def lint_source(self, code, file_path):
+        """Return the flake8 diagnostics for ``code``, the unsaved content of ``file_path``.
+
+        The code is written to a file with the same name in a temporary
+        directory, so per-file settings still apply, and the diagnostics are
+        reported against ``file_path``.
+        """
+        backend = flake8_backend()
+        if backend is None:
+            raise LintUnavailable("flake8 is not installed")
+
+        key = ("source", file_path)
+        digest = hashlib.sha256(code.encode("utf-8")).hexdigest()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[2] == digest:
+                self._cache.move_to_end(key)
+                return list(cached[3])
+
+            with tempfile.TemporaryDirectory(prefix="codementor-lint-") as directory:
+                copy = os.path.join(directory, os.path.basename(file_path) or "buffer.py")
+                with open(copy, "w", encoding="utf-8") as f:
+                    f.write(code)
+                diagnostics = self._run_api(copy) if backend == "api" else self._run_cli(copy)
+            diagnostics = [diagnostic._replace(path=file_path) for diagnostic in diagnostics]
+
+            self._cache[key] = (None, len(code), digest, diagnostics)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cached_files:
+                self._cache.popitem(last=False)
+            return list(diagnostics)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+
+_engine = LintEngine()
+
+
+def lint_file(file_path):
+    """Lint ``file_path`` with the process-wide :class:`LintEngine`."""
+    return _engine.lint_file(file_path)
+
+
+def lint_source(code, file_path):
+    """Lint unsaved ``code`` of ``file_path`` with the process-wide :class:`LintEngine`."""
+    return _engine.lint_source(code, file_path)
+
+
+def clear_cache():
+    """Forget cached results so the next :func:`lint_file` call runs flake8 again."""
+    _engine.clear_cache()
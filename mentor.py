@@ -1,169 +1,925 @@
-import subprocess
-import ast
-import sys
-import os
-import re
-from huggingface_hub import login
-from transformers import pipeline
-
-def check_flake8_availability():
-    try:
-        subprocess.run(['flake8', '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
-
-def run_flake8(file_path):
-    if not check_flake8_availability():
-        return "[!] Flake8 not found. Please install it with 'pip install flake8'."
-    
-    try:
-        result = subprocess.run(
-            ['flake8', file_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        if result.returncode == 0:
-            return "[+] No style issues found."
-        else:
-            issues = result.stdout.strip().split('\n')
-            formatted_issues = "\n".join(f"  {issue}" for issue in issues if issue)
-            return f"[!] Style issues:\n{formatted_issues}"
-    except Exception as e:
-        return f"[!] Error running flake8: {str(e)}"
-
-def first_check(file_path):
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            code = f.read()
-        ast.parse(code)
-        return True, "[+] Syntax Correct", code
-    except SyntaxError as e:
-        return False, f"[X] Syntax Error: {str(e)}", code
-    except UnicodeDecodeError:
-        return False, f"[X] Error: Could not decode {file_path}. Ensure it is a valid text file.", ""
-    except IOError as e:
-        return False, f"[X] Error reading {file_path}: {str(e)}", ""
-
-def fix_common_syntax_error(code, error_msg):
-    """Fallback to fix common syntax errors if model fails."""
-    if "expected ':'" in error_msg:
-        lines = code.split('\n')
-        line_num = int(re.search(r'line (\d+)', error_msg).group(1)) - 1 if re.search(r'line (\d+)', error_msg) else 0
-        if line_num < len(lines):
-            lines[line_num] = lines[line_num].rstrip() + ':'
-            return '\n'.join(lines), "Added missing colon."
-    return code, "No automatic fix available."
-
-def generate_prompt(code, error_msg, mode, hint_num):
-    """Generate prompt based on mode."""
-    if mode == "explain":
-        prompt = f"Analyze the following Python code and provide a detailed explanation of what it does, including any potential improvements:\n\n```python\n{code}\n```"
-        if error_msg:
-            prompt += f"\nThe code has the following error: {error_msg}"
-    elif mode == "hint":
-        prompt = f"Analyze the following Python code for errors or improvements. Provide a single concise hint (hint number {hint_num}) to help the user fix or improve the code without giving the full solution:\n\n```python\n{code}\n```"
-        if error_msg:
-            prompt += f"\nThe code has the following error: {error_msg}"
-    else:  # solution
-        prompt = f"Analyze the following Python code for errors or improvements. Provide the corrected or improved version of the code with a brief explanation of the changes:\n\n```python\n{code}\n```"
-        if error_msg:
-            prompt += f"\nThe code has the following error: {error_msg}. Please fix this error."
-    return prompt
-
-def get_mentor_feedback(code, error_msg, mode, hint_num):
-    try:
-        token = os.environ.get('HF_TOKEN')
-        if not token:
-            safe_print("[!] Error: No HF_TOKEN found in environment.")
-            if mode == "solution" and error_msg:
-                fixed_code, fix_explanation = fix_common_syntax_error(code, error_msg)
-                return f"Corrected code:\n```python\n{fixed_code}\n```\nExplanation: {fix_explanation}"
-            return "[!] Error: No HF_TOKEN found in environment."
-        
-        safe_print("[*] Authenticating with Hugging Face Hub...")
-        login(token=token)
-        safe_print("[*] Loading model 'distilgpt2'...")
-        try:
-            generator = pipeline('text-generation', model='distilgpt2')
-        except Exception as model_error:
-            safe_print(f"[!] Failed to load model 'distilgpt2': {str(model_error)}")
-            if mode == "solution" and error_msg:
-                fixed_code, fix_explanation = fix_common_syntax_error(code, error_msg)
-                return f"Corrected code:\n```python\n{fixed_code}\n```\nExplanation: {fix_explanation}"
-            return f"[!] Failed to load model: {str(model_error)}"
-        
-        prompt = generate_prompt(code, error_msg, mode, hint_num)
-        safe_print(f"[*] Generating response for {mode} mode...")
-        try:
-            response = generator(prompt, max_length=500, num_return_sequences=1, truncation=True)
-            response_text = response[0]['generated_text']
-            # Validate response to ensure it’s not the prompt or garbage
-            if response_text.strip().startswith(prompt.strip()) or "def add(" in response_text:
-                safe_print("[!] Invalid model response detected.")
-                if mode == "solution" and error_msg:
-                    fixed_code, fix_explanation = fix_common_syntax_error(code, error_msg)
-                    return f"Corrected code:\n```python\n{fixed_code}\n```\nExplanation: {fix_explanation}"
-                return "[!] Invalid model response."
-            return response_text
-        except Exception as inference_error:
-            safe_print(f"[!] Failed to generate response: {str(inference_error)}")
-            if mode == "solution" and error_msg:
-                fixed_code, fix_explanation = fix_common_syntax_error(code, error_msg)
-                return f"Corrected code:\n```python\n{fixed_code}\n```\nExplanation: {fix_explanation}"
-            return f"[!] Failed to generate response: {str(inference_error)}"
-    except Exception as e:
-        safe_print(f"[!] General error in mentor feedback: {str(e)}")
-        if mode == "solution" and error_msg:
-            fixed_code, fix_explanation = fix_common_syntax_error(code, error_msg)
-            return f"Corrected code:\n```python\n{fixed_code}\n```\nExplanation: {fix_explanation}"
-        return f"[!] General error in mentor feedback: {str(e)}"
-
-def safe_print(message):
-    try:
-        print(message)
-    except UnicodeEncodeError:
-        safe_message = message.encode('ascii', 'replace').decode('ascii')
-        print(safe_message)
-
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        safe_print("Usage: python mentor.py <file_path> [mode] [hint_num]")
-        sys.exit(1)
-
-    file_path = sys.argv[1]
-    mode = sys.argv[2] if len(sys.argv) > 2 else "explain"
-    hint_num = int(sys.argv[3]) if len(sys.argv) > 3 else 1
-
-    safe_print(f"Processing file: {file_path}")
-    
-    ok, syntax_msg, code = first_check(file_path)
-    safe_print(syntax_msg)
-    
-    if not ok:
-        if mode == "hint":
-            line_num = re.search(r'line (\d+)', syntax_msg)
-            line_num = line_num.group(1) if line_num else "unknown"
-            safe_print(f"Hint {hint_num}: Check the syntax error at line {line_num}. Ensure proper syntax for Python statements, such as colons and indentation.")
-        elif mode == "solution":
-            prompt = generate_prompt(code, syntax_msg, mode, hint_num)
-            mentor_response = get_mentor_feedback(code, syntax_msg, mode, hint_num)
-            safe_print(f"Solution:\n{mentor_response}")
-        else:  # explain
-            safe_print(f"Explanation: The code contains a syntax error: {syntax_msg}")
-        sys.exit(0)
-    
-    flake_output = run_flake8(file_path)
-    safe_print(flake_output)
-    
-    if "[!]" in flake_output and mode == "hint":
-        safe_print(f"Hint {hint_num}: Address the style issues reported by flake8 to improve code quality.")
-    elif "[!]" in flake_output and mode == "solution":
-        safe_print("Solution: Run 'autopep8 --in-place <file_path>' to automatically fix style issues, then verify with flake8.")
-    
-    prompt = generate_prompt(code, "", mode, hint_num)
-    mentor_response = get_mentor_feedback(code, "", mode, hint_num)
-    safe_print(f"[*] Mentor Response ({mode} mode):\n{mentor_response}")
-
-    
\ No newline at end of file
+import time
+_PROCESS_START = time.perf_counter()
+import ast
+import sys
+import os
+import re
+import io
+import json
+import argparse
+import contextlib
+import glob
+import queue
+import subprocess
+import threading
+import telemetry
+import rules
+import prefix_cache
+from generation import (BUDGETS, CancellationToken, GenerationCancelled, StreamTrimmer, cancel_criteria,
+                        stopping_criteria, trim_response)
+from mentor_cache import FeedbackCache, PROMPT_VERSION
+from incremental import incremental_feedback
+from chunking import chunk_code
+from backends import BACKENDS, DEFAULT_BACKEND, build_pipeline
+from model_manager import IDLE_UNLOAD_SECONDS, MAX_RSS_MB, ModelManager
+from lint_engine import flake8_available, lint_file, lint_source
+from ladder import LADDER_HINTS, Ladder, merge_ladders, parse_ladder
+import diffscope
+import parse_cache
+import repair
+
+MODEL_ID = 'distilgpt2'
+MODES = ['explain', 'hint', 'solution', 'ladder']
+BACKEND = DEFAULT_BACKEND  # torch, int8 or onnx; see backends.py
+PROMPT_TOKEN_BUDGET = int(os.environ.get('CODEMENTOR_PROMPT_BUDGET', 384))  # Prompt tokens per model call; new tokens are in generation.BUDGETS
+_generator = None  # Set by set_generator() to bypass the model manager
+feedback_cache = FeedbackCache()
+# First duration of each step, for --profile-startup. transformers and
+# huggingface_hub are imported lazily, only on paths that run the model.
+startup_steps = {"import mentor": time.perf_counter() - _PROCESS_START}
+
+@contextlib.contextmanager
+def startup_step(name, stage):
+    """Time ``name`` for --profile-startup and as telemetry span ``stage``."""
+    start = time.perf_counter()
+    try:
+        with telemetry.span(stage):
+            yield
+    finally:
+        startup_steps.setdefault(name, time.perf_counter() - start)
+
+def print_startup_profile(stream=None):
+    stream = stream or sys.stderr
+    stream.write("[*] Startup profile:\n")
+    for name, seconds in startup_steps.items():
+        stream.write(f"  {name:<32} {seconds * 1000:9.1f} ms\n")
+    stream.write(f"  {'total':<32} {(time.perf_counter() - _PROCESS_START) * 1000:9.1f} ms\n")
+
+def run_flake8(file_path, code=None):
+    """Lint ``file_path``, or ``code`` as its unsaved content if given."""
+    if not flake8_available():
+        return "[!] Flake8 not found. Please install it with 'pip install flake8'."
+    
+    try:
+        diagnostics = lint_file(file_path) if code is None else lint_source(code, file_path)
+    except Exception as e:
+        return f"[!] Error running flake8: {str(e)}"
+    if not diagnostics:
+        return "[+] No style issues found."
+    formatted_issues = "\n".join(f"  {diagnostic}" for diagnostic in diagnostics)
+    return f"[!] Style issues:\n{formatted_issues}"
+
+_last_parse = (None, None)
+
+def parse_code(code):
+    """``ast.parse`` that remembers the tree of the last source only, so the syntax
+    check, diagnostics and incremental analysis of one version share a single parse
+    without keeping old versions alive. Callers must not modify the returned tree."""
+    global _last_parse
+    source, tree = _last_parse
+    if source is not code and source != code:
+        tree = ast.parse(code)
+        _last_parse = (code, tree)
+    return tree
+
+def clear_parse_cache():
+    global _last_parse
+    _last_parse = (None, None)
+
+def first_check(file_path, code=None):
+    try:
+        if code is None:
+            with open(file_path, "r", encoding="utf-8") as f:
+                code = f.read()
+        parse_code(code)
+        return True, "[+] Syntax Correct", code
+    except SyntaxError as e:
+        return False, f"[X] Syntax Error: {str(e)}", code
+    except UnicodeDecodeError:
+        return False, f"[X] Error: Could not decode {file_path}. Ensure it is a valid text file.", ""
+    except IOError as e:
+        return False, f"[X] Error reading {file_path}: {str(e)}", ""
+
+def syntax_report(code, syntax_msg):
+    """``syntax_msg``, followed by every other syntax error in the file when there are several."""
+    errors = repair.find_errors(code)
+    if len(errors) < 2:
+        return syntax_msg
+    listed = "\n".join(f"  line {error.line}, column {error.column}: {error.message}" for error in errors)
+    return f"{syntax_msg}\n[X] {len(errors)} syntax errors:\n{listed}"
+
+def repaired_feedback(code, mode):
+    """The verified local fix for a file with syntax errors in ``mode``'s format, or ``None`` if none parses."""
+    with telemetry.span("repair"):
+        fixed = repair.repair(code)
+    if not fixed.ok:
+        return None
+    solution = f"Corrected code:\n```python\n{fixed.code}\n```\nExplanation: {fixed.explanation()}"
+    if mode == "ladder":
+        error = repair.first_error(code)
+        hints = [f"Check the syntax around line {error.lineno}.", f"Line {error.lineno}: {error.msg}.", fixed.fixes[0]]
+        return Ladder(hints[:LADDER_HINTS], solution).format()
+    return solution
+
+# The fixed start of each mode's prompt. Everything that varies (code, hint
+# number, error) comes after it, so the model's key/value cache for these
+# prefixes is computed once and reused; see prefix_cache.py.
+PROMPT_PREFIXES = {
+    "explain": "Analyze the following Python code and provide a detailed explanation of what it does, including any potential improvements:\n\n```python\n",
+    "hint": "Analyze the following Python code for errors or improvements. Provide a single concise hint to help the user fix or improve the code without giving the full solution:\n\n```python\n",
+    "solution": "Analyze the following Python code for errors or improvements. Provide the corrected or improved version of the code with a brief explanation of the changes:\n\n```python\n",
+    "ladder": f"Analyze the following Python code for errors or improvements. Give exactly {LADDER_HINTS} distinct hints, from the most general to the most specific, each on its own line starting with 'Hint 1:', 'Hint 2:' and so on. Then write 'Solution:' followed by the corrected or improved version of the code with a brief explanation of the changes:\n\n```python\n",
+}
+
+def generate_prompt(code, error_msg, mode, hint_num):
+    """Generate prompt based on mode."""
+    if mode == "explain":
+        prompt = f"{PROMPT_PREFIXES['explain']}{code}\n```"
+        if error_msg:
+            prompt += f"\nThe code has the following error: {error_msg}"
+    elif mode == "hint":
+        prompt = f"{PROMPT_PREFIXES['hint']}{code}\n```\nThis is hint number {hint_num}."
+        if error_msg:
+            prompt += f"\nThe code has the following error: {error_msg}"
+    elif mode == "ladder":
+        prompt = f"{PROMPT_PREFIXES['ladder']}{code}\n```"
+        if error_msg:
+            prompt += f"\nThe code has the following error: {error_msg}. The solution should fix this error."
+    else:  # solution
+        prompt = f"{PROMPT_PREFIXES['solution']}{code}\n```"
+        if error_msg:
+            prompt += f"\nThe code has the following error: {error_msg}. Please fix this error."
+    return prompt
+
+def fallback_feedback(code, error_msg, mode, message):
+    """Return the deterministic fix for solution mode, or the error message otherwise."""
+    if mode in ("solution", "ladder") and error_msg:
+        fixed = repair.repair(code)
+        explanation = fixed.explanation() if fixed.ok else f"{fixed.explanation()} The code still does not parse."
+        return f"Corrected code:\n```python\n{fixed.code}\n```\nExplanation: {explanation}"
+    return message
+
+def build_generator(model_id, backend):
+    """Log in (once per process) and build the text-generation pipeline."""
+    global _logged_in
+    with startup_step("import transformers", "import_transformers"):
+        import transformers  # noqa: F401
+    if not _logged_in:
+        with startup_step("import huggingface_hub", "import_huggingface_hub"):
+            from huggingface_hub import login
+        safe_print("[*] Authenticating with Hugging Face Hub...")
+        with startup_step("huggingface login", "login"):
+            login(token=os.environ.get('HF_TOKEN'))
+        _logged_in = True
+    safe_print(f"[*] Loading model '{model_id}' ({backend} backend)...")
+    with startup_step(f"load model {model_id} ({backend})", "build_pipeline"):
+        return build_pipeline(model_id, backend)
+
+_logged_in = False
+models = ModelManager(build_generator, log=lambda message: safe_print(message))
+
+def load_generator():
+    """The pipeline for MODEL_ID, loaded on first use and again after the model manager unloads it."""
+    if _generator is not None:
+        return _generator
+    return models.get(MODEL_ID, BACKEND)
+
+def preload_generator():
+    """Start loading the model on a background thread, so a server can take requests meanwhile.
+
+    Requests that need the model wait for the load in progress instead of starting another.
+    """
+    def preload():
+        try:
+            load_generator()
+        except Exception as e:
+            safe_print(f"[!] Failed to preload model '{MODEL_ID}': {str(e)}")
+
+    thread = threading.Thread(target=preload, name="mentor-preload", daemon=True)
+    thread.start()
+    return thread
+
+def generator_loaded():
+    return _generator is not None or models.is_loaded(MODEL_ID, BACKEND)
+
+def set_generator(generator):
+    """Use ``generator`` (anything callable like a text-generation pipeline) instead of loading MODEL_ID."""
+    global _generator
+    _generator = generator
+
+def is_valid_response(prompt, response_text):
+    # Validate the continuation to ensure it’s not empty, the prompt again, or garbage
+    return bool(response_text.strip()) and not (response_text.strip().startswith(prompt.strip())
+                                                 or "def add(" in response_text)
+
+def generation_kwargs(generator, mode, cancel=None):
+    """Pipeline arguments for ``mode``: its token budget, and its stopping criteria if the generator has a model."""
+    budget = BUDGETS[mode]
+    kwargs = dict(budget.kwargs(), num_return_sequences=1, truncation=True)
+    if getattr(generator, "model", None) is not None:
+        kwargs['stopping_criteria'] = stopping_criteria(generator.tokenizer, budget, cancel)
+    elif cancel is not None:
+        kwargs['stopping_criteria'] = cancel_criteria(cancel)
+    return kwargs
+
+def generate_text(generator, prompt, on_token=None, cancel=None, mode="explain"):
+    """Run the pipeline on ``prompt`` and return the continuation; with ``on_token``, stream it as it is produced.
+
+    Generation follows ``mode``'s budget in generation.py and stops as soon as
+    the response is complete; the text after that point is never streamed.
+    If the :class:`CancellationToken` ``cancel`` is cancelled, generation stops
+    at the next decoding step and :class:`GenerationCancelled` is raised.
+    """
+    if cancel is not None:
+        cancel.raise_if_cancelled()
+    kwargs = generation_kwargs(generator, mode, cancel)
+    if on_token is None:
+        text = prefix_cache.generate(generator, [prompt], PROMPT_PREFIXES.values(), **kwargs)[0]
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        return trim_response(prompt, text, BUDGETS[mode])
+
+    from transformers import TextIteratorStreamer
+
+    streamer = TextIteratorStreamer(generator.tokenizer, skip_prompt=True, skip_special_tokens=True)
+    result = {}
+
+    def run():
+        try:
+            result['output'] = prefix_cache.generate(generator, [prompt], PROMPT_PREFIXES.values(),
+                                                     streamer=streamer, **kwargs)[0]
+        except Exception as e:
+            result['error'] = e
+            streamer.end()  # Unblock the consumer loop below
+
+    thread = threading.Thread(target=run, name="mentor-generate", daemon=True)
+    thread.start()
+    trimmer = StreamTrimmer(BUDGETS[mode], on_token)
+    for text in streamer:
+        if text:
+            trimmer.feed(text)
+    thread.join()
+    if 'error' in result:
+        raise result['error']
+    if cancel is not None:
+        cancel.raise_if_cancelled()
+    return trimmer.finish()
+
+def generate_texts(generator, prompts, batch_size=None, cancel=None, modes=None):
+    """Generate for several prompts as padded batches; returns their continuations in order.
+
+    Prompts are generated in groups of the same mode (``modes``, one per
+    prompt; explain by default), each with that mode's budget.
+    """
+    if generator.tokenizer.pad_token is None:
+        generator.tokenizer.pad_token = generator.tokenizer.eos_token
+    generator.tokenizer.padding_side = "left"  # Decoder-only models generate from the right edge
+    if cancel is not None:
+        cancel.raise_if_cancelled()
+    modes = modes or ["explain"] * len(prompts)
+    texts = [None] * len(prompts)
+    for mode in dict.fromkeys(modes):
+        indices = [index for index, prompt_mode in enumerate(modes) if prompt_mode == mode]
+        group = [prompts[index] for index in indices]
+        outputs = prefix_cache.generate(generator, group, PROMPT_PREFIXES.values(),
+                                        batch_size=batch_size or len(group),
+                                        **generation_kwargs(generator, mode, cancel))
+        for index, prompt, text in zip(indices, group, outputs):
+            texts[index] = trim_response(prompt, text, BUDGETS[mode])
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+    return texts
+
+def count_tokens(generator, text):
+    return len(generator.tokenizer.encode(text))
+
+def count_generated_tokens(generator, texts):
+    """Tokens the model produced for the continuations ``texts``."""
+    return sum(count_tokens(generator, text) for text in texts)
+
+def build_prompts(generator, code, error_msg, mode, hint_num):
+    """Return ``[(label, prompt)]``: one prompt, or one per chunk if the code exceeds the token budget."""
+    def prompt_tokens(text):
+        return count_tokens(generator, text)
+
+    overhead = prompt_tokens(generate_prompt("", error_msg, mode, hint_num))
+    chunks = chunk_code(code, prompt_tokens, max(PROMPT_TOKEN_BUDGET - overhead, 32))
+    if len(chunks) == 1:
+        return [(None, generate_prompt(code, error_msg, mode, hint_num))]
+    return [(f"Lines {chunk.start}-{chunk.end}", generate_prompt(chunk.text, error_msg, mode, hint_num))
+            for chunk in chunks]
+
+def merge_responses(prompts, texts):
+    """Combine per-chunk responses into one report, or ``None`` if none is valid."""
+    if len(prompts) == 1:
+        return texts[0] if is_valid_response(prompts[0][1], texts[0]) else None
+    sections = []
+    for (label, prompt), text in zip(prompts, texts):
+        sections.append((label, text if is_valid_response(prompt, text) else None))
+    if all(text is None for _, text in sections):
+        return None
+    return "\n\n".join(f"### {label}\n{text or '[!] Invalid model response.'}" for label, text in sections)
+
+def store_ladder(code, error_msg, prompts, texts):
+    """Parse ladder responses and cache each hint and the solution as if it had been requested on its own.
+
+    Returns the formatted ladder, or falls back to :func:`merge_responses`
+    when the model did not produce every section.
+    """
+    ladders = [parse_ladder(text) for text in texts]
+    if any(ladder is None for ladder in ladders):
+        safe_print("[!] Could not find every hint and the solution in the ladder response.")
+        return merge_responses(prompts, texts)
+    ladder = merge_ladders([label for label, _ in prompts], ladders)
+    for hint_num in range(1, len(ladder.hints) + 1):
+        feedback_cache.put(feedback_cache.key(code, error_msg, "hint", hint_num, MODEL_ID), ladder.step("hint", hint_num))
+    feedback_cache.put(feedback_cache.key(code, error_msg, "solution", 1, MODEL_ID), ladder.step("solution"))
+    return ladder.format()
+
+def get_mentor_feedback(code, error_msg, mode, hint_num, on_token=None, cancel=None):
+    try:
+        with telemetry.span("cache_lookup"):
+            cache_key = feedback_cache.key(code, error_msg, mode, hint_num, MODEL_ID)
+            cached = feedback_cache.get(cache_key)
+        if cached is not None:
+            safe_print("[*] Using cached mentor feedback.")
+            if on_token:
+                on_token(cached)
+            return cached
+
+        token = os.environ.get('HF_TOKEN')
+        if not token and not generator_loaded():
+            safe_print("[!] Error: No HF_TOKEN found in environment.")
+            return fallback_feedback(code, error_msg, mode, "[!] Error: No HF_TOKEN found in environment.")
+
+        try:
+            generator = load_generator()
+        except Exception as model_error:
+            safe_print(f"[!] Failed to load model '{MODEL_ID}': {str(model_error)}")
+            return fallback_feedback(code, error_msg, mode, f"[!] Failed to load model: {str(model_error)}")
+        
+        safe_print(f"[*] Generating response for {mode} mode...")
+        try:
+            with telemetry.span("build_prompts"):
+                prompts = build_prompts(generator, code, error_msg, mode, hint_num)
+            prompt_texts = [prompt for _, prompt in prompts]
+            with telemetry.span("generate", chunks=len(prompts),
+                                prompt_tokens=sum(count_tokens(generator, prompt) for prompt in prompt_texts)) as stats:
+                if len(prompts) == 1:
+                    texts = [generate_text(generator, prompts[0][1], on_token, cancel, mode)]
+                elif on_token:
+                    safe_print(f"[*] Code exceeds {PROMPT_TOKEN_BUDGET} prompt tokens; analyzing {len(prompts)} chunks.")
+                    texts = []
+                    for label, prompt in prompts:
+                        on_token(f"\n### {label}\n")
+                        texts.append(generate_text(generator, prompt, on_token, cancel, mode))
+                else:
+                    safe_print(f"[*] Code exceeds {PROMPT_TOKEN_BUDGET} prompt tokens; analyzing {len(prompts)} chunks.")
+                    texts = generate_texts(generator, prompt_texts, cancel=cancel, modes=[mode] * len(prompt_texts))
+                stats["generated_tokens"] = count_generated_tokens(generator, texts)
+            if mode == "ladder":
+                response_text = store_ladder(code, error_msg, prompts, texts)
+            else:
+                response_text = merge_responses(prompts, texts)
+            if response_text is None:
+                safe_print("[!] Invalid model response detected.")
+                return fallback_feedback(code, error_msg, mode, "[!] Invalid model response.")
+            feedback_cache.put(cache_key, response_text)
+            return response_text
+        except GenerationCancelled:
+            raise
+        except Exception as inference_error:
+            safe_print(f"[!] Failed to generate response: {str(inference_error)}")
+            return fallback_feedback(code, error_msg, mode, f"[!] Failed to generate response: {str(inference_error)}")
+    except GenerationCancelled:
+        raise
+    except Exception as e:
+        safe_print(f"[!] General error in mentor feedback: {str(e)}")
+        return fallback_feedback(code, error_msg, mode, f"[!] General error in mentor feedback: {str(e)}")
+
+def get_mentor_feedback_batch(requests, batch_size=8):
+    """Answer many ``(code, error_msg, mode, hint_num)`` requests with one pipeline call.
+
+    Cached requests are answered from the cache; the rest (split into chunks
+    when they exceed the prompt budget) are generated as padded batches of
+    ``batch_size`` prompts by the single loaded pipeline.
+    """
+    responses = [None] * len(requests)
+    pending = []
+    for index, (code, error_msg, mode, hint_num) in enumerate(requests):
+        cache_key = feedback_cache.key(code, error_msg, mode, hint_num, MODEL_ID)
+        cached = feedback_cache.get(cache_key)
+        if cached is not None:
+            responses[index] = cached
+        else:
+            pending.append((index, cache_key))
+    if not pending:
+        return responses
+
+    def fail_pending(message):
+        for index, _ in pending:
+            code, error_msg, mode, _ = requests[index]
+            responses[index] = fallback_feedback(code, error_msg, mode, message)
+        return responses
+
+    if not os.environ.get('HF_TOKEN') and not generator_loaded():
+        safe_print("[!] Error: No HF_TOKEN found in environment.")
+        return fail_pending("[!] Error: No HF_TOKEN found in environment.")
+    try:
+        generator = load_generator()
+    except Exception as model_error:
+        safe_print(f"[!] Failed to load model '{MODEL_ID}': {str(model_error)}")
+        return fail_pending(f"[!] Failed to load model: {str(model_error)}")
+
+    with telemetry.span("build_prompts"):
+        prompts_by_request = [build_prompts(generator, *requests[index]) for index, _ in pending]
+    flat_prompts = [prompt for prompts in prompts_by_request for _, prompt in prompts]
+    flat_modes = [requests[index][2] for (index, _), prompts in zip(pending, prompts_by_request) for _ in prompts]
+    safe_print(f"[*] Generating {len(flat_prompts)} responses in batches of {batch_size}...")
+    try:
+        with telemetry.span("generate", chunks=len(flat_prompts),
+                            prompt_tokens=sum(count_tokens(generator, prompt) for prompt in flat_prompts)) as stats:
+            flat_texts = generate_texts(generator, flat_prompts, batch_size, modes=flat_modes)
+            stats["generated_tokens"] = count_generated_tokens(generator, flat_texts)
+    except Exception as inference_error:
+        safe_print(f"[!] Failed to generate response: {str(inference_error)}")
+        return fail_pending(f"[!] Failed to generate response: {str(inference_error)}")
+
+    offset = 0
+    for (index, cache_key), prompts in zip(pending, prompts_by_request):
+        code, error_msg, mode, _ = requests[index]
+        texts = flat_texts[offset:offset + len(prompts)]
+        offset += len(prompts)
+        if mode == "ladder":
+            response_text = store_ladder(code, error_msg, prompts, texts)
+        else:
+            response_text = merge_responses(prompts, texts)
+        if response_text is None:
+            responses[index] = fallback_feedback(code, error_msg, mode, "[!] Invalid model response.")
+            continue
+        feedback_cache.put(cache_key, response_text)
+        responses[index] = response_text
+    return responses
+
+def safe_print(message):
+    try:
+        print(message)
+    except UnicodeEncodeError:
+        safe_message = message.encode('ascii', 'replace').decode('ascii')
+        print(safe_message)
+
+def run_mentor(file_path, mode="explain", hint_num=1, code=None, on_token=None, incremental=True, cancel=None):
+    """Run the syntax, style and mentor stages for one file, printing the report.
+
+    ``on_token`` receives model output incrementally while it is generated.
+    ``cancel`` is a :class:`CancellationToken` that aborts generation.
+    With ``incremental``, only top-level definitions that changed since the
+    previous run of this file are sent to the model.
+    """
+    safe_print(f"Processing file: {file_path}")
+    buffer = code  # Unsaved content sent by an editor, if any; lint that rather than the file on disk
+    
+    with startup_step("syntax check", "first_check"):
+        ok, syntax_msg, code = first_check(file_path, code)
+    safe_print(syntax_report(code, syntax_msg) if not ok and code else syntax_msg)
+    
+    if not ok:
+        repaired = repaired_feedback(code, mode) if code and mode in ("solution", "ladder") else None
+        if repaired is not None:  # Verified to parse, so the model is not needed
+            safe_print(f"{'Solution' if mode == 'solution' else 'Hints and solution'}:\n{repaired}")
+        elif mode == "hint":
+            line_num = re.search(r'line (\d+)', syntax_msg)
+            line_num = line_num.group(1) if line_num else "unknown"
+            safe_print(f"Hint {hint_num}: Check the syntax error at line {line_num}. Ensure proper syntax for Python statements, such as colons and indentation.")
+        elif mode == "solution":
+            mentor_response = get_mentor_feedback(code, syntax_msg, mode, hint_num, on_token, cancel)
+            safe_print(f"Solution:\n{mentor_response}")
+        elif mode == "ladder":
+            mentor_response = get_mentor_feedback(code, syntax_msg, mode, hint_num, on_token, cancel)
+            safe_print(f"Hints and solution:\n{mentor_response}")
+        else:  # explain
+            safe_print(f"Explanation: The code contains a syntax error: {syntax_msg}")
+        return
+    
+    with startup_step("flake8 (first run)", "flake8"):
+        flake_output = run_flake8(file_path, buffer)
+    safe_print(flake_output)
+    
+    if "[!]" in flake_output and mode == "hint":
+        safe_print(f"Hint {hint_num}: Address the style issues reported by flake8 to improve code quality.")
+    elif "[!]" in flake_output and mode == "solution":
+        safe_print("Solution: Run 'autopep8 --in-place <file_path>' to automatically fix style issues, then verify with flake8.")
+    
+    if incremental:
+        feedback_key = f"{MODEL_ID}:{PROMPT_VERSION}:{mode}:{hint_num if mode == 'hint' else ''}"
+        mentor_response, stats = incremental_feedback(
+            file_path, code, feedback_key,
+            lambda source: get_mentor_feedback(source, "", mode, hint_num, on_token, cancel),
+            tree=parse_code(code),
+            get_feedbacks=lambda sources: get_mentor_feedback_batch([(source, "", mode, hint_num) for source in sources]),
+            single=mode == "hint")
+        safe_print(f"[*] Incremental analysis: {stats['changed']} changed, {stats['reused']} unchanged "
+                   f"of {stats['units']} definitions.")
+    else:
+        mentor_response = get_mentor_feedback(code, "", mode, hint_num, on_token, cancel)
+    safe_print(f"[*] Mentor Response ({mode} mode):\n{mentor_response}")
+
+def collect_python_files(target):
+    """Expand a directory (recursively) or a glob pattern into Python file paths."""
+    if os.path.isdir(target):
+        paths = []
+        for root, dirs, files in os.walk(target):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.') and d != '__pycache__')
+            paths.extend(os.path.join(root, name) for name in sorted(files) if name.endswith('.py'))
+        return paths
+    return sorted(path for path in glob.glob(target, recursive=True) if path.endswith('.py') and os.path.isfile(path))
+
+def cheap_stages(file_path, mode, hint_num):
+    """Syntax check and lint one file; runs in a worker process in batch mode."""
+    record = {"file": file_path, "timings": {}}
+    start = time.perf_counter()
+    ok, syntax_msg, code = first_check(file_path)
+    record["timings"]["syntax"] = time.perf_counter() - start
+    record["syntax_ok"] = ok
+    record["syntax"] = syntax_msg
+
+    if not ok:
+        if code:
+            record["syntax_errors"] = [error._asdict() for error in repair.find_errors(code)]
+        repaired = repaired_feedback(code, mode) if code and mode in ("solution", "ladder") else None
+        if repaired is not None:
+            record["feedback"] = repaired
+        elif mode in ("solution", "ladder"):
+            record["model_request"] = (code, syntax_msg, mode, hint_num)
+        elif mode == "hint":
+            line_num = re.search(r'line (\d+)', syntax_msg)
+            line_num = line_num.group(1) if line_num else "unknown"
+            record["feedback"] = f"Hint {hint_num}: Check the syntax error at line {line_num}. Ensure proper syntax for Python statements, such as colons and indentation."
+        else:
+            record["feedback"] = f"Explanation: The code contains a syntax error: {syntax_msg}"
+        return record
+
+    start = time.perf_counter()
+    try:
+        record["lint"] = [diagnostic._asdict() for diagnostic in lint_file(file_path)]
+    except Exception as e:
+        record["lint_error"] = str(e)
+    record["timings"]["lint"] = time.perf_counter() - start
+    record["model_request"] = (code, "", mode, hint_num)
+    return record
+
+def run_batch(target, mode="explain", hint_num=1, jobs=None, batch_size=8):
+    """Analyze every Python file under ``target``, streaming one NDJSON record per file.
+
+    Syntax checking and linting run in a process pool; files that need model
+    feedback are queued and sent to the single loaded pipeline in batches.
+    The run ends with a summary record of throughput and per-stage time.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    out = sys.stdout
+    sys.stdout = sys.stderr  # Progress messages must not interleave with NDJSON records
+    started = time.perf_counter()
+    files = collect_python_files(target)
+    stage_seconds = {"syntax": 0.0, "lint": 0.0, "model": 0.0}
+    counts = {"files": 0, "syntax_errors": 0, "lint_findings": 0, "model_requests": 0}
+
+    def emit(record):
+        record.pop("model_request", None)
+        counts["files"] += 1
+        write_frame(out, record)
+
+    def flush_model_queue(queue):
+        if not queue:
+            return
+        start = time.perf_counter()
+        responses = get_mentor_feedback_batch([record["model_request"] for record in queue], batch_size)
+        elapsed = time.perf_counter() - start
+        stage_seconds["model"] += elapsed
+        counts["model_requests"] += len(queue)
+        for record, response in zip(queue, responses):
+            record["feedback"] = response
+            record["timings"]["model"] = elapsed / len(queue)
+            emit(record)
+        del queue[:]
+
+    if jobs is None:
+        jobs = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    model_queue = []
+    with ProcessPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = [pool.submit(cheap_stages, path, mode, hint_num) for path in files]
+        for future in as_completed(futures):
+            record = future.result()
+            for stage, seconds in record["timings"].items():
+                stage_seconds[stage] += seconds
+            counts["syntax_errors"] += not record["syntax_ok"]
+            counts["lint_findings"] += len(record.get("lint", []))
+            if "model_request" in record:
+                model_queue.append(record)
+                if len(model_queue) >= batch_size:
+                    flush_model_queue(model_queue)
+            else:
+                emit(record)
+    flush_model_queue(model_queue)
+
+    elapsed = time.perf_counter() - started
+    summary = dict(counts, elapsed_s=round(elapsed, 3),
+                   files_per_s=round(counts["files"] / elapsed, 2) if elapsed else 0.0,
+                   stage_seconds={stage: round(seconds, 3) for stage, seconds in stage_seconds.items()},
+                   jobs=jobs, cache=feedback_cache.stats())
+    write_frame(out, {"summary": summary})
+    sys.stdout = out
+    return summary
+
+FLAKE8_EQUIVALENTS = {"E0602": "F821"}  # Built-in rule code -> flake8 code for the same problem
+
+def diff_stages(file_path, ranges, mode, hint_num):
+    """Syntax check and lint one changed file, keeping findings inside the changed regions; runs in a worker process.
+
+    flake8 and the built-in rules run on the whole file, since pyflakes needs
+    the whole module to find unused imports and undefined names; only their
+    findings are filtered by region.
+    """
+    record = {"file": file_path, "changed": ranges, "timings": {}, "findings": []}
+    start = time.perf_counter()
+    ok, syntax_msg, code = first_check(file_path)
+    record["timings"]["syntax"] = time.perf_counter() - start
+    if not ok:
+        # Reported wherever they are: nothing else in the file can be checked
+        errors = repair.find_errors(code) if code else []
+        if not errors:
+            line_num = re.search(r'line (\d+)', syntax_msg)
+            errors = [repair.SyntaxIssue(int(line_num.group(1)) if line_num else 1, 1, syntax_msg.replace("[X] ", "", 1))]
+        record["findings"] = [{"line": error.line, "column": error.column, "code": "E0001", "message": error.message}
+                              for error in errors]
+        return record
+
+    start = time.perf_counter()
+    tree = parse_code(code)
+    scoped = diffscope.regions(code, ranges, tree)
+    record["regions"] = [{"name": region.name, "start": region.start, "end": region.end} for region in scoped]
+    findings = {}
+    try:
+        for diagnostic in lint_file(file_path):
+            findings[(diagnostic.line, diagnostic.code)] = {"line": diagnostic.line, "column": diagnostic.column,
+                                                            "code": diagnostic.code, "message": diagnostic.message}
+    except Exception as e:
+        record["lint_error"] = str(e)
+    for finding in rules.check_code(code, tree):
+        if (finding.line, FLAKE8_EQUIVALENTS.get(finding.code, finding.code)) in findings:
+            continue  # flake8 already reported it
+        findings.setdefault((finding.line, finding.code), {"line": finding.line, "column": finding.column + 1,
+                                                           "code": finding.code, "message": finding.message})
+    record["findings"] = [finding for key, finding in sorted(findings.items()) if diffscope.in_regions(key[0], scoped)]
+    record["timings"]["lint"] = time.perf_counter() - start
+    record["model_requests"] = [(region.source, "", mode, hint_num) for region in scoped]
+    return record
+
+def run_diff(rev_range, mode="explain", hint_num=1, jobs=None, batch_size=8, model=True, report_path=None):
+    """Analyze only the lines ``rev_range`` changed and the functions around them; returns the exit status.
+
+    Changed files are checked in a process pool. The changed regions of every
+    file are then sent to the model in shared batches. A JSON report is written
+    to ``report_path`` (stdout by default), and the status is 1 if any finding
+    falls inside a changed region.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    out = sys.stdout
+    sys.stdout = sys.stderr  # Progress messages must not end up in the report
+    started = time.perf_counter()
+    changed = diffscope.changed_files(rev_range)
+    root = diffscope.git_root()
+    stage_seconds = {"syntax": 0.0, "lint": 0.0, "model": 0.0}
+    if jobs is None:
+        jobs = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    records = []
+    if changed:
+        with ProcessPoolExecutor(max_workers=max(1, min(jobs, len(changed)))) as pool:
+            futures = [pool.submit(diff_stages, path, ranges, mode, hint_num) for path, ranges in sorted(changed.items())]
+            records = [future.result() for future in futures]
+    for record in records:
+        for stage, seconds in record.pop("timings").items():
+            stage_seconds[stage] += seconds
+        record["file"] = os.path.relpath(record["file"], root)
+
+    requests = [request for record in records for request in record.get("model_requests", [])]
+    if model and requests:
+        start = time.perf_counter()
+        responses = iter(get_mentor_feedback_batch(requests, batch_size))
+        stage_seconds["model"] = time.perf_counter() - start
+        for record in records:
+            for region, _ in zip(record.get("regions", []), record.get("model_requests", [])):
+                region["feedback"] = next(responses)
+    for record in records:
+        record.pop("model_requests", None)
+
+    findings = sum(len(record["findings"]) for record in records)
+    summary = {"range": rev_range, "files": len(records), "regions": len(requests), "findings": findings,
+               "model_requests": len(requests) if model else 0, "elapsed_s": round(time.perf_counter() - started, 3),
+               "stage_seconds": {stage: round(seconds, 3) for stage, seconds in stage_seconds.items()}, "jobs": jobs}
+    report = json.dumps({"files": records, "summary": summary}, indent=2)
+    safe_print(f"[*] {summary['files']} changed files, {summary['regions']} regions, {findings} findings "
+               f"in {summary['elapsed_s']} s.")
+    sys.stdout = out
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        out.write(report + "\n")
+    return 1 if findings else 0
+
+def write_frame(stream, message):
+    """Write one protocol frame: a single line of JSON, flushed immediately."""
+    stream.write(json.dumps(message) + "\n")
+    stream.flush()
+
+DIAGNOSE_BUFFER = "<buffer>"  # parse_cache key for buffers sent without a file path
+
+def diagnose(code, file_path=None):
+    """Fast diagnostics for an unsaved buffer: every syntax error, or the built-in rule findings.
+
+    Runs in well under a millisecond per KB, so editors can call it on every
+    keystroke; flake8 and the model only run on save. Syntax errors are read
+    from the incrementally updated parso tree of ``file_path`` (see
+    parse_cache.py) rather than by repairing the code error by error.
+    """
+    try:
+        tree = parse_code(code)
+    except SyntaxError:
+        return [{"line": error.line, "column": max(error.column - 1, 0), "code": "E0001",
+                 "rule": "syntax-error", "message": error.message, "severity": "error"}
+                for error in parse_cache.syntax_errors(file_path or DIAGNOSE_BUFFER, code)]
+    return [dict(finding._asdict(), severity=rules.RULES[finding.rule].severity)
+            for finding in rules.check_code(code, tree)]
+
+def handle_request(request, emit=None, cancel=None):
+    """Run one server request and return its response frame.
+
+    With ``"stream": true`` in the request, generated text is also sent
+    through ``emit`` as ``{"id", "event": "token", "text"}`` frames. If
+    ``cancel`` is cancelled the response is ``{"id", "ok": false, "cancelled": true}``.
+    """
+    def emit_token(text):
+        emit({"id": request.get("id"), "event": "token", "text": text})
+
+    on_token = emit_token if request.get("stream") and emit else None
+    buffer = io.StringIO()
+    start = time.perf_counter()
+    with telemetry.collect() as spans:
+        try:
+            with contextlib.redirect_stdout(buffer), \
+                    telemetry.span("request", file_path=request.get("file_path"), mode=request.get("mode", "explain")):
+                run_mentor(request["file_path"], request.get("mode", "explain"),
+                           int(request.get("hint_num", 1)), request.get("code"), on_token,
+                           request.get("incremental", True), cancel)
+            response = {"id": request.get("id"), "ok": True, "output": buffer.getvalue(), "cache": feedback_cache.stats(),
+                        "models": models.report()}
+        except GenerationCancelled:
+            response = {"id": request.get("id"), "ok": False, "cancelled": True, "output": buffer.getvalue()}
+        except Exception as e:
+            response = {"id": request.get("id"), "ok": False, "error": str(e), "output": buffer.getvalue()}
+    response["timings"] = telemetry.breakdown(spans, time.perf_counter() - start)
+    telemetry.write_metrics()
+    return response
+
+def serve():
+    """Serve requests as newline-delimited JSON frames on stdin/stdout.
+
+    Each request is ``{"id", "file_path", "code", "mode", "hint_num"}`` and is
+    answered with ``{"id", "ok", "output", "timings"}`` (or ``"error"``), preceded by
+    token frames when ``"stream"`` is set. The model is
+    loaded once and reused, so only the first request pays the cold start;
+    with ``HF_TOKEN`` set it starts loading in the background right away.
+
+    Requests run one at a time on a worker thread while this thread keeps
+    reading frames. ``{"op": "cancel", "id"}`` cancels a queued or running
+    request, and a new request for a file cancels the older ones for the
+    same file; both are answered with ``"cancelled": true``.
+    ``{"op": "diagnose", "id", "code", "file_path"}`` is answered immediately with
+    ``{"id", "ok", "diagnostics"}`` from :func:`diagnose`.
+    """
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr  # Keep stray prints off the protocol channel
+    write_lock = threading.Lock()
+
+    def emit(frame):
+        with write_lock:
+            write_frame(protocol_out, frame)
+
+    emit({"event": "ready", "pid": os.getpid()})
+    if os.environ.get('HF_TOKEN'):
+        preload_generator()  # Diagnose frames are answered while the model loads
+
+    work = queue.Queue()
+    tokens = {}  # request id -> CancellationToken for queued and running requests
+    latest_by_file = {}  # file_path -> id of its newest request
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            request, cancel = item
+            if cancel.cancelled:
+                response = {"id": request.get("id"), "ok": False, "cancelled": True, "output": ""}
+            else:
+                response = handle_request(request, emit, cancel)
+            with lock:
+                tokens.pop(request.get("id"), None)
+                if latest_by_file.get(request.get("file_path")) == request.get("id"):
+                    del latest_by_file[request.get("file_path")]
+            emit(response)
+
+    thread = threading.Thread(target=worker, name="mentor-worker", daemon=True)
+    thread.start()
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            emit({"id": None, "ok": False, "error": f"Invalid request frame: {str(e)}"})
+            continue
+        if request.get("op") == "diagnose":  # Answered right away, even while a request is generating
+            with telemetry.span("diagnose"):
+                diagnostics = diagnose(request.get("code") or "", request.get("file_path"))
+                emit({"id": request.get("id"), "ok": True, "diagnostics": diagnostics})
+            continue
+        with lock:
+            if request.get("op") == "cancel":
+                if request.get("id") in tokens:
+                    tokens[request["id"]].cancel()
+                continue
+            previous = latest_by_file.get(request.get("file_path"))
+            if previous in tokens:
+                tokens[previous].cancel()  # Superseded by a newer version of the same file
+            cancel = CancellationToken()
+            tokens[request.get("id")] = cancel
+            latest_by_file[request.get("file_path")] = request.get("id")
+        work.put((request, cancel))
+    work.put(None)
+    thread.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Syntax, style and AI mentor feedback for a Python file.")
+    parser.add_argument("file_path", nargs="?", help="Python file to analyze")
+    parser.add_argument("mode", nargs="?", choices=MODES, default='explain', help="Mentor response mode ('ladder': every hint and the solution at once)")
+    parser.add_argument("hint_num", nargs="?", type=int, default=1, help="Hint number for 'hint' mode")
+    parser.add_argument("--server", action="store_true", help="Keep the model loaded and serve JSON requests on stdin/stdout")
+    parser.add_argument("--mode", dest="mode_option", choices=MODES, help="Mentor response mode (same as the positional argument)")
+    parser.add_argument("--hint-num", dest="hint_num_option", type=int, help="Hint number (same as the positional argument)")
+    parser.add_argument("--no-cache", action="store_false", dest="cache", help="Always run the model, ignoring cached feedback")
+    parser.add_argument("--full-file", action="store_false", dest="incremental", help="Send the whole file to the model instead of only changed definitions")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND, help="Inference backend: full-precision torch, int8-quantized torch, or ONNX Runtime")
+    parser.add_argument("--idle-unload", type=float, default=IDLE_UNLOAD_SECONDS, metavar="SECONDS", help="Unload the model after this many idle seconds; 0 keeps it loaded (default: $CODEMENTOR_IDLE_UNLOAD or 900)")
+    parser.add_argument("--max-rss-mb", type=float, default=MAX_RSS_MB, metavar="MB", help="Unload least recently used models while the process RSS is above this (default: $CODEMENTOR_MAX_RSS_MB, no limit)")
+    parser.add_argument("--model-report", action="store_true", help="Print the resident size of each loaded model before exiting (to stderr)")
+    parser.add_argument("--profile-startup", action="store_true", help="Print how long each import and initialization step took (to stderr)")
+    parser.add_argument("--trace", metavar="PATH", help="Write timing spans as NDJSON to PATH, or 'stderr' (default: $CODEMENTOR_TRACE)")
+    parser.add_argument("--metrics", metavar="PATH", help="Write aggregated stage metrics in Prometheus text format to PATH on exit (default: $CODEMENTOR_METRICS)")
+    parser.add_argument("--batch", metavar="DIR_OR_GLOB", help="Analyze every Python file in a directory or glob and stream NDJSON results")
+    parser.add_argument("--jobs", type=int, help="Worker processes for --batch (default: available cores)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Prompts per model call in --batch and --diff mode")
+    parser.add_argument("--diff", metavar="REV_RANGE", help="Only analyze the lines changed in a git revision range ('staged' for the index) and the functions around them; exits 1 if there are findings")
+    parser.add_argument("--report", metavar="PATH", help="Write the --diff JSON report to PATH instead of stdout")
+    parser.add_argument("--no-model", action="store_false", dest="model", help="In --diff mode, only run the syntax and lint checks")
+    args = parser.parse_args()
+    telemetry.configure(args.trace, args.metrics)
+    if not args.cache:
+        feedback_cache.enabled = False
+    BACKEND = args.backend
+    models.idle_unload = args.idle_unload
+    models.max_rss_mb = args.max_rss_mb
+    mode = args.mode_option or args.mode
+    hint_num = args.hint_num_option or args.hint_num
+
+    if args.server:
+        serve()
+        sys.exit(0)
+    if args.diff:
+        try:
+            status = run_diff(args.diff, mode, hint_num, args.jobs, args.batch_size, args.model, args.report)
+        except subprocess.CalledProcessError as e:
+            safe_print(f"[X] git diff failed: {e.stderr.strip()}")
+            status = 2
+        sys.exit(status)
+    if args.batch:
+        run_batch(args.batch, mode, hint_num, args.jobs, args.batch_size)
+        if args.profile_startup:
+            print_startup_profile()
+        if args.model_report:
+            sys.stderr.write(models.format_report() + "\n")
+        sys.exit(0)
+    if not args.file_path:
+        safe_print("Usage: python mentor.py <file_path> [mode] [hint_num]")
+        sys.exit(1)
+
+    with telemetry.span("run", file_path=args.file_path, mode=mode):
+        run_mentor(args.file_path, mode, hint_num, incremental=args.incremental)
+    if args.profile_startup:
+        print_startup_profile()
+    if args.model_report:
+        sys.stderr.write(models.format_report() + "\n")
@@ -0,0 +1,132 @@
+"""Persistent, content-addressed cache for mentor feedback.
+
+Entries are keyed by a normalized form of the code (its AST, so whitespace and
+comments do not matter) together with everything else that shapes the prompt:
+mode, hint number, error message, model id and prompt template version. Each
+entry is one JSON file written atomically, so several mentor processes can
+share the same directory.
+"""
+import ast
+import hashlib
+import io
+import json
+import os
+import tempfile
+import tokenize
+
+PROMPT_VERSION = 2  # Bump whenever generate_prompt() templates change
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "codementor")
+DEFAULT_MAX_ENTRIES = 512
+
+
+def cache_root():
+    """Directory shared by all CodeMentor on-disk caches."""
+    return os.environ.get("CODEMENTOR_CACHE_DIR", DEFAULT_CACHE_DIR)
+
+
+def normalize_code(code):
+    """Return a representation of ``code`` that ignores formatting and comments."""
+    try:
+        return ast.dump(ast.parse(code))
+    except (SyntaxError, ValueError):
+        pass
+    # Code that does not parse: drop comments and blank lines token by token
+    try:
+        tokens = tokenize.generate_tokens(io.StringIO(code).readline)
+        return repr([(tok.type, tok.string) for tok in tokens
+                     if tok.type not in (tokenize.COMMENT, tokenize.NL)])
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return "\n".join(line.rstrip() for line in code.splitlines() if line.strip())
+
+
+def atomic_write_text(path, text):
+    """Write ``text`` to ``path`` without readers ever seeing a partial file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path, data):
+    """Write ``data`` as JSON to ``path`` without readers ever seeing a partial file."""
+    atomic_write_text(path, json.dumps(data))
+
+
+class FeedbackCache:
+    """Size-bounded LRU cache of mentor responses stored as one file per entry."""
+
+    def __init__(self, cache_dir=None, max_entries=None):
+        self.cache_dir = cache_dir or os.path.join(cache_root(), "feedback")
+        if max_entries is None:
+            max_entries = int(os.environ.get("CODEMENTOR_CACHE_SIZE", DEFAULT_MAX_ENTRIES))
+        self.max_entries = max_entries
+        self.enabled = os.environ.get("CODEMENTOR_CACHE", "1") != "0"
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, code, error_msg, mode, hint_num, model_id):
+        # hint_num only changes the prompt in hint mode
+        hint = int(hint_num) if mode == "hint" else None
+        material = json.dumps([normalize_code(code), error_msg or "", mode, hint, model_id, PROMPT_VERSION])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)["response"]
+            os.utime(path)  # Mark as recently used for LRU eviction
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key, response):
+        if not self.enabled:
+            return
+        try:
+            atomic_write_json(self._path(key), {"response": response})
+            self._evict()
+        except OSError:
+            pass  # The cache is an optimization; never fail a request because of it
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except FileNotFoundError:
+                continue  # Evicted by another process
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return
+        for _, path in sorted(entries)[:excess]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        try:
+            entries = sum(1 for name in os.listdir(self.cache_dir) if name.endswith(".json"))
+        except OSError:
+            entries = 0
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
@@ -0,0 +1,112 @@
+"""Client for ``mentor_server.py``, so watchers and scripts share one warm model.
+
+``MentorClient("http://127.0.0.1:8765")`` (or ``"unix:/path/to/socket"``)
+keeps one keep-alive connection per thread. A 429 answer is retried after
+the server's ``Retry-After``, up to ``retries`` times, before
+:class:`ServerBusy` is raised.
+"""
+import http.client
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+
+class ServerBusy(RuntimeError):
+    """The server kept rejecting the request with 429."""
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class MentorClient:
+    """Calls ``/feedback``, ``/diagnose`` and ``/health`` on a mentor server."""
+
+    def __init__(self, url, client_id=None, retries=3, timeout=600, workers=2):
+        self.url = url
+        self.client_id = client_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.retries = retries
+        self.timeout = timeout
+        self.workers = workers
+        self.local = threading.local()
+        self.executor = None
+
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            if self.url.startswith("unix:"):
+                connection = UnixHTTPConnection(self.url[len("unix:"):], self.timeout)
+            else:
+                parts = urlsplit(self.url)
+                connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=self.timeout)
+            self.local.connection = connection
+        return connection
+
+    def send(self, method, path, data, headers):
+        """``(status, Retry-After, body)`` for one request, reconnecting once if a kept-alive connection was closed."""
+        for attempt in range(2):
+            try:
+                connection = self.connection()
+                connection.request(method, path, data, headers)
+                response = connection.getresponse()
+                return response.status, response.getheader("Retry-After"), response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.close()  # The server closed an idle keep-alive connection
+                if attempt:
+                    raise
+
+    def call(self, method, path, body=None):
+        """Send one request and return the decoded JSON response."""
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json", "X-Client-Id": self.client_id}
+        for attempt in range(self.retries + 1):
+            status, retry_after, payload = self.send(method, path, data, headers)
+            if status != 429:
+                return json.loads(payload)
+            if attempt < self.retries:
+                time.sleep(float(retry_after or 1))
+        raise ServerBusy(f"mentor server at {self.url} is busy: {json.loads(payload).get('error')}")
+
+    def feedback(self, file_path, code, mode="explain", hint_num=1, incremental=True):
+        """The server's response frame for one file (see ``mentor.handle_request``)."""
+        return self.call("POST", "/feedback", {"file_path": file_path, "code": code, "mode": mode,
+                                               "hint_num": hint_num, "incremental": incremental})
+
+    def feedback_text(self, file_path, code, mode="explain", hint_num=1):
+        """The mentor's report for one file; raises ``RuntimeError`` if the request failed."""
+        response = self.feedback(file_path, code, mode, hint_num)
+        if response.get("cancelled"):
+            raise RuntimeError("superseded by a newer request for the same file")
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error") or "mentor server request failed")
+        return response.get("output", "")
+
+    def submit(self, file_path, code, mode="explain", hint_num=1):
+        """Run :meth:`feedback_text` on a background thread and return its future."""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="mentor-client")
+        return self.executor.submit(self.feedback_text, file_path, code, mode, hint_num)
+
+    def diagnose(self, code, file_path=None):
+        return self.call("POST", "/diagnose", {"code": code, "file_path": file_path})
+
+    def health(self):
+        return self.call("GET", "/health")
+
+    def close(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
@@ -0,0 +1,380 @@
+"""Shared mentor server: one warm model for every editor, watcher and CI job on a host.
+
+``python mentor_server.py`` serves :func:`mentor.handle_request` over HTTP/1.1
+on ``127.0.0.1:8765`` (``--unix PATH`` for a Unix socket instead):
+
+* ``POST /feedback`` takes a ``mentor.py --server`` request
+  (``{"file_path", "code", "mode", "hint_num"}``) and answers with the same
+  response frame. With ``"stream": true`` the body is chunked NDJSON: token
+  frames, then the response.
+* ``POST /diagnose`` takes ``{"code", "file_path"}`` and answers ``{"ok", "diagnostics"}``
+  right away, without queueing behind feedback requests.
+* ``GET /health`` reports the queue, the loaded models and the cache;
+  ``GET /metrics`` is the Prometheus text of ``telemetry.render_metrics``.
+
+Clients identify themselves with an ``X-Client-Id`` header (the peer address
+otherwise). Feedback requests are admitted into a bounded queue and run one
+at a time, taking turns between clients, so one CI job cannot starve an
+editor. A client may have at most ``--max-per-client`` requests admitted,
+and a new request for a file cancels that client's older one. When the
+queue or the client's share is full the request is rejected at once with
+429 and a ``Retry-After`` estimated from recent service times.
+"""
+import argparse
+import collections
+import http.server
+import json
+import math
+import os
+import queue
+import socketserver
+import sys
+import threading
+import time
+
+import mentor
+import telemetry
+from generation import CancellationToken
+
+DEFAULT_PORT = 8765
+KEEPALIVE_SECONDS = 60  # Idle keep-alive connections are closed after this
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+
+class Overloaded(Exception):
+    """Raised by :meth:`FairScheduler.submit` when a request cannot be admitted."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted request; its token frames and then its response arrive on :attr:`frames`."""
+
+    def __init__(self, client, request):
+        self.client = client
+        self.request = request
+        self.cancel = CancellationToken()
+        self.frames = queue.Queue()
+        self.released = False  # True once it no longer counts against its client's limit
+
+
+def cancelled_response(request):
+    return {"id": request.get("id"), "ok": False, "cancelled": True, "output": ""}
+
+
+class FairScheduler:
+    """Runs ``handle(request, emit, cancel)`` on one worker thread, round-robin between clients.
+
+    At most ``max_queue`` requests wait in total and at most
+    ``max_per_client`` are admitted (waiting or running) per client. A
+    cancelled request stops counting at once, even while it is still winding
+    down on the worker.
+    """
+
+    def __init__(self, handle, max_queue=64, max_per_client=4):
+        self.handle = handle
+        self.max_queue = max_queue
+        self.max_per_client = max_per_client
+        self.cond = threading.Condition()
+        self.waiting = {}  # client -> deque of tickets
+        self.turns = collections.deque()  # clients with waiting tickets, next one first
+        self.admitted = collections.Counter()  # client -> waiting + running tickets
+        self.latest = {}  # (client, file_path) -> newest ticket
+        self.queued = 0
+        self.running = None
+        self.service_seconds = None  # Moving average of handle() time
+        self.served = 0
+        self.rejected = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name="mentor-scheduler", daemon=True)
+        self.thread.start()
+
+    def retry_after(self, ahead):
+        """Seconds until ``ahead`` queued requests are likely to have been served."""
+        return max(1, math.ceil((ahead + 1) * (self.service_seconds or 1.0)))
+
+    def submit(self, client, request):
+        """Admit ``request`` for ``client`` and return its :class:`Ticket`, or raise :class:`Overloaded`."""
+        with self.cond:
+            key = (client, request.get("file_path"))
+            previous = self.latest.get(key) if request.get("file_path") else None
+            if previous is not None:
+                self.supersede(previous)  # Frees its slot before the limits are checked
+            if self.closed:
+                raise Overloaded("server is shutting down", 1)
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded(f"queue is full ({self.queued} waiting)", self.retry_after(self.queued))
+            if self.admitted[client] >= self.max_per_client:
+                self.rejected += 1
+                raise Overloaded(f"client '{client}' already has {self.admitted[client]} requests in flight",
+                                 self.retry_after(self.admitted[client]))
+            ticket = Ticket(client, request)
+            if client not in self.waiting:
+                self.waiting[client] = collections.deque()
+                self.turns.append(client)
+            self.waiting[client].append(ticket)
+            self.admitted[client] += 1
+            self.queued += 1
+            if request.get("file_path"):
+                self.latest[key] = ticket
+            self.cond.notify()
+            return ticket
+
+    def supersede(self, ticket):
+        """Cancel ``ticket`` and free its slot; if it has not started, answer it now instead of when its turn comes."""
+        ticket.cancel.cancel()
+        if ticket is self.running:
+            self.release(ticket)
+        waiting = self.waiting.get(ticket.client)
+        if waiting is not None and ticket in waiting:
+            waiting.remove(ticket)
+            if not waiting:
+                del self.waiting[ticket.client]
+                self.turns.remove(ticket.client)
+            self.queued -= 1
+            self.release(ticket)
+            ticket.frames.put(cancelled_response(ticket.request))
+
+    def cancel(self, ticket):
+        with self.cond:
+            self.supersede(ticket)
+
+    def release(self, ticket):
+        if ticket.released:
+            return
+        ticket.released = True
+        self.admitted[ticket.client] -= 1
+        if not self.admitted[ticket.client]:
+            del self.admitted[ticket.client]
+        key = (ticket.client, ticket.request.get("file_path"))
+        if self.latest.get(key) is ticket:
+            del self.latest[key]
+
+    def next_ticket(self):
+        with self.cond:
+            while not self.turns and not self.closed:
+                self.cond.wait()
+            if not self.turns:
+                return None
+            client = self.turns.popleft()
+            ticket = self.waiting[client].popleft()
+            if self.waiting[client]:
+                self.turns.append(client)  # Back of the line until every other client had a turn
+            else:
+                del self.waiting[client]
+            self.queued -= 1
+            self.running = ticket
+            return ticket
+
+    def run(self):
+        while True:
+            ticket = self.next_ticket()
+            if ticket is None:
+                return
+            start = time.perf_counter()
+            if ticket.cancel.cancelled:
+                response = cancelled_response(ticket.request)
+            else:
+                try:
+                    response = self.handle(ticket.request, ticket.frames.put, ticket.cancel)
+                except Exception as e:
+                    response = {"id": ticket.request.get("id"), "ok": False, "error": str(e), "output": ""}
+            seconds = time.perf_counter() - start
+            with self.cond:
+                if not response.get("cancelled"):
+                    self.served += 1
+                    previous = self.service_seconds
+                    self.service_seconds = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+                self.running = None
+                self.release(ticket)
+            ticket.frames.put(response)
+
+    def stats(self):
+        with self.cond:
+            return {"queued": self.queued, "running": self.running is not None,
+                    "clients": dict(self.admitted), "served": self.served, "rejected": self.rejected,
+                    "service_s": round(self.service_seconds, 3) if self.service_seconds is not None else None}
+
+    def close(self):
+        """Cancel every waiting request and stop the worker after the running one."""
+        with self.cond:
+            self.closed = True
+            for waiting in list(self.waiting.values()):
+                for ticket in list(waiting):
+                    self.supersede(ticket)
+            if self.running is not None:
+                self.running.cancel.cancel()
+            self.cond.notify_all()
+        self.thread.join()
+
+
+class MentorRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive: clients reuse one connection for many requests
+    server_version = "CodeMentor"
+    timeout = KEEPALIVE_SECONDS
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            sys.stderr.write(f"[*] {self.address_string()} {format % args}\n")
+
+    def client_id(self):
+        return self.headers.get("X-Client-Id") or self.address_string()
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self):
+        """The request body as a dict, or ``None`` after answering 400/413."""
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.send_json(413, {"ok": False, "error": f"Request body over {MAX_BODY_BYTES} bytes"})
+            self.close_connection = True  # The unread body would be parsed as the next request
+            return None
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self.send_json(400, {"ok": False, "error": f"Invalid JSON body: {str(e)}"})
+            return None
+        if not isinstance(body, dict):
+            self.send_json(400, {"ok": False, "error": "Request body must be a JSON object"})
+            return None
+        return body
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"ok": True, "pid": os.getpid(), "scheduler": self.server.scheduler.stats(),
+                                 "models": mentor.models.report(), "cache": mentor.feedback_cache.stats()})
+        elif self.path == "/metrics":
+            data = telemetry.render_metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_json(404, {"ok": False, "error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path not in ("/feedback", "/diagnose"):
+            self.send_json(404, {"ok": False, "error": f"Unknown path {self.path}"})
+            return
+        request = self.read_json()
+        if request is None:
+            return
+        if self.path == "/diagnose":
+            with telemetry.span("diagnose"):
+                diagnostics = mentor.diagnose(request.get("code") or "", request.get("file_path"))
+            self.send_json(200, {"id": request.get("id"), "ok": True, "diagnostics": diagnostics})
+            return
+        if "file_path" not in request:
+            self.send_json(400, {"id": request.get("id"), "ok": False, "error": "Missing 'file_path'"})
+            return
+        try:
+            ticket = self.server.scheduler.submit(self.client_id(), request)
+        except Overloaded as e:
+            self.send_json(429, {"id": request.get("id"), "ok": False, "error": str(e), "retry_after": e.retry_after},
+                           {"Retry-After": str(e.retry_after)})
+            return
+        try:
+            if request.get("stream"):
+                self.send_stream(ticket)
+            else:
+                frame = ticket.frames.get()
+                while frame.get("event") == "token":
+                    frame = ticket.frames.get()
+                self.send_json(200, frame)
+        except OSError:
+            self.server.scheduler.cancel(ticket)  # The client went away; stop generating for it
+            self.close_connection = True
+
+    def send_stream(self, ticket):
+        """Send token frames as they are generated, then the response, as chunked NDJSON."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        while True:
+            frame = ticket.frames.get()
+            data = (json.dumps(frame) + "\n").encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+            if frame.get("event") != "token":
+                break
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class MentorHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, scheduler, verbose=False):
+        self.scheduler = scheduler
+        self.verbose = verbose
+        super().__init__(address, MentorRequestHandler)
+
+
+class MentorUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, scheduler, verbose=False):
+        self.scheduler = scheduler
+        self.verbose = verbose
+        if os.path.exists(path):
+            os.unlink(path)  # Left behind by a server that did not shut down cleanly
+        super().__init__(path, MentorRequestHandler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve mentor feedback to many clients from one loaded model.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"TCP port (default: {DEFAULT_PORT})")
+    parser.add_argument("--unix", metavar="PATH", help="Listen on a Unix socket at PATH instead of TCP")
+    parser.add_argument("--max-queue", type=int, default=64, help="Requests that may wait for the model before new ones get 429")
+    parser.add_argument("--max-per-client", type=int, default=4, help="Requests one client may have queued or running")
+    parser.add_argument("--backend", choices=mentor.BACKENDS, default=mentor.DEFAULT_BACKEND, help="Inference backend")
+    parser.add_argument("--idle-unload", type=float, default=mentor.IDLE_UNLOAD_SECONDS, metavar="SECONDS", help="Unload the model after this many idle seconds; 0 keeps it loaded")
+    parser.add_argument("--max-rss-mb", type=float, default=mentor.MAX_RSS_MB, metavar="MB", help="Unload least recently used models while the process RSS is above this")
+    parser.add_argument("--trace", metavar="PATH", help="Write timing spans as NDJSON to PATH, or 'stderr'")
+    parser.add_argument("--metrics", metavar="PATH", help="Write aggregated stage metrics in Prometheus text format to PATH")
+    parser.add_argument("--verbose", action="store_true", help="Log every HTTP request to stderr")
+    args = parser.parse_args(argv)
+    telemetry.configure(args.trace, args.metrics)
+    mentor.BACKEND = args.backend
+    mentor.models.idle_unload = args.idle_unload
+    mentor.models.max_rss_mb = args.max_rss_mb
+
+    scheduler = FairScheduler(mentor.handle_request, args.max_queue, args.max_per_client)
+    if args.unix:
+        server = MentorUnixServer(args.unix, scheduler, args.verbose)
+        where = f"unix:{args.unix}"
+    else:
+        server = MentorHTTPServer((args.host, args.port), scheduler, args.verbose)
+        where = f"http://{args.host}:{server.server_address[1]}"
+    if os.environ.get('HF_TOKEN'):
+        mentor.preload_generator()
+    mentor.safe_print(f"[*] Mentor server listening on {where} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        mentor.safe_print("[*] Mentor server stopped.")
+    finally:
+        server.server_close()
+        scheduler.close()
+        if args.unix and os.path.exists(args.unix):
+            os.unlink(args.unix)
+
+
+if __name__ == "__main__":
+    main()
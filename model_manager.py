@@ -0,0 +1,179 @@
+"""Keep models resident only while they are in use, within a memory budget.
+
+A :class:`ModelManager` loads a pipeline on first use and hands out the same
+object until it is unloaded. A model is unloaded when:
+
+* it has not been used for ``idle_unload`` seconds (``--idle-unload`` or
+  ``CODEMENTOR_IDLE_UNLOAD``; 0 keeps it loaded for the life of the process), or
+* the process RSS is above ``max_rss_mb`` (``--max-rss-mb`` or
+  ``CODEMENTOR_MAX_RSS_MB``) and another model has been used more recently.
+
+The next request after an unload reloads the model. The torch backends load
+their weights memory-mapped (see ``backends.py``), so a reload reads the
+weights back from the page cache instead of the network or a cold disk.
+
+A request that is still generating keeps its own reference to the pipeline,
+so unloading never interrupts it; the memory is returned once it finishes.
+"""
+import ctypes
+import gc
+import os
+import sys
+import threading
+import time
+
+import prefix_cache
+import telemetry
+from backends import DEFAULT_BACKEND, build_pipeline
+
+IDLE_UNLOAD_SECONDS = float(os.environ.get("CODEMENTOR_IDLE_UNLOAD", 900))
+MAX_RSS_MB = float(os.environ.get("CODEMENTOR_MAX_RSS_MB", 0))  # 0: no ceiling
+
+
+class LoadedModel:
+    def __init__(self, generator, weight_bytes, rss_delta):
+        self.generator = generator
+        self.weight_bytes = weight_bytes
+        self.rss_delta = rss_delta  # RSS growth while loading, or None if RSS is unavailable
+        self.last_used = time.monotonic()
+
+
+def weight_bytes(generator):
+    """Bytes held by the model's parameters and buffers, or ``None`` for non-torch models."""
+    model = getattr(generator, "model", None)
+    if model is None or not hasattr(model, "parameters"):
+        return None
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+def release_memory():
+    """Collect garbage and ask the C allocator to give freed pages back to the OS."""
+    gc.collect()
+    if sys.platform.startswith("linux"):
+        try:
+            ctypes.CDLL("libc.so.6").malloc_trim(0)  # glibc keeps freed arenas mapped otherwise
+        except (OSError, AttributeError):
+            pass
+
+
+def _mb(size):
+    return f"{size / (1024 * 1024):.0f} MB" if size is not None else "unknown"
+
+
+class ModelManager:
+    """Load pipelines on demand and unload them when idle or over the RSS ceiling.
+
+    ``loader(model_id, backend)`` builds a pipeline; it defaults to
+    :func:`backends.build_pipeline`.
+    """
+
+    def __init__(self, loader=None, idle_unload=IDLE_UNLOAD_SECONDS, max_rss_mb=MAX_RSS_MB, log=print):
+        self.loader = loader or build_pipeline
+        self.idle_unload = idle_unload
+        self.max_rss_mb = max_rss_mb
+        self.log = log
+        self.models = {}  # (model_id, backend) -> LoadedModel
+        self.lock = threading.RLock()
+        self.stopped = threading.Event()
+        self.reaper = None
+
+    def is_loaded(self, model_id, backend=None):
+        return (model_id, backend or DEFAULT_BACKEND) in self.models
+
+    def get(self, model_id, backend=None):
+        """The pipeline for ``model_id``, loading it (and evicting others if needed) on first use."""
+        key = (model_id, backend or DEFAULT_BACKEND)
+        with self.lock:
+            entry = self.models.get(key)
+            if entry is None:
+                self.enforce_ceiling()
+                before = telemetry.rss_bytes()
+                with telemetry.span("load_model", model=model_id, backend=key[1]):
+                    generator = self.loader(*key)
+                after = telemetry.rss_bytes()
+                entry = LoadedModel(generator, weight_bytes(generator),
+                                    after - before if before is not None and after is not None else None)
+                self.models[key] = entry
+                self.log(f"[*] Loaded '{model_id}' ({key[1]}): {_mb(entry.weight_bytes)} of weights, "
+                         f"RSS +{_mb(entry.rss_delta)}.")
+                self.enforce_ceiling(keep=key)
+                self.start_reaper()
+            entry.last_used = time.monotonic()
+            return entry.generator
+
+    def unload(self, model_id, backend=None, reason="requested"):
+        key = (model_id, backend or DEFAULT_BACKEND)
+        with self.lock:
+            entry = self.models.pop(key, None)
+        if entry is None:
+            return False
+        prefix_cache.clear(entry.generator)
+        del entry
+        release_memory()
+        self.log(f"[*] Unloaded '{model_id}' ({key[1]}, {reason}); RSS now {_mb(telemetry.rss_bytes())}.")
+        return True
+
+    def unload_idle(self, now=None):
+        """Unload every model unused for ``idle_unload`` seconds; returns their keys."""
+        if not self.idle_unload:
+            return []
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            idle = [key for key, entry in self.models.items() if now - entry.last_used >= self.idle_unload]
+            for key in idle:
+                self.unload(*key, reason=f"idle for {self.idle_unload:.0f} s")
+        return idle
+
+    def enforce_ceiling(self, keep=None):
+        """Unload least recently used models while the process RSS is above ``max_rss_mb``."""
+        if not self.max_rss_mb:
+            return
+        with self.lock:
+            while True:
+                rss = telemetry.rss_bytes()
+                candidates = [key for key in self.models if key != keep]
+                if rss is None or rss <= self.max_rss_mb * 1024 * 1024 or not candidates:
+                    break
+                oldest = min(candidates, key=lambda key: self.models[key].last_used)
+                self.unload(*oldest, reason=f"RSS {_mb(rss)} over the {self.max_rss_mb:.0f} MB ceiling")
+            if keep in self.models and rss is not None and rss > self.max_rss_mb * 1024 * 1024:
+                self.log(f"[!] RSS {_mb(rss)} is over the {self.max_rss_mb:.0f} MB ceiling "
+                         f"with only '{keep[0]}' loaded.")
+
+    def start_reaper(self):
+        """Check for idle models in a daemon thread, a few times per ``idle_unload`` period."""
+        if not self.idle_unload or self.reaper is not None:
+            return
+        interval = min(max(self.idle_unload / 4, 1.0), 60.0)
+
+        def reap():
+            while not self.stopped.wait(interval):
+                self.unload_idle()
+
+        self.reaper = threading.Thread(target=reap, name="model-reaper", daemon=True)
+        self.reaper.start()
+
+    def report(self):
+        """One dict per loaded model: its resident size and how long it has been idle."""
+        now = time.monotonic()
+        with self.lock:
+            return [{"model": model_id, "backend": backend, "weight_bytes": entry.weight_bytes,
+                     "rss_delta_bytes": entry.rss_delta, "idle_s": round(now - entry.last_used, 1)}
+                    for (model_id, backend), entry in self.models.items()]
+
+    def format_report(self):
+        lines = [f"[*] Resident models (process RSS {_mb(telemetry.rss_bytes())}):"]
+        for model in self.report():
+            lines.append(f"  {model['model']} ({model['backend']}): {_mb(model['weight_bytes'])} of weights, "
+                         f"RSS +{_mb(model['rss_delta_bytes'])} at load, idle {model['idle_s']:.0f} s")
+        if len(lines) == 1:
+            lines.append("  none")
+        return "\n".join(lines)
+
+    def close(self):
+        """Stop the idle check and unload every model."""
+        self.stopped.set()
+        with self.lock:
+            for key in list(self.models):
+                self.unload(*key, reason="shutting down")
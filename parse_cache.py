@@ -0,0 +1,459 @@
+"""Per-file parse trees kept between watch events, reparsed incrementally.
+
+The watchers see the same files saved again and again, usually with a small
+edit. :class:`ParseCache` keeps each file's last source and parso tree. On
+the next save, parso's diff cache (``grammar.parse(code, diff_cache=True,
+path=...)``) reuses the unchanged parts of the tree and parses only what
+changed. The syntax check then compiles only the
+top-level statements that contain changed lines, so for a large module the
+cost of a save follows the size of the edit rather than the size of the file.
+Any error, or a file that did not parse last time, is checked with a full
+``ast.parse`` so the reported error is exactly CPython's.
+
+:class:`Parsed` also carries the line ranges that changed since the previous
+version, so later stages (flake8 output, mentor prompts) can skip the rest.
+:meth:`ParseCache.syntax_errors` lists every syntax error from the error
+nodes parso's error recovery leaves in the tree, one per broken statement.
+The cache is bounded by the total size of the sources it holds; parso is
+optional, and without it every check is a full parse.
+"""
+import ast
+import difflib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import diffscope
+import repair
+
+# Bounds the sources held; their parso trees take many times more memory
+MAX_SOURCE_BYTES = int(float(os.environ.get("CODEMENTOR_PARSE_CACHE_MB", "8")) * 1024 * 1024)
+_WRAPPERS = ("decorated", "async_funcdef", "async_stmt")
+
+
+class Parsed(NamedTuple):
+    code: str
+    error: Optional[SyntaxError]  # None if the code parses
+    changed: Optional[list]  # [(start, end)] lines changed since the previous version; None if there was none
+    module: object  # The parso tree, or None
+    incremental: bool  # True if only the changed statements were parsed and compiled
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class _Entry(NamedTuple):
+    code: str
+    lines: list
+    module: object
+    ok: bool
+
+
+class TrimmedMatcher:
+    """``difflib.SequenceMatcher`` opcodes for :func:`changed_ranges`, matching only what lies between the common
+    head and tail.
+
+    A small edit to a large file leaves almost every line in the head or
+    tail, so this costs about as much as comparing the lists.
+    """
+
+    def __init__(self, isjunk=None, a=(), b=()):
+        head = 0
+        limit = min(len(a), len(b))
+        while head < limit and a[head] == b[head]:
+            head += 1
+        tail = 0
+        while tail < limit - head and a[-1 - tail] == b[-1 - tail]:
+            tail += 1
+        self.a, self.b, self.head, self.tail = a, b, head, tail
+        self.matcher = difflib.SequenceMatcher(isjunk, a[head:len(a) - tail], b[head:len(b) - tail], False)
+
+    def get_opcodes(self):
+        head, tail = self.head, self.tail
+        opcodes = [("equal", 0, head, 0, head)] if head else []
+        opcodes += [(operation, i1 + head, i2 + head, j1 + head, j2 + head)
+                    for operation, i1, i2, j1, j2 in self.matcher.get_opcodes()]
+        if tail:
+            opcodes.append(("equal", len(self.a) - tail, len(self.a), len(self.b) - tail, len(self.b)))
+        return opcodes
+
+
+def _grammar():
+    try:
+        import parso
+    except ImportError:
+        return None
+    return parso.load_grammar()
+
+
+def _drop_parso_tree(key):
+    """Remove ``key``'s tree from parso's in-memory diff cache, which it otherwise keeps for minutes."""
+    from parso.cache import parser_cache
+    for trees in parser_cache.values():
+        trees.pop(Path(key), None)
+
+
+def _split(code):
+    from parso.utils import split_lines
+    return split_lines(code, keepends=True)
+
+
+def changed_ranges(old_lines, new_lines):
+    """``[(start, end)]`` 1-based lines of ``new_lines`` that differ from ``old_lines``.
+
+    A deletion is recorded as the line after it.
+    """
+    ranges = []
+    last = max(len(new_lines), 1)
+    for operation, _, _, start, end in TrimmedMatcher(None, old_lines, new_lines).get_opcodes():
+        if operation == "equal":
+            continue
+        first = min(start + 1, last)
+        ranges.append((first, max(end, first)))
+    return ranges
+
+
+def _error_nodes(node):
+    """True if parso's error recovery left an error node or leaf anywhere under ``node``."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node.type in ("error_node", "error_leaf"):
+            return True
+        stack.extend(getattr(node, "children", ()))
+    return False
+
+
+def _bracket_depth(node):
+    """Opening minus closing brackets among the leaves of ``node``."""
+    depth = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if hasattr(node, "children"):
+            stack.extend(node.children)
+        elif node.value in ("(", "[", "{"):
+            depth += 1
+        elif node.value in (")", "]", "}"):
+            depth -= 1
+    return depth
+
+
+_CLAUSES = ("elif", "else", "except", "finally")
+# parso's error recovery only adds error nodes to the module, a block or a compound statement
+_BLOCKS = {"file_input", "suite", "if_stmt", "for_stmt", "while_stmt", "try_stmt", "with_stmt", "funcdef", "classdef",
+           "decorated", "async_stmt", "async_funcdef", "match_stmt", "case_block"}
+
+
+def _statement_between(after, before):
+    """True if a statement without errors starts between the nodes ``after`` and ``before``."""
+    leaf = after.get_last_leaf().get_next_leaf()
+    while leaf is not None and leaf.start_pos < before.start_pos:
+        previous = leaf.get_previous_leaf()
+        starts_line = previous is None or previous.type == "newline" or previous.end_pos[0] < leaf.start_pos[0]
+        if starts_line and leaf.type not in ("newline", "error_leaf"):
+            statement = leaf
+            while statement.parent is not None and statement.parent.start_pos == leaf.start_pos:
+                statement = statement.parent
+            if not _error_nodes(statement):
+                return True
+        leaf = leaf.get_next_leaf()
+    return False
+
+
+def _follows(group, depth, node):
+    """True if the error ``node`` is a follow-on of the error in ``group``, whose brackets leave ``depth`` open."""
+    last = group[-1]
+    indent = group[0].start_pos[1]
+    if node.start_pos[0] <= last.end_pos[0]:
+        return True
+    if node.type == "error_leaf" and node.token_type == "INDENT":  # The body of a broken block header
+        return True
+    if node.type == "error_leaf" and node.value in _CLAUSES and node.start_pos[1] == indent:
+        return True  # The else of a broken if, the except of a broken try
+    # After an unclosed bracket, parso reports every statement up to the first one that parses again
+    return depth > 0 and not _statement_between(last, node)
+
+
+def _error_groups(module):
+    """parso's error nodes and leaves in file order, grouped so that one error is one group."""
+    groups = []
+    depth = 0  # Unclosed brackets in the last group
+    stack = [module]
+    while stack:
+        node = stack.pop()
+        if node.type not in ("error_node", "error_leaf"):
+            if node.type in _BLOCKS:
+                stack.extend(reversed(node.children))
+            continue
+        if groups and _follows(groups[-1], depth, node):
+            groups[-1].append(node)
+        else:
+            groups.append([node])
+            depth = 0
+        depth += _bracket_depth(node)
+    return groups
+
+
+def _error_message(group):
+    for node in group:
+        leaf = node if node.type == "error_leaf" else node.get_first_leaf()
+        if leaf.type != "error_leaf":
+            continue
+        if leaf.token_type == "INDENT":
+            return "unexpected indent"
+        if leaf.token_type in ("DEDENT", "ERROR_DEDENT"):
+            return "unindent does not match any outer indentation level"
+        if leaf.value[:1] in ("'", '"'):
+            return "unterminated string literal"
+    return "invalid syntax"
+
+
+def _issues(module, error):
+    """One issue per group of parso error nodes, with CPython's ``error`` for the group that contains it."""
+    cpython = repair.SyntaxIssue(error.lineno or 1, error.offset or 1, error.msg)
+    if error.lineno is None:  # Null bytes: parso's tree says nothing more
+        return [cpython]
+    issues = []
+    for group in _error_groups(module):
+        if group[0].start_pos[0] <= error.lineno <= group[-1].end_pos[0] and cpython not in issues:
+            issues.append(cpython)
+        else:
+            line, column = group[0].start_pos
+            issues.append(repair.SyntaxIssue(line, column + 1, _error_message(group)))
+    if cpython not in issues:
+        issues.append(cpython)
+    return sorted(issues)
+
+
+def _end_line(node):
+    line, column = node.end_pos
+    return line - 1 if column == 0 and line > node.start_pos[0] else line
+
+
+def _touched_statements(module, ranges):
+    """The module's top-level statements that contain a changed line, and the one on either side.
+
+    An edit can break its neighbours without touching them: a new line can
+    leave the block header before it without a body, or the ``else`` after
+    it without an ``if``.
+    """
+    children = module.children
+    touched = set()
+    index = 0
+    for start, end in sorted(ranges):
+        while index < len(children) and _end_line(children[index]) < start:
+            index += 1
+        first = index
+        while index < len(children) and children[index].start_pos[0] <= end:
+            if _end_line(children[index]) > end:
+                break
+            index += 1
+        touched.update(range(max(first - 1, 0), min(index + 2, len(children))))
+    return [children[index] for index in sorted(touched)]
+
+
+def _statements_parse(module, statements):
+    if any(child.type in ("error_node", "error_leaf") for child in module.children):
+        return False
+    for statement in statements:
+        if _error_nodes(statement):
+            return False
+        try:
+            ast.parse(statement.get_code())
+        except (SyntaxError, ValueError):
+            return False
+    return True
+
+
+def _full_check(code):
+    try:
+        ast.parse(code)
+    except SyntaxError as e:
+        return e
+    except ValueError as e:  # Null bytes
+        return SyntaxError(str(e))
+    return None
+
+
+class ParseCache:
+    """LRU of each file's last source and parso tree, bounded by total source size."""
+
+    def __init__(self, max_bytes=MAX_SOURCE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._parse_lock = threading.RLock()  # parso's diff cache updates trees in place
+        self._grammar = None
+        self.stats = {"full": 0, "incremental": 0, "unchanged": 0}
+
+    def _take(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= len(entry.code)
+            return entry
+
+    def _put(self, key, entry):
+        evicted = []
+        if len(entry.code) > self.max_bytes:
+            evicted.append(key)  # Too big to keep; every version is parsed in full
+        else:
+            with self._lock:
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self._size -= len(previous.code)
+                self._entries[key] = entry
+                self._size += len(entry.code)
+                while self._size > self.max_bytes:
+                    evicted_key, evicted_entry = self._entries.popitem(last=False)
+                    self._size -= len(evicted_entry.code)
+                    evicted.append(evicted_key)
+        if self._grammar:
+            for evicted_key in evicted:
+                _drop_parso_tree(evicted_key)
+
+    def _parse_tree(self, key, code, incremental):
+        """parso tree of ``code``, updated from the tree parso cached for ``key`` if ``incremental``."""
+        with self._parse_lock:
+            if not incremental:
+                _drop_parso_tree(key)
+            try:
+                return self._grammar.parse(code, diff_cache=True, path=key)
+            except Exception:
+                _drop_parso_tree(key)  # The old tree may be half-updated; start over
+                return self._grammar.parse(code, diff_cache=True, path=key) if incremental else None
+
+    def parse(self, file_path, code):
+        """Check ``code``, the new content of ``file_path``, and remember it for the next call."""
+        key = os.path.abspath(file_path)
+        # Taken out of the cache while in use: the diff parser changes the tree in place
+        entry = self._take(key)
+        if self._grammar is None:
+            self._grammar = _grammar() or False
+        if entry is not None and entry.code == code:
+            self.stats["unchanged"] += 1
+            self._put(key, entry)
+            return Parsed(code, None if entry.ok else _full_check(code), [], entry.module, True)
+
+        lines = _split(code) if self._grammar else code.splitlines(keepends=True)
+        changed = changed_ranges(entry.lines, lines) if entry is not None else None
+        module = None
+        incremental = False
+        if self._grammar:
+            module = self._parse_tree(key, code, entry is not None and entry.module is not None)
+            if module is not None and entry is not None and entry.ok:
+                incremental = _statements_parse(module, _touched_statements(module, changed))
+        error = None if incremental else _full_check(code)
+        self.stats["incremental" if incremental else "full"] += 1
+        self._put(key, _Entry(code, lines, module, error is None))
+        return Parsed(code, error, changed, module, incremental)
+
+    def syntax_errors(self, file_path, code):
+        """Every syntax error in ``code`` as :class:`repair.SyntaxIssue` objects, read from the parso tree.
+
+        Parses ``code`` like :meth:`parse` and lists the errors while no other
+        parse can update the tree.
+        """
+        with self._parse_lock:
+            parsed = self.parse(file_path, code)
+            if parsed.error is None:
+                return []
+            if parsed.module is None:
+                return repair.find_errors(code)
+            return _issues(parsed.module, parsed.error)
+
+    def forget(self, file_path):
+        key = os.path.abspath(file_path)
+        self._take(key)
+        if self._grammar:
+            _drop_parso_tree(key)
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self._size = 0
+        if self._grammar:
+            for key in keys:
+                _drop_parso_tree(key)
+
+
+def _leaf_at(module, lines, line):
+    """The leaf at the first non-blank column of ``line`` (or the one whose prefix holds it), or ``None``."""
+    text = lines[line - 1] if line <= len(lines) else ""
+    column = len(text) - len(text.lstrip()) if text.strip() else 0
+    try:
+        node = module.get_leaf_for_position((line, column), include_prefixes=True)
+    except ValueError:
+        return None
+    if node.end_pos <= (line, column):  # The newline ending the line before
+        node = node.get_next_leaf() or node
+    return node
+
+
+def _enclosing_function(module, lines):
+    """Innermost function containing a line, from the parso tree, for :func:`diffscope.regions`."""
+    def enclosing(line):
+        node = _leaf_at(module, lines, line)
+        while node is not None:
+            function = node
+            if node.type == "decorated":  # On a decorator line
+                function = node.children[-1]
+                function = function.children[-1] if function.type == "async_funcdef" else function
+            if function.type == "funcdef":
+                outer = function
+                while outer.parent is not None and outer.parent.type in _WRAPPERS:
+                    outer = outer.parent
+                if outer.start_pos[0] <= line <= _end_line(outer):  # Not just in the comments before it
+                    return outer.start_pos[0], _end_line(outer), function.name.value
+            node = node.parent
+        return None
+    return enclosing
+
+
+def _enclosing_statement(module, lines):
+    """Module- or class-level statement containing a line, from the parso tree, for :func:`diffscope.regions`."""
+    def statement(line):
+        node = _leaf_at(module, lines, line)
+        if node is None or node.type == "endmarker":
+            return None
+        while node.parent is not None:
+            parent = node.parent
+            if parent.type == "file_input":
+                return node.start_pos[0], _end_line(node), "module"
+            if parent.type == "suite" and parent.parent.type == "classdef" and node.type not in ("newline", "operator"):
+                return node.start_pos[0], _end_line(node), parent.parent.start_pos
+            node = parent
+        return None
+    return statement
+
+
+def changed_regions(parsed):
+    """The functions containing ``parsed.changed``, plus runs of changed statements outside any function."""
+    if parsed.module is not None:
+        lines = parsed.code.splitlines()
+        return diffscope.regions(parsed.code, parsed.changed, enclosing=_enclosing_function(parsed.module, lines),
+                                 statement=_enclosing_statement(parsed.module, lines))
+    return diffscope.regions(parsed.code, parsed.changed)
+
+
+_cache = ParseCache()
+
+
+def parse_file(file_path, code):
+    """:meth:`ParseCache.parse` with the process-wide cache."""
+    return _cache.parse(file_path, code)
+
+
+def syntax_errors(file_path, code):
+    """:meth:`ParseCache.syntax_errors` with the process-wide cache."""
+    return _cache.syntax_errors(file_path, code)
+
+
+def stats():
+    return dict(_cache.stats)
@@ -0,0 +1,141 @@
+"""Reuse the model's key/value cache for the fixed start of each prompt.
+
+Every prompt of a mode starts with the same instruction text, and only the
+code (and error) after it changes. :func:`generate_with_prefix` runs the
+model over a prefix once per loaded model, keeps the resulting
+``past_key_values`` in memory, and for each request only prefills the
+tokens that follow the prefix.
+
+The prefix and the rest of the prompt are tokenized separately, whether or
+not the cache is warm, so the model sees the same tokens on the first and
+on later calls. Only PyTorch models loaded through a text-generation
+pipeline are supported; :func:`supports_prefix_cache` is False for anything
+else (ONNX Runtime models, test stubs) and callers fall back to the
+pipeline.
+"""
+import copy
+import threading
+import weakref
+
+import telemetry
+
+_lock = threading.Lock()
+_caches = weakref.WeakKeyDictionary()  # model -> {prefix: (prefix_ids, past_key_values)}
+
+
+def supports_prefix_cache(generator):
+    model = getattr(generator, "model", None)
+    if model is None or getattr(generator, "tokenizer", None) is None:
+        return False
+    try:
+        import torch
+    except ImportError:
+        return False
+    return isinstance(model, torch.nn.Module) and hasattr(model, "generate")
+
+
+def _encode(tokenizer, text):
+    import torch
+    return torch.tensor([tokenizer.encode(text, add_special_tokens=False)], dtype=torch.long)
+
+
+def prefix_state(generator, prefix):
+    """``(prefix_ids, past_key_values)`` for ``prefix``, computed on first use for this model."""
+    import torch
+
+    model = generator.model
+    with _lock:
+        entries = _caches.setdefault(model, {})
+        if prefix not in entries:
+            ids = _encode(generator.tokenizer, prefix).to(model.device)
+            with telemetry.span("prefill_prefix", prompt_tokens=ids.shape[1]), torch.no_grad():
+                output = model(input_ids=ids, use_cache=True)
+            entries[prefix] = (ids, output.past_key_values)
+        return entries[prefix]
+
+
+def _expand(past_key_values, batch_size):
+    """A private copy of the cached state for a batch; ``generate`` extends the cache it is given."""
+    if isinstance(past_key_values, tuple):  # Legacy format: generate builds new tensors instead of mutating
+        return tuple(tuple(tensor.repeat(batch_size, 1, 1, 1) for tensor in layer) for layer in past_key_values)
+    cache = copy.deepcopy(past_key_values)
+    if batch_size > 1:
+        cache.batch_repeat_interleave(batch_size)
+    return cache
+
+
+def generate_with_prefix(generator, prefix, suffixes, **generate_kwargs):
+    """Generate a completion of ``prefix + suffix`` for each suffix; returns full texts like the pipeline.
+
+    Suffixes of different lengths are left-padded between the prefix and the
+    suffix; the attention mask hides the padding.
+    """
+    import torch
+
+    model = generator.model
+    tokenizer = generator.tokenizer
+    prefix_ids, past_key_values = prefix_state(generator, prefix)
+    encoded = [tokenizer.encode(suffix, add_special_tokens=False) for suffix in suffixes]
+    width = max(len(ids) for ids in encoded)
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    suffix_ids = torch.tensor([[pad_id] * (width - len(ids)) + ids for ids in encoded], dtype=torch.long)
+    suffix_mask = torch.tensor([[0] * (width - len(ids)) + [1] * len(ids) for ids in encoded], dtype=torch.long)
+
+    batch_size = len(suffixes)
+    input_ids = torch.cat([prefix_ids.cpu().repeat(batch_size, 1), suffix_ids], dim=1).to(model.device)
+    attention_mask = torch.cat([torch.ones((batch_size, prefix_ids.shape[1]), dtype=torch.long), suffix_mask],
+                               dim=1).to(model.device)
+    generate_kwargs.pop("truncation", None)  # A pipeline argument, not a generate() one
+    generate_kwargs.pop("batch_size", None)
+    generate_kwargs.setdefault("pad_token_id", pad_id)
+    with torch.no_grad():
+        output = model.generate(input_ids=input_ids, attention_mask=attention_mask,
+                                past_key_values=_expand(past_key_values, batch_size), **generate_kwargs)
+    new_tokens = output[:, input_ids.shape[1]:]
+    return [prefix + suffix + tokenizer.decode(tokens, skip_special_tokens=True)
+            for suffix, tokens in zip(suffixes, new_tokens)]
+
+
+def split(prompt, prefixes):
+    """``(prefix, rest)`` for the first of ``prefixes`` that ``prompt`` starts with, else ``(None, prompt)``."""
+    for prefix in prefixes:
+        if prompt.startswith(prefix):
+            return prefix, prompt[len(prefix):]
+    return None, prompt
+
+
+def generate(generator, prompts, prefixes, **kwargs):
+    """Generated text for each prompt, called like the text-generation pipeline.
+
+    Prompts that start with one of ``prefixes`` reuse that prefix's cached
+    state when the model supports it; the rest go through the pipeline.
+    """
+    cached = supports_prefix_cache(generator)
+    groups = {}
+    for index, prompt in enumerate(prompts):
+        prefix, rest = split(prompt, prefixes) if cached else (None, prompt)
+        groups.setdefault(prefix, []).append((index, rest))
+    texts = [None] * len(prompts)
+    for prefix, items in groups.items():
+        if prefix is None:
+            batch = [prompt for _, prompt in items]
+            outputs = generator(batch, **kwargs) if len(batch) > 1 else [generator(batch[0], **kwargs)]
+            results = [output[0]["generated_text"] for output in outputs]
+        else:
+            size = kwargs.get("batch_size") or len(items)
+            results = []
+            for start in range(0, len(items), size):
+                suffixes = [rest for _, rest in items[start:start + size]]
+                results += generate_with_prefix(generator, prefix, suffixes, **kwargs)
+        for (index, _), text in zip(items, results):
+            texts[index] = text
+    return texts
+
+
+def clear(generator=None):
+    """Drop the cached prefixes of ``generator``'s model, or of every model."""
+    with _lock:
+        if generator is None:
+            _caches.clear()
+        elif getattr(generator, "model", None) is not None:
+            _caches.pop(generator.model, None)
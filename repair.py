@@ -0,0 +1,462 @@
+"""Model-free repair of common syntax errors.
+
+:func:`repair` runs a parse-patch-reparse loop: it takes the first error
+CPython reports, tries the patches known for that message (missing colons,
+unclosed or mismatched brackets, unterminated strings, bad indentation,
+missing commas, ``=`` for ``==``, Python 2 ``print``), and keeps the first
+patch that removes the error or moves it past the patched text. The result
+is only reported as fixed when the final code parses, so callers can show it
+without asking the model. Patches are limited to fixes that do not guess at
+what the code means.
+
+:func:`find_errors` runs the same loop to list every syntax error in a file.
+An error is only listed if it survives repairing the ones before it, so the
+follow-on errors of a missing colon or bracket are not reported.
+"""
+import ast
+import io
+import re
+import tokenize
+from typing import NamedTuple
+
+MAX_ROUNDS = 25
+INDENT = "    "
+_BLOCK_KEYWORDS = ("def", "class", "if", "elif", "else", "for", "while", "try", "except", "finally", "with",
+                   "async", "match", "case")
+_CLOSERS = {"(": ")", "[": "]", "{": "}"}
+_OPERAND_END = (tokenize.NAME, tokenize.NUMBER, tokenize.STRING)
+# Bracket and string errors come from the tokenizer, before the parser has seen earlier lines
+_TOKENIZER_ERROR = re.compile(r"was never closed|does not match opening|unmatched|unterminated")
+
+
+class SyntaxIssue(NamedTuple):
+    line: int
+    column: int  # 1-based, like SyntaxError.offset
+    message: str
+
+
+class Repair(NamedTuple):
+    code: str
+    fixes: list  # One description per applied patch, in order
+    ok: bool  # True if ``code`` parses
+
+    def explanation(self):
+        return " ".join(self.fixes) if self.fixes else "No automatic fix available."
+
+
+def first_error(code):
+    """The ``SyntaxError`` CPython raises for ``code``, or ``None`` if it parses."""
+    try:
+        ast.parse(code)
+    except SyntaxError as e:
+        return e
+    except ValueError as e:  # Null bytes
+        return SyntaxError(str(e), ("<unknown>", 1, 1, ""))
+    return None
+
+
+def find_errors(code, max_rounds=MAX_ROUNDS):
+    """Every syntax error in ``code`` as :class:`SyntaxIssue` objects, in file order.
+
+    Each error CPython reports is recorded and then repaired (or, if no patch
+    applies, its line is stubbed out) before looking for the next one, with
+    line numbers mapped back to ``code``.
+    """
+    issues = {}
+    origin = list(range(1, len(code.splitlines()) + 2))  # Line of the current code -> line of ``code``
+    error = first_error(code)
+    for _ in range(max_rounds):
+        if error is None:
+            break
+        line = origin[min(error.lineno or 1, len(origin)) - 1]
+        issues.setdefault((line, error.offset or 1), error.msg)
+        patched = _first_patch(code, error) or _stub_line(code, error)
+        if patched is None:
+            break
+        origin = [origin[min(old, len(origin)) - 1] for old in _line_origins(code, patched[0])]
+        code, error = patched[:2]
+    return [SyntaxIssue(line, column, message) for (line, column), message in sorted(issues.items())]
+
+
+def _code_end(line):
+    """Index just past the last code character of ``line``, ignoring a trailing comment."""
+    line = line.rstrip("\r\n")
+    quote = None
+    end = 0
+    index = 0
+    while index < len(line):
+        char = line[index]
+        if quote:
+            if char == "\\":
+                index += 1
+            elif line.startswith(quote, index):
+                index += len(quote) - 1
+                quote = None
+            end = index + 1
+        elif char == "#":
+            break
+        elif char in "'\"":
+            quote = line[index:index + 3] if line[index:index + 3] in ("'''", '"""') else char
+            index += len(quote) - 1
+            end = index + 1
+        elif not char.isspace():
+            end = index + 1
+        index += 1
+    return end
+
+
+def _indent(line):
+    return line[:len(line) - len(line.lstrip(" \t"))]
+
+
+def _insert(lines, line_no, column, text):
+    line = lines[line_no - 1]
+    lines[line_no - 1] = line[:column] + text + line[column:]
+
+
+def _append(lines, line_no, text):
+    _insert(lines, line_no, _code_end(lines[line_no - 1]), text)
+
+
+def _unclosed_line_end(lines, line_no):
+    """Last line of the statement that opened a bracket on ``line_no``: continuation lines are indented deeper."""
+    indent = len(_indent(lines[line_no - 1]).expandtabs())
+    last = line_no
+    for number in range(line_no + 1, len(lines) + 1):
+        line = lines[number - 1]
+        if not line.strip():
+            continue
+        if len(_indent(line).expandtabs()) <= indent:
+            break
+        last = number
+    return last
+
+
+def _add_colon(lines, error):
+    line_no = error.lineno
+    if error.msg != "expected ':'":
+        # Only a block header on the error line can be missing its colon
+        line = lines[line_no - 1]
+        words = line.split()
+        if not words or words[0].rstrip(":") not in _BLOCK_KEYWORDS or line[:_code_end(line)].endswith(":"):
+            return
+    _append(lines, line_no, ":")
+    yield f"Added the missing ':' at the end of line {line_no}."
+
+
+def _close_bracket(lines, error):
+    match = re.match(r"'(.)' was never closed", error.msg)
+    if not match:
+        return
+    opener, line_no = match.group(1), error.lineno
+    closer = _CLOSERS[opener]
+    header = lines[line_no - 1][:_code_end(lines[line_no - 1])]
+    if header.endswith(":") and header.split()[0] in _BLOCK_KEYWORDS:
+        _insert(lines, line_no, len(header) - 1, closer)  # def f(a, b:
+        yield f"Closed the '{opener}' opened on line {line_no} before the ':'."
+    end = _unclosed_line_end(lines, line_no)
+    _append(lines, end, closer)
+    yield f"Closed the '{opener}' opened on line {line_no} at the end of line {end}."
+    if end != line_no:
+        _append(lines, line_no, closer)
+        yield f"Closed the '{opener}' opened on line {line_no}."
+
+
+def _unmatched_bracket(lines, error):
+    line_no, column = error.lineno, (error.offset or 1) - 1
+    match = re.match(r"unmatched '(.)'", error.msg)
+    if match and lines[line_no - 1][column:column + 1] == match.group(1):
+        lines[line_no - 1] = lines[line_no - 1][:column] + lines[line_no - 1][column + 1:]
+        yield f"Removed the unmatched '{match.group(1)}' on line {line_no}."
+        return
+    # Only when both are on this line; across lines the bracket that is missing is anyone's guess
+    match = re.fullmatch(r"closing parenthesis '(.)' does not match opening parenthesis '(.)'", error.msg)
+    if match and lines[line_no - 1][column:column + 1] == match.group(1):
+        expected = _CLOSERS[match.group(2)]
+        lines[line_no - 1] = lines[line_no - 1][:column] + expected + lines[line_no - 1][column + 1:]
+        yield f"Replaced '{match.group(1)}' with '{expected}' on line {line_no}."
+        _insert(lines, line_no, column, expected)
+        yield f"Closed the '{match.group(2)}' before the '{match.group(1)}' on line {line_no}."
+
+
+def _close_string(lines, error):
+    line_no, column = error.lineno, (error.offset or 1) - 1
+    if error.msg.startswith("unterminated triple-quoted string literal"):
+        quote = lines[line_no - 1][column:].lstrip("rRbBuUfF")[:3]
+        if quote in ('"""', "'''"):
+            lines.append(quote + "\n")
+            yield f"Closed the triple-quoted string opened on line {line_no} at the end of the file."
+        return
+    if not error.msg.startswith("unterminated string literal"):
+        return
+    line = lines[line_no - 1]
+    match = re.search(r"['\"]", line[column:])
+    if not match:
+        return
+    quote = match.group(0)
+    end = _code_end(line)
+    trailing = len(line[:end]) - len(line[:end].rstrip(")]}:,"))
+    for kept in range(trailing, 0, -1):  # Close the string before the brackets that end the line, e.g. print("hi)
+        _insert(lines, line_no, end - kept, quote)
+        yield f"Closed the string on line {line_no}."
+    _insert(lines, line_no, len(line.rstrip("\r\n")), quote)
+    yield f"Closed the string on line {line_no}."
+
+
+def _fix_indentation(lines, error):
+    line_no = error.lineno
+    line = lines[line_no - 1]
+    body = line.lstrip(" \t")
+    previous = [lines[number - 1] for number in range(line_no - 1, 0, -1) if lines[number - 1].strip()
+                and not lines[number - 1].lstrip().startswith("#")]
+    if error.msg == "unexpected indent":
+        lines[line_no - 1] = (_indent(previous[0]) if previous else "") + body
+        yield f"Removed the unexpected indentation on line {line_no}."
+    elif error.msg.startswith("expected an indented block"):
+        header = re.search(r"on line (\d+)", error.msg)
+        header_indent = _indent(lines[int(header.group(1)) - 1]) if header else (_indent(previous[0]) if previous else "")
+        starts_block = body.split()[0].rstrip(":(") in _BLOCK_KEYWORDS if body.split() else False
+        if body.strip() and not (starts_block and _indent(line) == header_indent):
+            lines[line_no - 1] = header_indent + INDENT + body
+            yield f"Indented line {line_no} under the block that starts on line {header.group(1) if header else line_no - 1}."
+        lines.insert(line_no - 1, header_indent + INDENT + "pass\n")
+        yield f"Added 'pass' as the body of the empty block before line {line_no}."
+    elif error.msg == "unindent does not match any outer indentation level":
+        width = len(_indent(line).expandtabs())
+        # The previous line's level first, then the others from nearest to farthest
+        nearest = len(_indent(previous[0]).expandtabs()) if previous else 0
+        levels = sorted({len(_indent(other).expandtabs()) for other in previous},
+                        key=lambda level: (level != nearest, abs(level - width)))
+        for level in levels:
+            lines[line_no - 1] = " " * level + body
+            yield f"Aligned the indentation of line {line_no} with the enclosing block."
+    elif error.msg.startswith("inconsistent use of tabs and spaces"):
+        lines[:] = [_indent(other).expandtabs(len(INDENT)) + other.lstrip(" \t") for other in lines]
+        yield "Replaced tabs in the indentation with spaces."
+
+
+def _tokens(lines, first, last):
+    """Tokens of lines ``first`` to ``last``, up to the first tokenize error (e.g. an unclosed bracket)."""
+    tokens = []
+    try:
+        for token in tokenize.generate_tokens(io.StringIO("".join(lines[first - 1:last])).readline):
+            tokens.append(token)
+    except (tokenize.TokenError, SyntaxError):
+        pass
+    return tokens
+
+
+def _missing_comma(lines, error):
+    if "Perhaps you forgot a comma?" not in error.msg:
+        return
+    first, last = error.lineno, error.end_lineno or error.lineno
+    tokens = _tokens(lines, first, last)
+    start, end = (first, (error.offset or 1) - 1), (last, (error.end_offset or 1) - 1)
+    for left, right in zip(tokens, tokens[1:]):
+        left_start = (left.start[0] + first - 1, left.start[1])
+        right_end = (right.end[0] + first - 1, right.end[1])
+        if left_start < start or right_end > end:
+            continue
+        ends_operand = left.type in _OPERAND_END or left.string in (")", "]", "}")
+        # After a name or a closing bracket, '(' and '[' are a call or subscript, not a new operand
+        starts_operand = right.type in _OPERAND_END or right.string == "{" \
+            or right.string in ("(", "[") and left.type in (tokenize.NUMBER, tokenize.STRING)
+        if ends_operand and starts_operand:
+            line_no = left.end[0] + first - 1
+            _insert(lines, line_no, left.end[1], ",")
+            yield f"Added a missing ',' after '{left.string}' on line {line_no}."
+
+
+def _invalid_syntax(lines, error):
+    """For a bare "invalid syntax": close the bracket open at the error if the line never closes it."""
+    if error.msg != "invalid syntax" or not error.offset:
+        return
+    line_no, column = error.lineno, error.offset - 1
+    stack = []
+    unclosed = None
+    for token in _tokens(lines, line_no, line_no):
+        if token.start[0] != 1:
+            break
+        if unclosed is None and token.start[1] >= column:
+            unclosed = stack[-1] if stack else False
+        if token.string in _CLOSERS:
+            stack.append(token)
+        elif token.string in _CLOSERS.values() and stack:
+            stack.pop()
+    if unclosed and unclosed in stack:
+        _insert(lines, line_no, column, _CLOSERS[unclosed.string])
+        yield f"Closed the '{unclosed.string}' left open before column {column + 1} on line {line_no}."
+
+
+def _comparison(lines, error):
+    """``=`` for ``==``, only where ``:=`` cannot be meant: the target is not a bare name, or the value is a literal."""
+    if "Maybe you meant '==' instead of '='?" in error.msg:
+        walrus = False  # CPython has ruled ':=' out, e.g. for ``if f() = None``
+    elif "Maybe you meant '==' or ':=' instead of '='?" in error.msg:
+        walrus = True
+    else:
+        return
+    tokens = [token for token in _tokens(lines, error.lineno, error.end_lineno or error.lineno)
+              if token.type not in (tokenize.NL, tokenize.COMMENT)]
+    for index, token in enumerate(tokens):
+        if token.string != "=":
+            continue
+        bare_name = (index > 0 and tokens[index - 1].type == tokenize.NAME
+                     and (index == 1 or tokens[index - 2].string not in (".", "]", ")")))
+        value = []
+        for following in tokens[index + 1:]:
+            if following.string in (":", ")", "and", "or") or following.type == tokenize.NEWLINE:
+                break
+            value.append(following.string if following.type == tokenize.OP else following.type)
+        literal = value in ([tokenize.NUMBER], [tokenize.STRING], ["-", tokenize.NUMBER]) \
+            or [token.string for token in tokens[index + 1:index + 2]] in (["True"], ["False"], ["None"]) and len(value) == 1
+        if walrus and bare_name and not literal:
+            return  # ``while line = f.readline()`` may mean ':='; leave it to the model
+        line_no = token.start[0] + error.lineno - 1
+        _insert(lines, line_no, token.start[1], "=")
+        yield f"Replaced '=' with '==' in the condition on line {line_no}."
+        return
+
+
+def _print_call(lines, error):
+    if not error.msg.startswith("Missing parentheses in call to 'print'"):
+        return
+    line = lines[error.lineno - 1]
+    match = re.match(r"(\s*)print\s+", line)
+    if match:
+        end = _code_end(line)
+        lines[error.lineno - 1] = f"{match.group(1)}print({line[match.end():end]}){line[end:]}"
+        yield f"Added parentheses to the print call on line {error.lineno}."
+
+
+_PATCHES = (_add_colon, _close_bracket, _unmatched_bracket, _close_string, _fix_indentation, _missing_comma,
+            _invalid_syntax, _comparison, _print_call)
+
+
+def _candidates(code, error):
+    """``(patched code, description)`` for each patch that applies to ``error``.
+
+    A patch edits the list of lines in place and yields a description per
+    alternative; the lines are restored before it tries the next one.
+    """
+    lines = code.splitlines(keepends=True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+    if not error.lineno or error.lineno > len(lines):
+        return
+    for patch in _PATCHES:
+        working = list(lines)
+        for description in patch(working, error):
+            yield "".join(working), description
+            working[:] = lines
+
+
+def _patched_span(code, candidate):
+    """``((line, column), (line, column))``, 1-based, of the first and last character ``candidate`` changed in ``code``."""
+    old, new = code.splitlines(), candidate.splitlines()
+    head = 0
+    while head < min(len(old), len(new)) and old[head] == new[head]:
+        head += 1
+    tail = 0
+    while tail < min(len(old), len(new)) - head and old[-1 - tail] == new[-1 - tail]:
+        tail += 1
+    first_old = old[head] if head < len(old) else ""
+    first_new = new[head] if head < len(new) else ""
+    start = 0
+    while start < min(len(first_old), len(first_new)) and first_old[start] == first_new[start]:
+        start += 1
+    last = max(len(new) - tail, head + 1)
+    last_old = old[len(old) - tail - 1] if len(old) - tail > head else ""
+    last_new = new[last - 1] if last <= len(new) else ""
+    end = 0
+    while end < min(len(last_old), len(last_new)) - (start if last == head + 1 else 0) \
+            and last_old[-1 - end] == last_new[-1 - end]:
+        end += 1
+    return (head + 1, start + 1), (last, len(last_new) - end)
+
+
+def _progressed(before, after, span):
+    """True if the patch covering ``span`` removed ``before`` without causing ``after``.
+
+    ``after`` must be reported past the patched text. A bracket or string
+    error comes from the tokenizer before the parser has seen earlier lines,
+    so once it is fixed, an error before the patch is one that was already
+    there (unless it is another tokenizer error).
+    """
+    if after is None:
+        return True
+    position = (after.lineno or 0, after.offset or 0)
+    start, end = span
+    if position > end:
+        return True
+    return bool(_TOKENIZER_ERROR.search(before.msg)) and not _TOKENIZER_ERROR.search(after.msg) and position < start
+
+
+def _first_patch(code, error):
+    """``(patched code, its first error, description)`` for the first patch that makes the code parse, else the
+    first that makes progress, or ``None``."""
+    progressed = None
+    for candidate, description in _candidates(code, error):
+        candidate_error = first_error(candidate)
+        if candidate_error is None:
+            return candidate, None, description
+        if progressed is None and _progressed(error, candidate_error, _patched_span(code, candidate)):
+            progressed = candidate, candidate_error, description
+    return progressed
+
+
+def _stub_line(code, error):
+    """``(code, its first error)`` with the error's line replaced by ``pass``, or ``if True:`` for a block header.
+
+    Only used by :func:`find_errors` to look past an error no patch fixes.
+    """
+    lines = code.splitlines(keepends=True)
+    if not error.lineno or error.lineno > len(lines):
+        return None
+    first = error.lineno
+    while first > 1 and lines[first - 2].rstrip().endswith("\\"):
+        first -= 1
+    last = first
+    while last < len(lines) and lines[last - 1].rstrip().endswith("\\"):
+        last += 1
+    following = next((line for line in lines[last:] if line.strip() and not line.lstrip().startswith("#")), "")
+    header = len(_indent(following).expandtabs()) > len(_indent(lines[first - 1]).expandtabs())
+    stub = _indent(lines[first - 1]) + ("if True:" if header else "pass") + "\n"
+    if first == last and stub == lines[first - 1]:
+        return None
+    # Continuation lines become blank, so line numbers stay the same
+    lines[first - 1:last] = [stub] + ["\n"] * (last - first)
+    stubbed = "".join(lines)
+    stubbed_error = first_error(stubbed)
+    if stubbed_error is not None and (stubbed_error.lineno or 0) <= error.lineno:
+        return None  # The error is not confined to this line
+    return stubbed, stubbed_error
+
+
+def _line_origins(code, candidate):
+    """For each line of ``candidate``, plus one past its end, the line of ``code`` it came from."""
+    old, new = code.splitlines(), candidate.splitlines()
+    head = 0
+    while head < min(len(old), len(new)) and old[head] == new[head]:
+        head += 1
+    tail = 0
+    while tail < min(len(old), len(new)) - head and old[-1 - tail] == new[-1 - tail]:
+        tail += 1
+    replaced = max(len(old) - tail - head, 1)
+    middle = [head + 1 + min(index, replaced - 1) for index in range(len(new) - tail - head)]
+    return list(range(1, head + 1)) + middle + list(range(len(old) - tail + 1, len(old) + 2))
+
+
+def repair(code, max_rounds=MAX_ROUNDS):
+    """Fix syntax errors one at a time until ``code`` parses; see :class:`Repair`."""
+    error = first_error(code)
+    fixes = []
+    for _ in range(max_rounds):
+        if error is None:
+            break
+        patched = _first_patch(code, error)
+        if patched is None:
+            break
+        code, error, description = patched
+        fixes.append(description)
+    return Repair(code, fixes, error is None)
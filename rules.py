@@ -0,0 +1,699 @@
+"""Built-in rule engine for the most common mentor diagnostics.
+
+The checks the mentor relies on most (undefined names, PEP 8 naming, calls
+missing arguments, unused imports and blank lines around definitions) are
+found by a single walk over the ``ast`` tree that the syntax check already
+built, instead of starting pylint or flake8. That is fast enough to run on
+every keystroke.
+
+Rules are classes registered with :func:`register`. Each defines
+``visit_<NodeType>`` handlers, which the :class:`RuleEngine` calls during
+its one walk, and an optional ``finish`` called once the walk is over. The
+engine tracks scopes and bindings itself and resolves every name lookup, so
+rules can ask which names are undefined or unused without walking again.
+"""
+import ast
+import builtins
+import re
+from typing import NamedTuple
+
+RULES = {}
+DEFAULT_RULES = ("undefined-variable", "invalid-name", "missing-argument", "unused-import", "blank-lines")
+
+BUILTIN_NAMES = set(dir(builtins)) | {"__file__", "__name__", "__doc__", "__builtins__", "__spec__", "__loader__",
+                                      "__package__", "__path__", "__annotations__", "__cached__"}
+CLASS_FACTORIES = {"namedtuple", "NamedTuple", "TypedDict", "TypeVar", "NewType", "ParamSpec", "Enum", "type"}
+GOOD_NAMES = {"i", "j", "k", "ex", "Run", "_"}
+SNAKE_CASE = re.compile(r"([^\W\dA-Z][^\WA-Z]*|__[^\WA-Z\d_][^\WA-Z]+__)$")
+UPPER_CASE = re.compile(r"([^\W\da-z][^\Wa-z]*|__[^\W\dA-Z_]\w+__)$")
+PASCAL_CASE = re.compile(r"[^\W\da-z][^\W_]*$")
+TYPE_VARIABLE = re.compile(r"^_{0,2}(?!T[A-Z])(?:[A-Z]+|(?:[A-Z]+[a-z]+)+T?(?<!Type))(?:_co(?:ntra)?)?$")
+_NOQA = re.compile(r"#\s*noqa(?::\s*([\w, ]+))?", re.IGNORECASE)
+_PYLINT_DISABLE = re.compile(r"#\s*pylint:\s*disable=([\w\-, ]+)")
+_FUNCTIONS = (ast.FunctionDef, ast.AsyncFunctionDef)
+_COMPREHENSIONS = (ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.DictComp)
+
+
+class Finding(NamedTuple):
+    rule: str
+    code: str
+    line: int
+    column: int
+    message: str
+    name: str = None  # The function a missing-argument finding refers to
+
+    def __str__(self):
+        return f"{self.line}:{self.column + 1}: {self.code} {self.message}"
+
+
+class Scope:
+    def __init__(self, kind, parent=None):
+        self.kind = kind  # "module", "class", "function" or "comprehension"
+        self.parent = parent
+        self.bindings = {}  # name -> list of binding nodes
+        self.declared_global = set()
+        self.declared_nonlocal = set()
+        self.used = set()
+        self.star_import = False
+        self.star_used = False
+
+
+def register(rule_class):
+    """Class decorator adding a rule to :data:`RULES` under its ``name``."""
+    RULES[rule_class.name] = rule_class
+    return rule_class
+
+
+class Rule:
+    name = None
+    code = None
+    severity = "warning"  # "error", "warning" or "info", for editors
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def report(self, node, message, code=None, name=None, line=None):
+        self.engine.findings.append(Finding(self.name, code or self.code, line or node.lineno,
+                                            getattr(node, "col_offset", 0), message, name))
+
+    def finish(self):
+        pass
+
+
+class RuleEngine:
+    """Runs the enabled rules over one module in a single tree walk."""
+
+    def __init__(self, code, tree, rules=None):
+        self.code = code
+        self.lines = code.splitlines()
+        self.tree = tree
+        self.findings = []
+        self.module_scope = Scope("module")
+        self.scope = self.module_scope
+        self.uses = []  # (name, scope, node) for every name that is read
+        self.unresolved = []  # (name, node) once resolve() ran
+        self.rules = [RULES[name](self) for name in (rules or DEFAULT_RULES)]
+        self._handlers = {}  # AST node class -> rule visit methods
+        for rule in self.rules:
+            for attribute in dir(rule):
+                if attribute.startswith("visit_") and hasattr(ast, attribute[6:]):
+                    self._handlers.setdefault(getattr(ast, attribute[6:]), []).append(getattr(rule, attribute))
+        self._special = self._build_special()  # AST node class -> scope bookkeeping
+
+    def run(self):
+        self.walk(self.tree)
+        self.resolve()
+        for rule in self.rules:
+            rule.finish()
+        findings = [finding for finding in self.findings if not self._suppressed(finding)]
+        return sorted(findings, key=lambda finding: (finding.line, finding.column))
+
+    def _suppressed(self, finding):
+        """Honour ``# noqa`` / ``# noqa: CODE`` and ``# pylint: disable=rule`` on the reported line."""
+        line = self.lines[finding.line - 1] if finding.line <= len(self.lines) else ""
+        if "#" not in line:
+            return False
+        match = _NOQA.search(line)
+        if match and (not match.group(1) or finding.code in match.group(1).upper()):
+            return True
+        match = _PYLINT_DISABLE.search(line)
+        return bool(match) and (finding.rule in match.group(1) or finding.code in match.group(1))
+
+    # Scope tracking
+
+    def bind(self, name, node, scope=None):
+        scope = scope or self.scope
+        if name in scope.declared_global:
+            scope = self.module_scope
+        scope.bindings.setdefault(name, []).append(node)
+
+    def lookup(self, name, scope):
+        """Return the scope that defines ``name`` as seen from ``scope``, or ``None``."""
+        if name in scope.declared_global:
+            return self.module_scope if name in self.module_scope.bindings else None
+        current = scope
+        while current is not None:
+            if current is scope or current.kind != "class":  # Class bodies are not visible to nested scopes
+                if name in current.bindings:
+                    return current
+            current = current.parent
+        return None
+
+    def _star_imported(self, scope):
+        """True if a star import may define names for ``scope``; marks that import as used."""
+        while scope is not None:
+            if scope.star_import:
+                scope.star_used = True
+                return True
+            scope = scope.parent
+        return False
+
+    def resolve(self):
+        for name, scope, node in self.uses:
+            found = self.lookup(name, scope)
+            if found is not None:
+                found.used.add(name)
+            elif name not in BUILTIN_NAMES and not self._star_imported(scope) \
+                    and not (name == "__class__" and scope.kind == "function"):
+                self.unresolved.append((name, node))
+
+    def _push(self, kind, node):
+        self.scope = Scope(kind, self.scope)
+        self.scope.node = node
+
+    def _pop(self):
+        self.scope = self.scope.parent
+
+    # The walk
+
+    def walk(self, node):
+        kind = type(node)
+        for handler in self._handlers.get(kind, ()):
+            handler(node)
+        special = self._special.get(kind)
+        if special is not None and special(node):
+            return  # The special case walked the children itself
+        for field in kind._fields:
+            value = getattr(node, field, None)
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        self.walk(item)
+            elif isinstance(value, ast.AST):
+                self.walk(value)
+
+    def _name(self, node):
+        if isinstance(node.ctx, ast.Store):
+            self.bind(node.id, node)
+        else:
+            self.uses.append((node.id, self.scope, node))
+
+    def _import(self, node):
+        for alias in node.names:
+            if alias.name == "*":
+                self.scope.star_import = True
+            else:
+                self.bind(alias.asname or alias.name.split(".")[0], node)
+
+    def _named_expr(self, node):
+        scope = self.scope
+        while scope.kind == "comprehension":  # The target binds in the enclosing function
+            scope = scope.parent
+        self.bind(node.target.id, node.target, scope)
+        self.walk(node.value)
+        return True
+
+    def _bind_name_attribute(self, node):
+        if node.name:
+            self.bind(node.name, node)
+
+    def _build_special(self):
+        special = {
+            ast.Name: self._name,
+            ast.Import: self._import,
+            ast.ImportFrom: self._import,
+            ast.Global: lambda node: self.scope.declared_global.update(node.names),
+            ast.Nonlocal: lambda node: self.scope.declared_nonlocal.update(node.names),
+            ast.FunctionDef: self._walk_function,
+            ast.AsyncFunctionDef: self._walk_function,
+            ast.Lambda: self._walk_function,
+            ast.ClassDef: self._walk_class,
+            ast.NamedExpr: self._named_expr,
+            ast.ExceptHandler: self._bind_name_attribute,
+            ast.arg: lambda node: self.bind(node.arg, node),
+        }
+        for kind in _COMPREHENSIONS:
+            special[kind] = self._walk_comprehension
+        for name in ("MatchAs", "MatchStar"):  # Python 3.10+
+            if hasattr(ast, name):
+                special[getattr(ast, name)] = self._bind_name_attribute
+        if hasattr(ast, "MatchMapping"):
+            special[ast.MatchMapping] = lambda node: node.rest and self.bind(node.rest, node)
+        return special
+
+    def _walk_function(self, node):
+        arguments = node.args
+        # Decorators, defaults and annotations are evaluated in the enclosing scope
+        for child in getattr(node, "decorator_list", []) + arguments.defaults + \
+                [default for default in arguments.kw_defaults if default is not None]:
+            self.walk(child)
+        if getattr(node, "returns", None) is not None:
+            self.walk(node.returns)
+        if not isinstance(node, ast.Lambda):
+            self.bind(node.name, node)
+        self._push("function", node)
+        for argument in arguments.posonlyargs + arguments.args + arguments.kwonlyargs + \
+                [arg for arg in (arguments.vararg, arguments.kwarg) if arg is not None]:
+            self.walk(argument)
+        for child in (node.body if isinstance(node.body, list) else [node.body]):
+            self.walk(child)
+        self._pop()
+        return True
+
+    def _walk_class(self, node):
+        for child in node.decorator_list + node.bases + node.keywords:
+            self.walk(child)
+        self.bind(node.name, node)
+        self._push("class", node)
+        for child in node.body:
+            self.walk(child)
+        self._pop()
+        return True
+
+    def _walk_comprehension(self, node):
+        generators = node.generators
+        self.walk(generators[0].iter)  # The first iterable is evaluated in the enclosing scope
+        self._push("comprehension", node)
+        for index, generator in enumerate(generators):
+            if index:
+                self.walk(generator.iter)
+            self.walk(generator.target)
+            for condition in generator.ifs:
+                self.walk(condition)
+        for child in ((node.key, node.value) if isinstance(node, ast.DictComp) else (node.elt,)):
+            self.walk(child)
+        self._pop()
+        return True
+
+
+@register
+class UndefinedVariable(Rule):
+    name = "undefined-variable"
+    code = "E0602"
+    severity = "error"
+
+    def finish(self):
+        for name, node in self.engine.unresolved:
+            self.report(node, f"Undefined variable '{name}'")
+
+
+@register
+class InvalidName(Rule):
+    """pylint's default naming styles: snake_case, PascalCase classes, UPPER_CASE module constants."""
+    name = "invalid-name"
+    code = "C0103"
+    severity = "info"
+
+    def __init__(self, engine):
+        super().__init__(engine)
+        self._aliases = set()  # ``x = SomeName`` targets, which may name a class
+        self._attributes = set()
+
+    def _check(self, node, name, kind, style, pattern, line=None):
+        if name not in GOOD_NAMES and not pattern.match(name):
+            self.report(node, f'{kind} name "{name}" doesn\'t conform to {style} naming style', line=line)
+
+    def visit_FunctionDef(self, node):
+        kind = "Method" if self.engine.scope.kind == "class" else "Function"
+        self._check(node, node.name, kind, "snake_case", SNAKE_CASE)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        self._check(node, node.name, "Class", "PascalCase", PASCAL_CASE)
+
+    def visit_arg(self, node):
+        if self.engine.scope.kind == "function" and isinstance(self.engine.scope.node, _FUNCTIONS):
+            self._check(node, node.arg, "Argument", "snake_case", SNAKE_CASE)
+
+    def visit_Assign(self, node):
+        self._aliases = {id(target) for target in node.targets if isinstance(node.value, ast.Name)}
+
+    def visit_Name(self, node):
+        scope = self.engine.scope
+        if isinstance(node.ctx, ast.Store) and scope.kind == "function" and id(node) not in self._aliases \
+                and node.id not in scope.declared_global | scope.declared_nonlocal:
+            self._check(node, node.id, "Variable", "snake_case", SNAKE_CASE)
+
+    def visit_Attribute(self, node):
+        if isinstance(node.ctx, ast.Store) and isinstance(node.value, ast.Name) and node.value.id == "self":
+            key = (id(self.engine.scope.parent), node.attr)
+            if key not in self._attributes:  # Only the first assignment in a class is reported
+                self._attributes.add(key)
+                self._check(node, node.attr, "Attribute", "snake_case", SNAKE_CASE)
+
+    def _module_assignments(self, body, in_main=False, in_handler=False, found=None):
+        """``name -> [(target, value, in_main, in_handler)]`` for assignments to module-level names.
+
+        Only the bodies of ``if`` and ``try`` statements are entered; names
+        bound by module-level ``for`` and ``with`` statements are not checked.
+        """
+        found = {} if found is None else found
+        for statement in body:
+            if isinstance(statement, ast.Assign):
+                targets, value = statement.targets, statement.value
+            elif isinstance(statement, (ast.AnnAssign, ast.AugAssign)):
+                targets, value = [statement.target], statement.value
+            elif isinstance(statement, ast.If):
+                main = in_main or _is_main_check(statement.test)
+                self._module_assignments(statement.body, main, in_handler, found)
+                self._module_assignments(statement.orelse, in_main, in_handler, found)
+                continue
+            elif isinstance(statement, ast.Try):
+                for block in (statement.body, statement.orelse, statement.finalbody):
+                    self._module_assignments(block, in_main, in_handler, found)
+                for handler in statement.handlers:
+                    self._module_assignments(handler.body, in_main, True, found)
+                continue
+            else:
+                continue
+            for target in targets:
+                if isinstance(target, ast.Name):
+                    found.setdefault(target.id, []).append((target, value, in_main, in_handler))
+        return found
+
+    def finish(self):
+        local_functions = {node.name for node in self.engine.tree.body if isinstance(node, _FUNCTIONS)}
+        local_classes = {node.name for node in self.engine.tree.body if isinstance(node, ast.ClassDef)}
+        imported = {name for name, nodes in self.engine.module_scope.bindings.items()
+                    if any(isinstance(node, (ast.Import, ast.ImportFrom)) for node in nodes)}
+        for name, assignments in self._module_assignments(self.engine.tree.body).items():
+            if name.startswith("__") and name.endswith("__"):
+                continue
+            reassigned = sum(1 for *_, in_handler in assignments if not in_handler) > 1
+            for target, value, in_main, in_handler in assignments:
+                if in_handler and name in imported:
+                    continue  # Fallback for an optional import
+                if isinstance(value, ast.Name) and (isinstance(getattr(builtins, value.id, None), type)
+                                                    or value.id in local_classes
+                                                    or _looks_like_class(value.id)):
+                    if _looks_like_class(name):
+                        self._check(target, name, "Class", "PascalCase", PASCAL_CASE)  # An alias of a class
+                    elif not (UPPER_CASE.match(name) or SNAKE_CASE.match(name)):  # A type alias, ``type_alias = int``
+                        self._check(target, name, "Constant", "UPPER_CASE", UPPER_CASE)
+                elif isinstance(value, (ast.Name, ast.Attribute, ast.Subscript)):
+                    continue  # Could be anything; pylint only checks what it can infer
+                elif _makes_class(value):
+                    if _call_name(value) in ("TypeVar", "ParamSpec"):
+                        self._check(target, name, "Type variable", "predefined", TYPE_VARIABLE)
+                    else:
+                        self._check(target, name, "Class", "PascalCase", PASCAL_CASE)
+                elif isinstance(value, (ast.Call, ast.List, ast.Dict, ast.Set) + _COMPREHENSIONS):
+                    if not (UPPER_CASE.match(name) or SNAKE_CASE.match(name)
+                            or PASCAL_CASE.match(name) and isinstance(value, ast.Call)
+                            and _call_name(value) not in local_functions):  # Could return a class
+                        self._check(target, name, "Constant", "UPPER_CASE", UPPER_CASE)
+                elif not _is_literal(value):
+                    continue  # pylint only checks values it can infer
+                elif reassigned or in_main:
+                    self._check(target, name, "Variable", "snake_case", SNAKE_CASE)
+                else:
+                    self._check(target, name, "Constant", "UPPER_CASE", UPPER_CASE)
+
+
+def _looks_like_class(name):
+    """True for CamelCase names, which start with a capital and are not UPPER_CASE."""
+    return name[:1].isupper() and not UPPER_CASE.match(name)
+
+
+def _is_literal(value):
+    """True for constants and f-strings, and arithmetic on them."""
+    if isinstance(value, (ast.Constant, ast.JoinedStr)):
+        return True
+    if isinstance(value, ast.UnaryOp):
+        return _is_literal(value.operand)
+    if isinstance(value, ast.BinOp):  # Usually on other constants, as in ``HEX = DIGITS + "abcdef"``
+        return all(isinstance(side, (ast.Name, ast.Call)) or _is_literal(side) for side in (value.left, value.right))
+    return False
+
+
+def _call_name(call):
+    func = call.func
+    return func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", "")
+
+
+def _makes_class(value):
+    """True for calls such as ``namedtuple(...)`` and ``TypeVar(...)`` that create a class."""
+    return isinstance(value, ast.Call) and _call_name(value).lstrip("_") in CLASS_FACTORIES
+
+
+def _is_main_check(test):
+    """True for ``__name__ == "__main__"``."""
+    return isinstance(test, ast.Compare) and isinstance(test.left, ast.Name) and test.left.id == "__name__" \
+        and len(test.comparators) == 1 and isinstance(test.comparators[0], ast.Constant) \
+        and test.comparators[0].value == "__main__"
+
+
+@register
+class MissingArgument(Rule):
+    """Calls to a module-level function that leave a required parameter without a value."""
+    name = "missing-argument"
+    code = "E1120"
+    severity = "error"
+
+    def __init__(self, engine):
+        super().__init__(engine)
+        self.functions = {}
+        self.calls = []
+
+    def visit_FunctionDef(self, node):
+        if self.engine.scope.kind == "module":
+            self.functions[node.name] = node
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Call(self, node):
+        if isinstance(node.func, ast.Name):
+            self.calls.append((node, self.engine.scope))
+
+    def finish(self):
+        for call, scope in self.calls:
+            function = self.functions.get(call.func.id)
+            if function is None or self.engine.lookup(call.func.id, scope) is not self.engine.module_scope \
+                    or len(self.engine.module_scope.bindings[call.func.id]) != 1:
+                continue  # Not the module-level function, or it is rebound somewhere
+            if any(isinstance(arg, ast.Starred) for arg in call.args) or any(kw.arg is None for kw in call.keywords):
+                continue
+            arguments = function.args
+            positional = arguments.posonlyargs + arguments.args
+            required = positional[:len(positional) - len(arguments.defaults)]
+            keywords = {kw.arg for kw in call.keywords}
+            missing = [arg.arg for arg in required[len(call.args):] if arg.arg not in keywords]
+            missing += [arg.arg for arg, default in zip(arguments.kwonlyargs, arguments.kw_defaults)
+                        if default is None and arg.arg not in keywords]
+            for name in missing:
+                self.report(call, f"No value for argument '{name}' in function call", name=call.func.id)
+
+
+@register
+class UnusedImport(Rule):
+    name = "unused-import"
+    code = "F401"
+
+    def __init__(self, engine):
+        super().__init__(engine)
+        self.imports = []  # (node, alias, scope, qualified name)
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.imports.append((node, alias, self.engine.scope, alias.name))
+
+    def visit_ImportFrom(self, node):
+        if node.module == "__future__":
+            return
+        prefix = "." * node.level + (f"{node.module}." if node.module else "")
+        for alias in node.names:
+            self.imports.append((node, alias, self.engine.scope, prefix + alias.name))
+
+    def finish(self):
+        exported = set(self._all_names())
+        for node, alias, scope, qualified in self.imports:
+            if alias.name == "*":
+                if not scope.star_used:
+                    self.report(node, f"'{qualified}' imported but unused")
+                continue
+            bound = alias.asname or alias.name.split(".")[0]
+            if bound in scope.used or (scope is self.engine.module_scope and bound in exported):
+                continue
+            shown = f"{qualified} as {alias.asname}" if alias.asname else qualified
+            self.report(node, f"'{shown}' imported but unused")
+
+    def _all_names(self):
+        """String literals assigned to ``__all__`` at module level."""
+        for node in self.engine.tree.body:
+            if isinstance(node, ast.Assign) and isinstance(node.value, (ast.List, ast.Tuple)) \
+                    and any(isinstance(target, ast.Name) and target.id == "__all__" for target in node.targets):
+                for element in node.value.elts:
+                    if isinstance(element, ast.Constant) and isinstance(element.value, str):
+                        yield element.value
+
+
+@register
+class BlankLines(Rule):
+    """pycodestyle E301/E302/E305: blank lines around top-level definitions and methods."""
+    name = "blank-lines"
+    code = "E302"
+    severity = "info"
+
+    def _blank_lines_before(self, line):
+        """``(most, direct)`` blank lines above ``line`` (1-based).
+
+        Like pycodestyle, ``most`` is the longest run of blank lines between
+        the previous code line and ``line``, looking through comment lines;
+        ``direct`` is the run right above ``line``.
+        """
+        lines = self.engine.lines
+        index = line - 2
+        direct = 0
+        while index - direct >= 0 and not lines[index - direct].strip():
+            direct += 1
+        runs = [0]
+        while index >= 0:
+            text = lines[index].strip()
+            if not text:
+                runs[-1] += 1
+            elif text.startswith("#"):
+                if runs[-1]:
+                    runs.append(0)
+            else:
+                break
+            index -= 1
+        return max(runs), direct
+
+    @staticmethod
+    def _start(node):
+        return min([node.lineno] + [decorator.lineno for decorator in getattr(node, "decorator_list", [])])
+
+    def visit_Module(self, node):
+        previous = None
+        for statement in node.body:
+            is_definition = isinstance(statement, _FUNCTIONS + (ast.ClassDef,))
+            start = self._start(statement)
+            if previous is not None:
+                blanks, _ = self._blank_lines_before(start)
+                if is_definition and blanks < 2 and not (blanks == 0 and _one_liner(previous)):
+                    self.report(statement, f"expected 2 blank lines, found {blanks}", line=start)
+                elif not is_definition and isinstance(previous, _FUNCTIONS + (ast.ClassDef,)) and blanks < 2:
+                    self.report(statement, f"expected 2 blank lines after class or function definition, found {blanks}",
+                                code="E305", line=start)
+            previous = statement
+
+    def visit_ClassDef(self, node):
+        for index, statement in enumerate(node.body):
+            previous = node.body[index - 1] if index else None
+            if isinstance(previous, ast.Expr) and isinstance(previous.value, ast.Constant) \
+                    and isinstance(previous.value.value, str):
+                continue  # pycodestyle allows a method right after a docstring
+            if index and isinstance(statement, _FUNCTIONS):
+                start = self._start(statement)
+                blanks, direct = self._blank_lines_before(start)
+                if blanks == 0 or (blanks > 1 and direct < blanks):  # pycodestyle reports E303 otherwise
+                    self.report(statement, "expected 1 blank line, found 0", code="E301", line=start)
+
+
+def _one_liner(node):
+    """True for ``def f(): return 1``, which pycodestyle lets you group without blank lines."""
+    return isinstance(node, _FUNCTIONS) and node.body[0].lineno == node.lineno
+
+
+def check_code(code, tree=None, rules=None):
+    """Run the rules over ``code`` and return the :class:`Finding` list, sorted by position."""
+    if tree is None:
+        tree = ast.parse(code)
+    return RuleEngine(code, tree, rules).run()
+
+
+def feedback_for(rule, line, mode, hint_num, name="add_numbers"):
+    """The ``(errors, hints)`` dicts the mentor shows for one finding of ``rule``.
+
+    These are the messages ``gemmacheck2.analyze_code`` has always produced.
+    """
+    errors = []
+    hints = []
+    if rule == 'undefined-variable':
+        errors.append({
+            'type': 'error',
+            'line': line,
+            'message': 'Error: Variable used before definition.',
+            'explanation': 'Hint: Check if you initialized it.'
+        })
+        if mode == 'hint':
+            hints.append({
+                'message': f"Hint {hint_num}: Define the variable before using it.",
+                'explanation': 'Try setting it to a default value, like `x = 0`.'
+            } if hint_num == 1 else {
+                'message': f"Hint {hint_num}: Check the line above this error.",
+                'explanation': 'Ensure the variable is assigned before use.'
+            } if hint_num == 2 else {
+                'message': f"Hint {hint_num}: Use an assignment statement.",
+                'explanation': 'Add `x = 0` before the line.'
+            })
+        elif mode == 'step':
+            hints.append({
+                'message': f"Step {hint_num}: Define the variable above this line.",
+                'explanation': 'Add `x = 0` before using `x`. Want the next step?' if hint_num < 3 else 'Try the solution now.'
+            })
+        elif mode == 'solution':
+            hints.append({
+                'message': 'Solution: Add `x = 0` before using the variable.',
+                'explanation': 'This defines the variable to avoid NameError.'
+            })
+    elif rule == 'invalid-name':
+        hints.append({
+            'type': 'suggestion',
+            'line': line,
+            'message': 'Hint: Variable name doesn’t follow PEP 8.',
+            'explanation': 'Use snake_case, like `my_variable`.'
+        })
+        if mode == 'hint':
+            hints.append({
+                'message': f"Hint {hint_num}: Rename to follow PEP 8.",
+                'explanation': 'Use underscores, e.g., `my_variable`.'
+            } if hint_num == 1 else {
+                'message': f"Hint {hint_num}: Avoid camelCase.",
+                'explanation': 'Python prefers snake_case for variables.'
+            } if hint_num == 2 else {
+                'message': f"Hint {hint_num}: Check PEP 8 guidelines.",
+                'explanation': 'See https://peps.python.org/pep-0008/.'
+            })
+        elif mode == 'step':
+            hints.append({
+                'message': f"Step {hint_num}: Rename to snake_case.",
+                'explanation': 'Change `myVariable` to `my_variable`. Want the next step?' if hint_num < 3 else 'Try the solution now.'
+            })
+        elif mode == 'solution':
+            hints.append({
+                'message': 'Solution: Rename to `my_variable`.',
+                'explanation': 'This follows PEP 8 for Python variable names.'
+            })
+    elif rule == 'missing-argument':
+        errors.append({
+            'type': 'error',
+            'line': line,
+            'message': f'Error: Missing argument for `{name}`.',
+            'explanation': 'Hint: The function expects two parameters.'
+        })
+        if mode == 'hint':
+            hints.append({
+                'message': f"Hint {hint_num}: Check the number of arguments in `{name}`.",
+                'explanation': f'The function needs two inputs, like `{name}(5, 10)`.' if hint_num == 1 else
+                             'Count the parameters in the function definition.' if hint_num == 2 else
+                             'Look at the function’s signature for clues.'
+            })
+        elif mode == 'step':
+            hints.append({
+                'message': f"Step {hint_num}: Check the function definition.",
+                'explanation': f'See how many parameters `{name}` expects.' if hint_num == 1 else
+                             'Add a second argument to the function call.' if hint_num == 2 else
+                             f'Try calling `{name}` with two numbers.'
+            })
+        elif mode == 'solution':
+            hints.append({
+                'message': f'Solution: Call `{name}(5, 10)`.',
+                'explanation': 'This provides the required second argument.'
+            })
+    return errors, hints
+
+
+def mentor_feedback(findings, mode='analyze', hint_num=1):
+    """Turn findings into the list of dicts ``gemmacheck2.analyze_code`` returns."""
+    errors = []
+    hints = []
+    for finding in findings:
+        finding_errors, finding_hints = feedback_for(finding.rule, finding.line, mode, hint_num,
+                                                     finding.name or "add_numbers")
+        errors.extend(finding_errors)
+        hints.extend(finding_hints)
+    if mode == 'analyze':
+        return errors + hints
+    return hints
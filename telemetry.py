@@ -0,0 +1,214 @@
+"""Timing spans and resource metrics.
+
+Wrap a stage in ``with span("flake8"):`` to time it. A finished span records
+its duration, the process RSS and any fields the caller set on it (for
+generation: prompt and generated token counts, from which tokens/s is
+derived). Spans are
+
+* written as one JSON object per line to the trace sink, if one is configured
+  (``--trace`` or ``CODEMENTOR_TRACE``: ``stderr`` or a file path),
+* aggregated per stage and written in Prometheus text format by
+  :func:`write_metrics` (``--metrics`` or ``CODEMENTOR_METRICS``),
+* handed to any :func:`collect` block open on the same thread, which is how
+  the server reports per-request timings.
+"""
+import atexit
+import contextlib
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+from mentor_cache import atomic_write_text
+
+_lock = threading.Lock()
+_local = threading.local()
+_ids = itertools.count(1)
+_trace_stream = None
+_metrics_path = None
+_stages = {}  # name -> {"count", "seconds", "prompt_tokens", "generated_tokens"}
+
+
+def rss_bytes():
+    """Current resident set size of this process, or ``None`` if it cannot be read."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        pass
+    try:
+        import resource  # Peak rather than current RSS, but better than nothing
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+
+def configure(trace=None, metrics=None):
+    """Set the NDJSON trace sink and the Prometheus metrics file.
+
+    Arguments default to ``CODEMENTOR_TRACE`` and ``CODEMENTOR_METRICS``. The
+    metrics file is also written when the process exits.
+    """
+    global _trace_stream, _metrics_path
+    trace = trace or os.environ.get("CODEMENTOR_TRACE")
+    if trace in ("stderr", "-"):
+        _trace_stream = sys.stderr
+    elif trace:
+        _trace_stream = open(trace, "a", encoding="utf-8", buffering=1)
+    _metrics_path = metrics or os.environ.get("CODEMENTOR_METRICS") or _metrics_path
+    if _metrics_path:
+        atexit.register(write_metrics)
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+        _local.collectors = []
+    return _local.stack
+
+
+@contextlib.contextmanager
+def span(name, **fields):
+    """Time the enclosed block as stage ``name``.
+
+    Yields the span's field dict; set ``prompt_tokens`` and
+    ``generated_tokens`` on it to get token counts and tokens/s.
+    """
+    stack = _stack()
+    record = {"span": name, "id": next(_ids), "parent": stack[-1]["id"] if stack else None}
+    record.update(fields)
+    stack.append(record)
+    start_wall = time.time()
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        record["ts"] = round(start_wall, 3)
+        record["duration_ms"] = round(seconds * 1000, 2)
+        if record.get("generated_tokens") and seconds > 0:
+            record["tokens_per_s"] = round(record["generated_tokens"] / seconds, 1)
+        rss = rss_bytes()
+        record["rss_mb"] = round(rss / (1024 * 1024), 1) if rss else None
+        _finish(record, seconds)
+
+
+def _finish(record, seconds):
+    for collector in _local.collectors:
+        collector.append(record)
+    with _lock:
+        stage = _stages.setdefault(record["span"], {"count": 0, "seconds": 0.0, "prompt_tokens": 0,
+                                                    "generated_tokens": 0})
+        stage["count"] += 1
+        stage["seconds"] += seconds
+        stage["prompt_tokens"] += record.get("prompt_tokens") or 0
+        stage["generated_tokens"] += record.get("generated_tokens") or 0
+        if _trace_stream is not None:
+            try:
+                _trace_stream.write(json.dumps(dict(record, pid=os.getpid())) + "\n")
+                _trace_stream.flush()
+            except (OSError, ValueError):
+                pass
+
+
+@contextlib.contextmanager
+def collect():
+    """Collect the spans finished on this thread inside the block into a list."""
+    _stack()
+    records = []
+    _local.collectors.append(records)
+    try:
+        yield records
+    finally:
+        _local.collectors.remove(records)
+
+
+def breakdown(records, total_seconds=None):
+    """Summarize collected spans for display: time per innermost stage plus tokens and RSS.
+
+    Only spans without children are listed, so nested stages are not counted
+    twice; repeated stages (one generation per chunk, say) are summed.
+    """
+    parents = {record["parent"] for record in records}
+    stages = {}
+    for record in records:
+        if record["id"] not in parents:
+            stages[record["span"]] = round(stages.get(record["span"], 0) + record["duration_ms"], 2)
+    generate = [record for record in records if record.get("generated_tokens")]
+    summary = {"stages": stages, "rss_mb": max((r["rss_mb"] for r in records if r.get("rss_mb")), default=None)}
+    if total_seconds is not None:
+        summary["total_ms"] = round(total_seconds * 1000, 2)
+    if generate:
+        seconds = sum(record["duration_ms"] for record in generate) / 1000
+        summary["prompt_tokens"] = sum(record.get("prompt_tokens") or 0 for record in generate)
+        summary["generated_tokens"] = sum(record["generated_tokens"] for record in generate)
+        summary["tokens_per_s"] = round(summary["generated_tokens"] / seconds, 1) if seconds else None
+    return summary
+
+
+def format_breakdown(summary):
+    """One line such as ``1234 ms: flake8 40 ms, generate 1100 ms (52 tok, 47 tok/s), RSS 512 MB``."""
+    parts = []
+    for name, ms in summary["stages"].items():
+        part = f"{name} {ms:.0f} ms"
+        if name == "generate" and summary.get("generated_tokens"):
+            part += f" ({summary['generated_tokens']} tok, {summary['tokens_per_s'] or 0:.0f} tok/s)"
+        parts.append(part)
+    if summary.get("rss_mb"):
+        parts.append(f"RSS {summary['rss_mb']:.0f} MB")
+    total = f"{summary['total_ms']:.0f} ms: " if summary.get("total_ms") is not None else ""
+    return total + ", ".join(parts)
+
+
+def render_metrics():
+    """Aggregated stage metrics in Prometheus text exposition format."""
+    with _lock:
+        stages = {name: dict(values) for name, values in _stages.items()}
+    lines = [
+        "# HELP codementor_stage_duration_seconds Time spent in each pipeline stage.",
+        "# TYPE codementor_stage_duration_seconds summary",
+    ]
+    for name, values in sorted(stages.items()):
+        label = json.dumps(name)  # Quotes and escapes the label value
+        lines.append(f"codementor_stage_duration_seconds_count{{stage={label}}} {values['count']}")
+        lines.append(f"codementor_stage_duration_seconds_sum{{stage={label}}} {values['seconds']:.6f}")
+    lines += [
+        "# HELP codementor_tokens_total Prompt and generated tokens per stage.",
+        "# TYPE codementor_tokens_total counter",
+    ]
+    for name, values in sorted(stages.items()):
+        label = json.dumps(name)
+        for kind in ("prompt", "generated"):
+            if values[f"{kind}_tokens"]:
+                lines.append(f"codementor_tokens_total{{stage={label},kind=\"{kind}\"}} {values[f'{kind}_tokens']}")
+    rss = rss_bytes()
+    if rss:
+        lines += [
+            "# HELP codementor_resident_memory_bytes Resident set size of the process.",
+            "# TYPE codementor_resident_memory_bytes gauge",
+            f"codementor_resident_memory_bytes {rss}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path=None):
+    """Write :func:`render_metrics` to ``path`` (default: the configured metrics file)."""
+    path = path or _metrics_path
+    if not path:
+        return
+    try:
+        atomic_write_text(path, render_metrics())
+    except OSError as e:
+        print(f"[!] Could not write metrics to {path}: {e}", file=sys.stderr)
@@ -0,0 +1,60 @@
+from diffscope import _unquote, parse_diff
+
+DIFF = '''diff --git a/pkg/mod.py b/pkg/mod.py
+index 1111111..2222222 100644
+--- a/pkg/mod.py
++++ b/pkg/mod.py
+@@ -3,0 +4,2 @@ def f():
++x = 1
++y = 2
+@@ -10 +12 @@ def g():
+-a = 1
++a = 2
+@@ -20,3 +21,0 @@ def h():
+-gone = 1
+-gone = 2
+-gone = 3
+diff --git a/new.py b/new.py
+new file mode 100644
+--- /dev/null
++++ b/new.py
+@@ -0,0 +1,3 @@
++one = 1
++two = 2
++three = 3
+diff --git a/old.py b/old.py
+deleted file mode 100644
+--- a/old.py
++++ /dev/null
+@@ -1,2 +0,0 @@
+-a = 1
+-b = 2
+'''
+
+
+def test_parse_diff_hunks():
+    changed = parse_diff(DIFF)
+    assert changed["pkg/mod.py"] == [(4, 5), (12, 12), (21, 21)]
+    assert changed["new.py"] == [(1, 3)]
+    assert "old.py" not in changed
+
+
+def test_parse_diff_quoted_path():
+    diff = ('diff --git "a/caf\\303\\251.py" "b/caf\\303\\251.py"\n'
+            '--- "a/caf\\303\\251.py"\n'
+            '+++ "b/caf\\303\\251.py"\n'
+            '@@ -1 +1 @@\n'
+            '-a = 1\n'
+            '+a = 2\n')
+    assert parse_diff(diff) == {"café.py": [(1, 1)]}
+
+
+def test_parse_diff_ignores_hunks_without_a_file():
+    assert parse_diff("@@ -1 +1 @@\n-a\n+b\n") == {}
+
+
+def test_unquote():
+    assert _unquote("b/plain.py") == "b/plain.py"
+    assert _unquote('"b/caf\\303\\251.py"') == "b/café.py"
+    assert _unquote('"b/a\\"q\\\\.py"') == 'b/a"q\\.py'
+    assert _unquote('"b/tab\\there.py"') == "b/tab\there.py"
@@ -0,0 +1,72 @@
+from generation import BUDGETS, LOOP_WINDOW, StreamTrimmer, stop_index, trim
+
+
+def stream(budget, pieces):
+    sent = []
+    trimmer = StreamTrimmer(budget, sent.append)
+    for piece in pieces:
+        trimmer.feed(piece)
+    return sent, trimmer.finish()
+
+
+def test_stop_index_incomplete_text():
+    assert stop_index("The loop never ends", BUDGETS["explain"]) is None
+    assert stop_index("Explain\n```python\nx = 1\n", BUDGETS["explain"]) is None
+
+
+def test_stop_index_after_closing_fence():
+    text = "Explain\n```python\nx = 1\n```\nMore text"
+    assert text[:stop_index(text, BUDGETS["explain"])] == "Explain\n```python\nx = 1\n```"
+
+
+def test_stop_index_before_opening_fence_in_hint():
+    text = "Check the loop bounds.\n```python\n"
+    assert trim(text, BUDGETS["hint"]) == "Check the loop bounds."
+
+
+def test_stop_index_at_end_of_first_hint():
+    budget = BUDGETS["hint"]
+    assert trim("Use a loop.\n\nHint 2: more", budget) == "Use a loop."
+    assert trim("Use a loop.\nHint 2: more", budget) == "Use a loop."
+    assert trim("Use a loop.\n2. More", budget) == "Use a loop."
+    assert stop_index("\n\nUse a loop.", budget) is None  # Leading blank lines do not end an empty hint
+
+
+def test_stop_index_keeps_one_copy_of_a_loop():
+    text = "Start. " + "abcdefghij" * (LOOP_WINDOW // 5)
+    assert trim(text, BUDGETS["explain"]) == "Start. abcdefghij"
+
+
+def test_stream_trimmer_matches_trim():
+    text = "Explain\n```python\nx = 1\n```\nMore text"
+    sent, response = stream(BUDGETS["explain"], [text[i:i + 3] for i in range(0, len(text), 3)])
+    assert "".join(sent) == response == trim(text, BUDGETS["explain"])
+
+
+def test_stream_trimmer_holds_back_possible_fence():
+    sent = []
+    trimmer = StreamTrimmer(BUDGETS["explain"], sent.append)
+    trimmer.feed("Explain ``")
+    assert "".join(sent) == "Explain "
+    trimmer.feed("x`` here")
+    assert "".join(sent) == "Explain ``x`` here"
+
+
+def test_stream_trimmer_holds_back_possible_hint_end():
+    sent = []
+    trimmer = StreamTrimmer(BUDGETS["hint"], sent.append)
+    trimmer.feed("Check the loop.\nHi")
+    assert "".join(sent) == "Check the loop."
+    trimmer.feed("nt 2: no")
+    assert trimmer.finish() == "Check the loop."
+    assert "".join(sent) == "Check the loop."
+
+
+def test_stream_trimmer_releases_line_that_is_not_a_hint():
+    sent, response = stream(BUDGETS["hint"], ["Check the loop.", "\nHi", "s name is wrong"])
+    assert "".join(sent) == response == "Check the loop.\nHis name is wrong"
+
+
+def test_stream_trimmer_ignores_text_after_stop():
+    sent, response = stream(BUDGETS["hint"], ["Use a loop.\n\n", "Hint 2: more", " and more"])
+    assert "".join(sent) == response == "Use a loop."
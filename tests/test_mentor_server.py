@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+from mentor_server import FairScheduler, Overloaded
+
+
+class BlockingHandler:
+    """Handles requests one at a time, each until the test releases it or it is cancelled."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.handled = []
+
+    def __call__(self, request, emit, cancel):
+        self.handled.append(request["id"])
+        self.started.set()
+        while not self.release.wait(0.01):
+            if cancel.cancelled:
+                return {"id": request["id"], "ok": False, "cancelled": True, "output": ""}
+        return {"id": request["id"], "ok": True, "output": f"done {request['id']}"}
+
+
+@pytest.fixture
+def handler():
+    handler = BlockingHandler()
+    yield handler
+    handler.release.set()
+
+
+def response(ticket):
+    return ticket.frames.get(timeout=5)
+
+
+def test_rejects_requests_over_the_client_limit(handler):
+    scheduler = FairScheduler(handler, max_queue=8, max_per_client=2)
+    scheduler.submit("ci", {"id": 1, "file_path": "a.py"})
+    scheduler.submit("ci", {"id": 2, "file_path": "b.py"})
+    with pytest.raises(Overloaded) as excinfo:
+        scheduler.submit("ci", {"id": 3, "file_path": "c.py"})
+    assert excinfo.value.retry_after >= 1
+    scheduler.submit("editor", {"id": 4, "file_path": "a.py"})  # Other clients still get in
+    assert scheduler.stats()["rejected"] == 1
+    handler.release.set()
+    scheduler.close()
+
+
+def test_rejects_requests_when_the_queue_is_full(handler):
+    scheduler = FairScheduler(handler, max_queue=1, max_per_client=4)
+    scheduler.submit("ci", {"id": 1, "file_path": "a.py"})
+    handler.started.wait(5)
+    scheduler.submit("ci", {"id": 2, "file_path": "b.py"})
+    with pytest.raises(Overloaded):
+        scheduler.submit("editor", {"id": 3, "file_path": "c.py"})
+    handler.release.set()
+    scheduler.close()
+
+
+def test_newer_request_supersedes_a_waiting_one(handler):
+    scheduler = FairScheduler(handler, max_queue=8, max_per_client=2)
+    running = scheduler.submit("editor", {"id": 1, "file_path": "a.py"})
+    handler.started.wait(5)
+    waiting = scheduler.submit("editor", {"id": 2, "file_path": "b.py"})
+    newer = scheduler.submit("editor", {"id": 3, "file_path": "b.py"})
+    assert response(waiting) == {"id": 2, "ok": False, "cancelled": True, "output": ""}
+    handler.release.set()
+    assert response(running)["output"] == "done 1"
+    assert response(newer)["output"] == "done 3"
+    scheduler.close()
+    assert handler.handled == [1, 3]
+
+
+def test_superseded_running_request_frees_its_slot(handler):
+    scheduler = FairScheduler(handler, max_queue=8, max_per_client=1)
+    first = scheduler.submit("editor", {"id": 1, "file_path": "a.py"})
+    handler.started.wait(5)
+    second = scheduler.submit("editor", {"id": 2, "file_path": "a.py"})  # Not a 429 while the first winds down
+    assert response(first)["cancelled"]
+    handler.release.set()
+    assert response(second)["output"] == "done 2"
+    scheduler.close()
+
+
+def test_cancel_frees_the_slot(handler):
+    scheduler = FairScheduler(handler, max_queue=8, max_per_client=1)
+    first = scheduler.submit("editor", {"id": 1, "file_path": "a.py"})
+    handler.started.wait(5)
+    scheduler.cancel(first)
+    second = scheduler.submit("editor", {"id": 2, "file_path": "b.py"})
+    assert response(first)["cancelled"]
+    handler.release.set()
+    assert response(second)["output"] == "done 2"
+    scheduler.close()
+    assert scheduler.stats()["clients"] == {}
@@ -0,0 +1,34 @@
+from parse_cache import ParseCache
+from repair import SyntaxIssue
+
+
+def errors(code, path="buffer.py"):
+    return ParseCache().syntax_errors(path, code)
+
+
+def test_syntax_errors_clean_code():
+    assert errors("def f(x):\n    return x\n") == []
+
+
+def test_syntax_errors_broken_header_is_one_error():
+    assert errors("def f(x)\n    return x\n") == [SyntaxIssue(1, 9, "expected ':'")]
+    assert errors("if x = 1:\n    pass\nelse:\n    pass\n") == [
+        SyntaxIssue(1, 4, "invalid syntax. Maybe you meant '==' or ':=' instead of '='?")]
+
+
+def test_syntax_errors_unclosed_bracket_is_one_error():
+    code = "def f(a):\n    x = foo(a, b\n    y = 2\n    if y:\n        z = 3\n    return x\n"
+    assert errors(code) == [SyntaxIssue(2, 12, "'(' was never closed")]
+
+
+def test_syntax_errors_lists_independent_errors():
+    code = "def f(x)\n    return x\n\nvalue = 1\nprint 'done'\n"
+    assert [(error.line, error.message) for error in errors(code)] == [(1, "expected ':'"), (5, "invalid syntax")]
+
+
+def test_syntax_errors_follow_edits():
+    cache = ParseCache()
+    assert len(cache.syntax_errors("buffer.py", "a = 1\nb = (\nc = 3\n")) == 1
+    assert cache.syntax_errors("buffer.py", "a = 1\nb = ()\nc = 3\n") == []
+    assert cache.syntax_errors("buffer.py", "a = 1\nb = ()\nc = 3\nif c\n    pass\n") == [
+        SyntaxIssue(4, 5, "expected ':'")]
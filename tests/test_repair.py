@@ -0,0 +1,32 @@
+from repair import SyntaxIssue, find_errors
+
+
+def test_find_errors_clean_code():
+    assert find_errors("def f(x):\n    return x\n") == []
+
+
+def test_find_errors_reports_missing_colon_once():
+    errors = find_errors("def f(x)\n    return x\n\nprint(f(1))\n")
+    assert [(error.line, error.message) for error in errors] == [(1, "expected ':'")]
+
+
+def test_find_errors_lists_independent_errors():
+    code = "def f(x)\n    return x\n\nvalue = 1\nif value = 1:\n    pass\nprint 'done'\n"
+    errors = find_errors(code)
+    assert [error.line for error in errors] == [1, 5, 7]
+    assert errors[0] == SyntaxIssue(1, 9, "expected ':'")
+    assert "print" in errors[2].message
+
+
+def test_find_errors_unclosed_bracket_is_one_error():
+    code = "items = [1, 2\nx = 3\ny = 4\n"
+    errors = find_errors(code)
+    assert len(errors) == 1
+    assert errors[0].line == 1
+    assert "never closed" in errors[0].message
+
+
+def test_find_errors_maps_lines_back_after_repairs():
+    # Repairing the first error must not shift the lines reported for the later ones
+    code = "def f():\n    x = (1,\n    return x\n\nclass A\n    pass\n"
+    assert find_errors(code) == [SyntaxIssue(2, 9, "'(' was never closed"), SyntaxIssue(5, 8, "expected ':'")]
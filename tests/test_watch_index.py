@@ -0,0 +1,93 @@
+import os
+
+from watch_index import IgnoreRules, _translate
+
+
+def matches(pattern, path):
+    return bool(_translate(pattern).match(path))
+
+
+def test_translate_unanchored_pattern_matches_at_any_depth():
+    assert matches("*.pyc", "mod.pyc")
+    assert matches("*.pyc", "pkg/sub/mod.pyc")
+    assert not matches("*.pyc", "mod.py")
+
+
+def test_translate_star_does_not_cross_directories():
+    assert matches("docs/*.md", "docs/index.md")
+    assert not matches("docs/*.md", "docs/api/index.md")
+
+
+def test_translate_slash_anchors_to_the_rule_directory():
+    assert matches("/build", "build")
+    assert not matches("/build", "src/build")
+    assert matches("src/gen", "src/gen")
+    assert not matches("src/gen", "lib/src/gen")
+
+
+def test_translate_double_star():
+    assert matches("**/cache", "cache")
+    assert matches("**/cache", "a/b/cache")
+    assert matches("logs/**", "logs/2024/run.log")
+    assert matches("a/**/b", "a/b")
+    assert matches("a/**/b", "a/x/y/b")
+
+
+def test_translate_classes_and_escapes():
+    assert matches("file[0-9].txt", "file3.txt")
+    assert not matches("file[!0-9].txt", "file3.txt")
+    assert matches("file?.txt", "fileA.txt")
+    assert not matches("file?.txt", "file/.txt")
+    assert matches(r"\#notes", "#notes")
+    assert matches(r"\*.py", "*.py")
+    assert not matches(r"\*.py", "mod.py")
+
+
+def rules(root, *patterns, base=""):
+    ignore = IgnoreRules(root, ())
+    ignore.add(patterns, base)
+    return ignore
+
+
+def test_ignore_rules_last_match_wins(tmp_path):
+    ignore = rules(tmp_path, "*.py", "!keep.py")
+    assert ignore.ignored(tmp_path / "drop.py")
+    assert not ignore.ignored(tmp_path / "keep.py")
+
+
+def test_ignore_rules_directory_only_patterns(tmp_path):
+    ignore = rules(tmp_path, "out/")
+    assert ignore.ignored(tmp_path / "out", is_dir=True)
+    assert ignore.ignored(tmp_path / "out" / "mod.py")
+    assert not ignore.ignored(tmp_path / "out")  # A file named out
+
+
+def test_ignore_rules_cannot_reinclude_inside_ignored_directory(tmp_path):
+    ignore = rules(tmp_path, "vendor/", "!vendor/keep.py")
+    assert ignore.ignored(tmp_path / "vendor" / "keep.py")
+
+
+def test_ignore_rules_nested_ignore_file(tmp_path):
+    ignore = rules(tmp_path, "*.py")
+    ignore.add(["!gen.py", "/local.py"], "pkg")
+    assert ignore.ignored(tmp_path / "gen.py")
+    assert not ignore.ignored(tmp_path / "pkg" / "gen.py")
+    assert ignore.ignored(tmp_path / "pkg" / "local.py")
+
+
+def test_ignore_rules_add_resets_directory_memo(tmp_path):
+    ignore = rules(tmp_path)
+    assert not ignore.ignored(tmp_path / "tmp" / "mod.py")
+    ignore.add(["tmp/"])
+    assert ignore.ignored(tmp_path / "tmp" / "mod.py")
+
+
+def test_ignore_rules_load_and_defaults(tmp_path):
+    (tmp_path / ".gitignore").write_text("# generated\nsecret.py\n", encoding="utf-8")
+    ignore = IgnoreRules(tmp_path)
+    ignore.load(tmp_path)
+    assert ignore.ignored(tmp_path / "secret.py")
+    assert ignore.ignored(tmp_path / "node_modules" / "x" / "mod.py")
+    assert not ignore.ignored(tmp_path / "main.py")
+    assert not ignore.ignored(tmp_path)
+    assert ignore.ignored(os.path.dirname(tmp_path))  # Outside the tree
@@ -0,0 +1,428 @@
+"""Ignore rules, watch scheduling and a persistent file index for the watchers.
+
+A recursive watch on a checkout also watches ``.git``, virtualenvs and
+``node_modules``, which are often most of its directories and events, and a
+watcher that keeps no state misses every edit made while it was not running.
+:class:`WatchedTree` fixes both for one directory tree:
+
+* gitignore-style rules (built-in defaults, ``.gitignore`` and
+  ``.codementorignore`` files at any depth, and extra patterns) are applied
+  when the watches are scheduled and again when events arrive. Subtrees with
+  nothing ignored get one recursive watch; only the directories on the way to
+  an ignored one are watched individually.
+* A SQLite index stores each Python file's mtime, size, content hash and last
+  results. At startup a stat-based reconcile finds the files that changed
+  while the watcher was down; the content hash is only read when the stat
+  differs but the size does not. The first run records a baseline without
+  analyzing anything.
+"""
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from watchdog.events import (DirCreatedEvent, DirMovedEvent, FileCreatedEvent, FileDeletedEvent, FileModifiedEvent,
+                             FileMovedEvent)
+
+from mentor_cache import cache_root
+
+DEFAULT_IGNORES = (".git/", ".hg/", ".svn/", "__pycache__/", "node_modules/", ".venv/", "venv/", ".env/",
+                   ".tox/", ".nox/", ".mypy_cache/", ".pytest_cache/", ".ruff_cache/", ".eggs/", "*.egg-info/",
+                   "site-packages/", "build/", "dist/")
+IGNORE_FILES = (".gitignore", ".codementorignore")
+# Editors save by writing in place or by moving a temporary file over the original; opens and closes are not needed
+WATCHED_EVENTS = [FileModifiedEvent, FileCreatedEvent, FileMovedEvent, FileDeletedEvent, DirCreatedEvent,
+                  DirMovedEvent]
+
+
+class Rule(NamedTuple):
+    base: str  # Directory of the ignore file, relative to the root; "" for the root
+    pattern: re.Pattern
+    negate: bool
+    dir_only: bool
+
+
+class FileState(NamedTuple):
+    mtime_ns: int
+    size: int
+    digest: Optional[str]  # None if the content was not read
+
+
+def _translate(pattern):
+    """Regex for one gitignore glob, matched against a path relative to the rule's directory."""
+    anchored = "/" in pattern.rstrip("/")
+    pattern = pattern.lstrip("/")
+    parts = []
+    index = 0
+    while index < len(pattern):
+        if pattern.startswith("**/", index):
+            parts.append("(?:.*/)?")
+            index += 3
+        elif pattern.startswith("**", index):
+            parts.append(".*")
+            index += 2
+        elif pattern[index] == "*":
+            parts.append("[^/]*")
+            index += 1
+        elif pattern[index] == "?":
+            parts.append("[^/]")
+            index += 1
+        elif pattern[index] == "[" and "]" in pattern[index + 1:]:
+            end = pattern.index("]", index + 2 if pattern[index + 1:index + 2] in ("!", "]") else index + 1)
+            parts.append(fnmatch.translate(pattern[index:end + 1])[4:-3])
+            index = end + 1
+        elif pattern[index] == "\\" and index + 1 < len(pattern):
+            parts.append(re.escape(pattern[index + 1]))
+            index += 2
+        else:
+            parts.append(re.escape(pattern[index]))
+            index += 1
+    prefix = "" if anchored else "(?:.*/)?"
+    return re.compile(f"^{prefix}{''.join(parts)}$", re.DOTALL)
+
+
+def parse_rules(lines, base=""):
+    """:class:`Rule` objects for the lines of an ignore file in ``base``."""
+    rules = []
+    for line in lines:
+        line = line.rstrip("\n").rstrip("\r")
+        if not line.endswith("\\ "):
+            line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate or line.startswith("\\!") or line.startswith("\\#"):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        rules.append(Rule(base, _translate(line.rstrip("/")), negate, dir_only))
+    return rules
+
+
+class IgnoreRules:
+    """gitignore semantics: the last matching rule wins, deeper ignore files win over shallower ones,
+    and nothing inside an ignored directory can be re-included."""
+
+    def __init__(self, root, patterns=DEFAULT_IGNORES):
+        self.root = os.path.abspath(root)
+        self.rules = parse_rules(patterns)
+        self._directories = {}  # Relative directory -> ignored, for event-time checks
+        self._lock = threading.Lock()  # Guards rules and _directories; event threads check paths concurrently
+
+    def add(self, patterns, base=""):
+        with self._lock:
+            self.rules = self.rules + parse_rules(patterns, base)
+            self._directories = {}
+
+    def load(self, directory):
+        """Add the rules of the ignore files in ``directory``, if there are any."""
+        base = self.relative(directory)
+        for name in IGNORE_FILES:
+            try:
+                with open(os.path.join(directory, name), "r", encoding="utf-8", errors="replace") as f:
+                    self.add(f.readlines(), "" if base == "." else base)
+            except OSError:
+                pass
+
+    def relative(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, "/")
+
+    def _matches(self, relative, is_dir):
+        ignored = False
+        for rule in self.rules:
+            if rule.dir_only and not is_dir:
+                continue
+            if rule.base:
+                if not relative.startswith(rule.base + "/"):
+                    continue
+                subject = relative[len(rule.base) + 1:]
+            else:
+                subject = relative
+            if rule.pattern.match(subject):
+                ignored = not rule.negate
+        return ignored
+
+    def _directory_ignored(self, relative):
+        ignored = self._directories.get(relative)
+        if ignored is None:
+            parent = relative.rpartition("/")[0]
+            ignored = (bool(parent) and self._directory_ignored(parent)) or self._matches(relative, True)
+            self._directories[relative] = ignored
+        return ignored
+
+    def ignored(self, path, is_dir=False):
+        relative = self.relative(path)
+        if relative == ".":
+            return False
+        if relative == ".." or relative.startswith("../"):
+            return True  # Outside the tree
+        parent = relative.rpartition("/")[0]
+        with self._lock:
+            if parent and self._directory_ignored(parent):
+                return True
+            return self._directory_ignored(relative) if is_dir else self._matches(relative, False)
+
+
+def file_state(path, digest=True):
+    """:class:`FileState` of ``path``; the content is hashed only if ``digest``."""
+    stat = os.stat(path)
+    content_hash = None
+    if digest:
+        with open(path, "rb") as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
+    return FileState(stat.st_mtime_ns, stat.st_size, content_hash)
+
+
+def default_index_path(root):
+    digest = hashlib.sha256(os.path.abspath(root).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_root(), "watch", f"{digest}.sqlite3")
+
+
+class FileIndex:
+    """SQLite table of path, mtime, size, content hash and last results, shared by the worker threads."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime_ns INTEGER, "
+                             "size INTEGER, digest TEXT, result TEXT, checked REAL)")
+
+    def get(self, path):
+        """``(FileState, result)`` recorded for ``path``, or ``None``."""
+        with self._lock:
+            row = self._db.execute("SELECT mtime_ns, size, digest, result FROM files WHERE path = ?",
+                                   (path,)).fetchone()
+        if row is None:
+            return None
+        return FileState(*row[:3]), json.loads(row[3]) if row[3] else None
+
+    def all_states(self):
+        with self._lock:
+            rows = self._db.execute("SELECT path, mtime_ns, size, digest FROM files").fetchall()
+        return {row[0]: FileState(*row[1:]) for row in rows}
+
+    def put(self, path, state, result=None):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                             (path, state.mtime_ns, state.size, state.digest,
+                              json.dumps(result) if result is not None else None, time.time()))
+
+    def put_many(self, states):
+        """Record ``{path: FileState}`` in one transaction, keeping stored results."""
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("INSERT INTO files (path, mtime_ns, size, digest) VALUES (?, ?, ?, ?) "
+                                 "ON CONFLICT(path) DO UPDATE SET mtime_ns = excluded.mtime_ns, "
+                                 "size = excluded.size, digest = excluded.digest",
+                                 [(path, *state) for path, state in states.items()])
+            self._db.execute("COMMIT")
+
+    def remove(self, paths):
+        with self._lock:
+            self._db.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in paths])
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class WatchedTree:
+    """The ignore rules, index and observer watches of one directory tree.
+
+    ``scan`` walks the tree once, skipping ignored directories; ``schedule``
+    and ``reconcile`` use that walk. Event handlers call ``ignored`` and
+    ``needs_check`` before doing any work, and ``record`` afterwards.
+    """
+
+    def __init__(self, root, recursive=True, ignores=(), index_path=None):
+        self.root = os.path.abspath(root)
+        self.recursive = recursive
+        self.rules = IgnoreRules(self.root)
+        self.rules.load(self.root)
+        if ignores:
+            self.rules.add(ignores)
+        self.index = FileIndex(index_path or default_index_path(self.root)) if index_path != "" else None
+        self.files = {}  # Python file -> FileState (stat only) from the last scan
+        self.clean = set()  # Directories with nothing ignored anywhere below them
+        self.partial = set()  # Directories with an ignored directory somewhere below them
+        self._observer = self._handler = self._event_filter = None
+
+    def ignored(self, path, is_dir=False):
+        return self.rules.ignored(path, is_dir)
+
+    def scan(self):
+        """Walk the tree, loading nested ignore files; returns the number of directories visited."""
+        self.files = {}
+        self.clean = set()
+        self.partial = set()
+        visited = []
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            visited.append(directory)
+            if directory != self.root:
+                self.rules.load(directory)
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not self.recursive:
+                            continue
+                        if self.rules.ignored(entry.path, is_dir=True):
+                            self.partial.add(directory)
+                        else:
+                            stack.append(entry.path)
+                    elif entry.name.endswith(".py") and entry.is_file() and not self.rules.ignored(entry.path):
+                        stat = entry.stat()
+                        self.files[entry.path] = FileState(stat.st_mtime_ns, stat.st_size, None)
+                except OSError:
+                    continue
+        for directory in list(self.partial):
+            while directory != self.root:
+                directory = os.path.dirname(directory)
+                self.partial.add(directory)
+        self.clean = {directory for directory in visited if directory not in self.partial}
+        return len(visited)
+
+    def watch_plan(self):
+        """``[(directory, recursive)]``: one recursive watch per topmost clean directory, and a
+        non-recursive one for each directory on the way to an ignored one."""
+        if not self.recursive:
+            return [(self.root, False)]
+        plan = [(directory, False) for directory in sorted(self.partial)]
+        plan += [(directory, True) for directory in sorted(self.clean)
+                 if directory == self.root or os.path.dirname(directory) in self.partial]
+        return plan
+
+    def schedule(self, observer, handler, event_filter=None):
+        """Schedule ``handler`` on ``observer`` following :meth:`watch_plan`; returns the number of watches."""
+        self._observer, self._handler, self._event_filter = observer, handler, event_filter
+        plan = self.watch_plan()
+        for directory, recursive in plan:
+            observer.schedule(handler, directory, recursive=recursive, event_filter=event_filter)
+        return len(plan)
+
+    def directory_created(self, path):
+        """Watch a new directory created (or moved) directly inside an individually watched one."""
+        if self._observer is None or os.path.dirname(path) not in self.partial or self.ignored(path, is_dir=True):
+            return
+        self.rules.load(path)
+        self._observer.schedule(self._handler, path, recursive=True, event_filter=self._event_filter)
+
+    def start(self, observer, handler, event_filter=WATCHED_EVENTS):
+        """Scan, schedule ``handler`` and start ``observer``, then reconcile; returns ``(changed paths, stats)``.
+
+        The reconcile runs after the observer has started, so an edit made
+        meanwhile is seen by one or the other.
+        """
+        started = time.perf_counter()
+        directories = self.scan()
+        watches = self.schedule(observer, handler, event_filter)
+        observer.start()
+        changed, stats = self.reconcile()
+        stats.update(directories=directories, watches=watches, seconds=time.perf_counter() - started)
+        return changed, stats
+
+    def python_file(self, event):
+        """The Python file ``event`` wrote or moved into place, or ``None`` if there is nothing to check.
+
+        Also forgets deleted and moved-away files and watches new directories.
+        """
+        if event.is_directory:
+            if event.event_type in ("created", "moved"):
+                self.directory_created(getattr(event, "dest_path", "") or event.src_path)
+            return None
+        if event.event_type in ("deleted", "moved") and event.src_path.endswith(".py"):
+            self.forget(event.src_path)
+        path = event.dest_path if event.event_type == "moved" else event.src_path
+        if event.event_type not in ("modified", "created", "moved") or not path.endswith(".py") or self.ignored(path):
+            return None
+        return path
+
+    def reconcile(self):
+        """Compare the last scan with the index; returns ``(changed paths, stats)``.
+
+        A file whose mtime or size differs from the index is hashed, and only
+        counts as changed if its content differs too. Files gone from the tree
+        are removed from the index. With an empty index nothing is reported
+        as changed; the scan is recorded as the baseline.
+        """
+        if self.index is None:
+            return [], {"files": len(self.files), "changed": None, "removed": 0, "hashed": 0, "baseline": False}
+        known = self.index.all_states()
+        baseline = not known
+        changed = []
+        updates = {}
+        hashed = 0
+        for path, state in self.files.items():
+            previous = known.get(path)
+            if previous is not None and (previous.mtime_ns, previous.size) == (state.mtime_ns, state.size):
+                continue
+            if previous is not None and previous.digest and previous.size == state.size:
+                try:
+                    state = file_state(path)
+                except OSError:
+                    continue
+                hashed += 1
+                if state.digest == previous.digest:
+                    updates[path] = state  # Touched, not changed
+                    continue
+            if baseline:
+                updates[path] = state
+            else:
+                changed.append(path)
+        removed = [path for path in known if path not in self.files]
+        if updates:
+            self.index.put_many(updates)
+        if removed:
+            self.index.remove(removed)
+        return sorted(changed), {"files": len(self.files), "changed": len(changed), "removed": len(removed),
+                                 "hashed": hashed, "baseline": baseline}
+
+    def needs_check(self, path):
+        """``(FileState, changed)``: the current state of ``path``, and whether it differs from the
+        last version whose results were recorded. ``(None, True)`` without an index."""
+        if self.index is None:
+            return None, True
+        try:
+            state = file_state(path)
+        except OSError:
+            return None, True
+        recorded = self.index.get(path)
+        return state, recorded is None or recorded[0].digest != state.digest or recorded[1] is None
+
+    def record(self, path, state, result):
+        """Store ``result`` for the version of ``path`` described by ``state``."""
+        if self.index is not None and state is not None:
+            self.index.put(path, state, result)
+
+    @staticmethod
+    def describe(stats):
+        """One line about a :meth:`start`."""
+        if stats["changed"] is None:
+            since = "no index"
+        elif stats["baseline"]:
+            since = "index created"
+        else:
+            since = f"{stats['changed']} changed and {stats['removed']} removed since the last run"
+        return (f"{stats['files']} Python files in {stats['directories']} directories, {stats['watches']} watches, "
+                f"{since} ({stats['seconds']:.2f} s)")
+
+    def forget(self, path):
+        if self.index is not None:
+            self.index.remove([path])
+
+    def close(self):
+        if self.index is not None:
+            self.index.close()
@@ -0,0 +1,102 @@
+"""Per-path, latest-wins work queue for the file watchers.
+
+The watchdog observer thread only calls :meth:`CoalescingQueue.submit`, which
+never blocks. Each key (a file path) holds at most one pending job: a new
+event replaces the pending one and pushes its start time back, so a burst of
+saves is analyzed once, ``debounce`` seconds after the last save (trailing
+edge). Worker threads run the jobs; a key is never processed by two workers
+at once, and a job can check :attr:`Job.stale` to stop early or drop its
+result when a newer version of the file has been queued in the meantime.
+"""
+import sys
+import threading
+import time
+import traceback
+
+
+class Job:
+    """One unit of work: the latest event seen for ``key`` when it was started."""
+
+    def __init__(self, queue, key, version, payload):
+        self.queue = queue
+        self.key = key
+        self.version = version
+        self.payload = payload
+
+    @property
+    def stale(self):
+        """True once a newer event for the same key has been submitted."""
+        return self.queue.is_stale(self.key, self.version)
+
+
+class CoalescingQueue:
+    """Runs ``handle(job)`` on ``workers`` threads for the latest event of each key."""
+
+    def __init__(self, handle, debounce=1.0, workers=1, name="work-queue"):
+        self.handle = handle
+        self.debounce = debounce
+        self._cond = threading.Condition()
+        self._pending = {}  # key -> (due, version, payload)
+        self._versions = {}  # key -> latest submitted version
+        self._active = set()
+        self._closed = False
+        self._threads = [threading.Thread(target=self._run, name=f"{name}-{index}", daemon=True)
+                         for index in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key, payload=None):
+        """Queue (or replace) the job for ``key``; returns its version."""
+        with self._cond:
+            if self._closed:
+                return None
+            version = self._versions.get(key, 0) + 1
+            self._versions[key] = version
+            self._pending[key] = (time.monotonic() + self.debounce, version, payload)
+            self._cond.notify()
+            return version
+
+    def is_stale(self, key, version):
+        with self._cond:
+            return self._versions.get(key) != version
+
+    def _take(self):
+        """Block until a job is due and its key is idle; ``None`` once closed."""
+        with self._cond:
+            while not self._closed:
+                ready = [(due, key) for key, (due, _, _) in self._pending.items() if key not in self._active]
+                if not ready:
+                    self._cond.wait()
+                    continue
+                due, key = min(ready)
+                remaining = due - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                _, version, payload = self._pending.pop(key)
+                self._active.add(key)
+                return Job(self, key, version, payload)
+            return None
+
+    def _run(self):
+        while True:
+            job = self._take()
+            if job is None:
+                return
+            try:
+                self.handle(job)
+            except Exception:
+                traceback.print_exc(file=sys.stderr)  # Keep the worker alive for the next job
+            finally:
+                with self._cond:
+                    self._active.discard(job.key)
+                    self._cond.notify_all()
+
+    def close(self):
+        """Stop the workers; pending jobs that have not started are dropped."""
+        with self._cond:
+            self._closed = True
+            self._pending.clear()
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()